@@ -0,0 +1,292 @@
+"""
+A streaming version of the pipeline that matches, downloads and scores albums
+at the same time, rather than downloading every album before scoring any.
+
+Each show flows through a chain of stages connected by bounded queues:
+
+    match -> fetch lyrics -> score -> write
+
+Matching a show to its Genius album, listing the album's tracks and
+downloading each song's lyrics (which also tokenizes them) are network calls,
+so they run in threads while the event loop moves other albums along.
+Scoring runs in a thread too, so the CPU works on one album while the next is
+still downloading. Each scored show is appended to the musical scores file as
+soon as every show before it is done, so the file is in the same order as the
+summed data.
+
+Every queue holds at most QUEUE_SIZE items, so when a later stage falls
+behind the earlier stages wait for it (backpressure), and only a bounded
+number of albums are ever held in memory.
+
+The network functions can be passed in, so the pipeline can be run against
+fakes, a recorded session or another lyrics source.
+"""
+
+import asyncio
+import csv
+import os
+import genius_lyrics as lyrics
+import instrumentation
+import lyric_metrics
+
+
+SUMMED_FILE = "summed_broadway_data.csv"
+MUSICAL_SCORES_FILE = "musical_scores.csv"
+
+# The most items waiting in each queue between two stages.
+QUEUE_SIZE = 4
+
+# The number of workers in each stage, and the most song lyrics downloaded at
+# the same time across every album.
+MATCH_WORKERS = 4
+FETCH_WORKERS = 4
+SCORE_WORKERS = 2
+SONG_FETCH_LIMIT = 8
+
+# Put on a queue once the stage before it has finished.
+_DONE = object()
+
+# Passed along in place of a show that has no matching album, so the writer
+# knows not to wait for it.
+_SKIPPED = object()
+
+
+async def _run_stage(handle, in_queue, out_queue, num_workers):
+    """
+    Run a stage's workers until the stage before it is done, then tell the
+    stage after it that this stage is done too.
+
+    Args:
+        handle: coroutine function that is given each item from in_queue and
+            returns the item to put on out_queue, or None to drop it.
+        in_queue: asyncio Queue of items to handle.
+        out_queue: asyncio Queue to put each handled item on.
+        num_workers: integer number of items handled at the same time.
+    """
+
+    async def worker():
+        while True:
+            item = await in_queue.get()
+            if item is _DONE:
+                # the marker is put back so every other worker sees it too
+                await in_queue.put(_DONE)
+                return
+            result = await handle(item)
+            if result is not None:
+                await out_queue.put(result)
+
+    await asyncio.gather(*(worker() for _ in range(num_workers)))
+    await out_queue.put(_DONE)
+
+
+async def _stream_scores(
+    all_shows,
+    musical_scores_file,
+    fieldnames,
+    find_album,
+    get_album_tracks,
+    download_song_lyrics,
+    window_size,
+):
+    """
+    Run every stage of the pipeline over a list of shows. fieldnames is the
+    list of columns of musical_scores_file, and the other arguments are
+    described in run_async_pipeline.
+
+    Each item carries the show's position in all_shows, so the shows can be
+    written in their original order however the stages finish.
+
+    Returns:
+        Integer number of shows written to musical_scores_file.
+    """
+    match_queue = asyncio.Queue(QUEUE_SIZE)
+    fetch_queue = asyncio.Queue(QUEUE_SIZE)
+    score_queue = asyncio.Queue(QUEUE_SIZE)
+    write_queue = asyncio.Queue(QUEUE_SIZE)
+    song_limit = asyncio.Semaphore(SONG_FETCH_LIMIT)
+
+    # albums matched to more than one show are only downloaded once
+    album_downloads = {}
+
+    async def feed():
+        for (index, show) in enumerate(all_shows):
+            await match_queue.put((index, show))
+        await match_queue.put(_DONE)
+
+    async def match(item):
+        (index, show) = item
+        (album_id, album_title) = await asyncio.to_thread(
+            find_album, show["ShowName"]
+        )
+        # shows without a matching album are left out, as in
+        # compile_data.find_corresponding_album
+        if str(album_id) == "-1":
+            return (index, _SKIPPED)
+        return (
+            index,
+            {**show, "GeniusID": album_id, "AlbumTitle": album_title},
+        )
+
+    async def download_song(song_id):
+        async with song_limit:
+            return await asyncio.to_thread(download_song_lyrics, song_id)
+
+    async def download_album(album_id):
+        all_tracks = await asyncio.to_thread(get_album_tracks, album_id)
+        song_ids = [
+            track["song"]["id"]
+            for track in all_tracks
+            if not track["song"]["instrumental"]
+            and track["song"]["lyrics_state"] != "incomplete"
+        ]
+        album_lyrics = await asyncio.gather(
+            *(download_song(song_id) for song_id in song_ids)
+        )
+
+        # the lyrics are saved so later runs do not download them again,
+        # off the event loop so other albums keep moving while they are
+        # written
+        await asyncio.to_thread(
+            lyrics.save_album_lyrics, album_id, album_lyrics
+        )
+        return album_lyrics
+
+    async def fetch(item):
+        (index, show) = item
+        if show is _SKIPPED:
+            return (index, show, None)
+        album_id = show["GeniusID"]
+        if lyrics.find_saved_lyrics_file(album_id) is not None:
+            return (index, show, None)
+        if album_id not in album_downloads:
+            album_downloads[album_id] = asyncio.ensure_future(
+                download_album(album_id)
+            )
+        album_lyrics = await album_downloads[album_id]
+        # once the lyrics are saved, later shows read them from the file, so
+        # the downloaded lyrics do not need to be kept
+        album_downloads.pop(album_id, None)
+        return (index, show, album_lyrics)
+
+    async def score(fetched):
+        (index, show, album_lyrics) = fetched
+        if show is _SKIPPED:
+            return (index, show)
+        if album_lyrics is None:
+            # saved lyrics are streamed from their file inside the scoring
+            # thread, one song at a time
+            album_lyrics = lyrics.iter_album_songs(show["GeniusID"])
+        scores = await asyncio.to_thread(
+            lyric_metrics.calculate_album_metrics,
+            album_lyrics,
+            window_size=window_size,
+        )
+        instrumentation.count("albums.scored")
+        return (index, {**show, **scores})
+
+    async def write():
+        num_written = 0
+        # rows that finished before a show earlier in the file, by position
+        waiting_rows = {}
+        next_index = 0
+        with open(
+            musical_scores_file, "w", encoding="utf-8", newline=""
+        ) as file:
+            # the header is written up front, so the file has one even if no
+            # show is matched
+            csv_writer = csv.DictWriter(file, fieldnames=fieldnames)
+            csv_writer.writeheader()
+            while (item := await write_queue.get()) is not _DONE:
+                (index, row) = item
+                waiting_rows[index] = row
+                while next_index in waiting_rows:
+                    row = waiting_rows.pop(next_index)
+                    next_index += 1
+                    if row is _SKIPPED:
+                        continue
+                    csv_writer.writerow(row)
+                    num_written += 1
+                # each show is on disk as soon as the shows before it are
+                file.flush()
+        return num_written
+
+    results = await asyncio.gather(
+        feed(),
+        _run_stage(match, match_queue, fetch_queue, MATCH_WORKERS),
+        _run_stage(fetch, fetch_queue, score_queue, FETCH_WORKERS),
+        _run_stage(score, score_queue, write_queue, SCORE_WORKERS),
+        write(),
+    )
+    return results[-1]
+
+
+@instrumentation.timed_stage
+def run_async_pipeline(
+    summed_file=SUMMED_FILE,
+    musical_scores_file=MUSICAL_SCORES_FILE,
+    find_album=None,
+    get_album_tracks=None,
+    download_song_lyrics=None,
+    window_size=lyric_metrics.WINDOW_SIZE,
+):
+    """
+    Match, download and score every show, overlapping the network requests of
+    some albums with the scoring of others.
+
+    This does the work of compile_data's find_corresponding_album,
+    download_lyrics and find_all_uniqueness_scores in one streaming pass. The
+    scores file has the same columns and rows, in the order of the summed data.
+
+    Args:
+        summed_file: optional string specifying the file path of the summed
+            Broadway data, as written by broadway_data.sum_data.
+        musical_scores_file: optional string specifying output file path.
+        find_album: optional function that is given a show name and returns a
+            tuple of its album's Genius ID (or "-1" if there is none) and
+            title. Defaults to genius_lyrics.find_album.
+        get_album_tracks: optional function that is given an album ID and
+            returns its tracks. Defaults to genius_lyrics.get_album_tracks.
+        download_song_lyrics: optional function that is given a song ID and
+            returns a list of the words in its lyrics. Defaults to
+            genius_lyrics.download_song_lyrics.
+        window_size: optional integer number of words in each window of the
+            windowed metrics.
+    Returns:
+        Integer number of shows written to musical_scores_file.
+    Raises:
+        ValueError: if window_size is not a positive number of words.
+    """
+    lyric_metrics.check_window_size(window_size)
+    if find_album is None:
+        find_album = lyrics.find_album
+    if get_album_tracks is None:
+        get_album_tracks = lyrics.get_album_tracks
+    if download_song_lyrics is None:
+        download_song_lyrics = lyrics.download_song_lyrics
+
+    with open(summed_file, "r", encoding="utf-8") as file:
+        reader = csv.DictReader(file)
+        all_shows = list(reader)
+        fieldnames = (
+            list(reader.fieldnames or [])
+            + ["GeniusID", "AlbumTitle"]
+            + list(lyric_metrics.METRICS)
+        )
+
+    os.makedirs(lyrics.LYRICS_DIRECTORY, exist_ok=True)
+
+    return asyncio.run(
+        _stream_scores(
+            all_shows,
+            musical_scores_file,
+            fieldnames,
+            find_album,
+            get_album_tracks,
+            download_song_lyrics,
+            window_size,
+        )
+    )
+
+
+if __name__ == "__main__":
+    run_async_pipeline()
@@ -1,9 +1,12 @@
 """
 Various functions to download and process the CORGIS Broadway dataset.
+
+requests and pandas are only imported inside the functions that use them, so
+importing this module stays fast.
 """
 import io
-import requests
-import pandas as pd
+import os
+import instrumentation
 
 
 BROADWAY_DATA_URL = (
@@ -26,7 +29,21 @@ COLUMNS_TO_DROP = [
     "Statistics.Gross Potential",
 ]
 
+# The type each column of the processed data is loaded as. Show names and
+# types repeat for every week a show ran, so they are stored as categories,
+# and dates are parsed into datetimes. Integer columns are downcast to the
+# smallest type that holds their values once loaded.
+PROCESSED_COLUMN_TYPES = {
+    "Date.Full": "datetime",
+    "Show.Name": "category",
+    "Show.Type": "category",
+    "Statistics.Attendance": "integer",
+    "Statistics.Performances": "integer",
+}
+PROCESSED_DATE_FORMAT = "%m/%d/%Y"
+
 
+@instrumentation.timed_stage
 def get_broadway_data(
     data_download_url=BROADWAY_DATA_URL, filepath=PROCESSED_FILE_PATH
 ):
@@ -50,6 +67,10 @@ def get_broadway_data(
             same directory.
     """
 
+    # pylint: disable=import-outside-toplevel
+    import requests
+    import pandas as pd
+
     # Download the provided CSV files, and turn them into a pandas dataframe
     broadway_data_request = requests.get(data_download_url)
     broadway_dataframe = pd.read_csv(io.StringIO(broadway_data_request.text))
@@ -78,82 +99,167 @@ def get_broadway_data(
     broadway_musicals.to_csv(filepath, encoding="utf-8", index=False)
 
 
-def sum_data(load_filepath=PROCESSED_FILE_PATH, save_filepath=SUMMED_FILE_PATH):
+def load_processed_data(filepath=PROCESSED_FILE_PATH, columns=None):
+    """
+    Load the processed Broadway data with compact column types.
+
+    Show names and types are loaded as categories, dates are parsed into
+    datetimes and integer columns are downcast to the smallest type that holds
+    their values, which uses a fraction of the memory of loading every column
+    as strings and 64-bit integers. This is shared by every function that
+    reads the processed data.
+
+    To account for error-handling, if the broadway data with the requested
+    filename is not found, the function to download it is automatically called
+    with the given file name.
+
+    Args:
+        filepath: optional string representing the path to the processed
+            Broadway data. Defaults to processed_broadway_data.csv.
+        columns: optional list of strings naming the columns to load. Columns
+            that are not named are never read. Defaults to every column in
+            PROCESSED_COLUMN_TYPES.
+    Returns:
+        A pandas dataframe of the processed Broadway data.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    if columns is None:
+        columns = list(PROCESSED_COLUMN_TYPES)
+
+    if not os.path.exists(filepath):
+        get_broadway_data(filepath=filepath)
+
+    column_types = {
+        column: "category"
+        for column in columns
+        if PROCESSED_COLUMN_TYPES[column] == "category"
+    }
+    with open(filepath, "r", encoding="utf-8") as file:
+        processed_dataframe = pd.read_csv(
+            file, usecols=columns, dtype=column_types
+        )
+
+    # columns are put back in the order they were asked for, since usecols
+    # keeps the order of the file
+    processed_dataframe = processed_dataframe[columns]
+
+    for column in columns:
+        if PROCESSED_COLUMN_TYPES[column] == "datetime":
+            processed_dataframe[column] = pd.to_datetime(
+                processed_dataframe[column], format=PROCESSED_DATE_FORMAT
+            )
+        elif PROCESSED_COLUMN_TYPES[column] == "integer":
+            processed_dataframe[column] = pd.to_numeric(
+                processed_dataframe[column], downcast="integer"
+            )
+
+    return processed_dataframe
+
+
+def compare_memory_usage(filepath=PROCESSED_FILE_PATH):
+    """
+    Find how much memory load_processed_data saves compared with loading the
+    processed Broadway data with pandas' default types.
+
+    Args:
+        filepath: optional string representing the path to the processed
+            Broadway data. Defaults to processed_broadway_data.csv.
+    Returns:
+        Dictionary with the keys "default_bytes", "typed_bytes" and
+            "saved_bytes", each an integer number of bytes.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    typed_dataframe = load_processed_data(filepath)
+    with open(filepath, "r", encoding="utf-8") as file:
+        default_dataframe = pd.read_csv(file)
+
+    default_bytes = int(default_dataframe.memory_usage(deep=True).sum())
+    typed_bytes = int(typed_dataframe.memory_usage(deep=True).sum())
+    return {
+        "default_bytes": default_bytes,
+        "typed_bytes": typed_bytes,
+        "saved_bytes": default_bytes - typed_bytes,
+    }
+
+
+@instrumentation.timed_stage
+def calculate_summed_data(load_filepath=PROCESSED_FILE_PATH):
     """
     Previous downloaded & filtered Broadway data is loaded from the created csv
     file and the data is further processed to sum all unique musicals
     attendance, number of performances, and length of run together.
 
     Args:
-        filepath - string representing the path to the downloaded and filtered
-            broadway dataset in reference to the project folder. Defaults
-            to the default name of the processed file path.
+        load_filepath: optional string representing the path to the
+            downloaded and filtered broadway dataset in reference to the
+            project folder. Defaults to the default name of the processed file
+            path.
     Returns:
-        Nothing. A new csv file is written with summed attendance information.
+        A pandas dataframe with the columns ShowName, Attendance,
+            NumPerformances and WeeksPerformed, with one row for each musical.
     """
 
-    # Open the previously created and filtered CSV data and put it into a
-    # dataframe.
-    #
-    # To account for error-handling, if the broadway data with the requested
-    # filename is not found, the function to download it is automatically called
-    # with the given file name.
-    try:
-        with open(load_filepath, "r", encoding="utf-8") as file:
-            processed_dataframe = pd.read_csv(file)
-    except FileNotFoundError:
-        get_broadway_data(filepath=load_filepath)
-        with open(load_filepath, "r", encoding="utf-8") as file:
-            processed_dataframe = pd.read_csv(file)
-
-    # A numpy array of all unique show names is pulled from the processed data
-    # and saved to a list for easier looping.
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    processed_dataframe = load_processed_data(
+        load_filepath,
+        columns=[
+            "Show.Name",
+            "Statistics.Attendance",
+            "Statistics.Performances",
+        ],
+    )
+
+    # All weeks of each musical are summed in a single grouped pass rather
+    # than filtering the whole dataframe once per musical. The totals are kept
+    # as 64-bit integers, since the downcast weekly columns are too small to
+    # hold them.
+    grouped_performances = processed_dataframe.groupby(
+        "Show.Name", sort=False, observed=True
+    )
+    totals = grouped_performances[
+        ["Statistics.Attendance", "Statistics.Performances"]
+    ].sum()
+    totals["WeeksPerformed"] = grouped_performances.size()
+
+    # Each musical is kept in the order it first appears in the processed
+    # data, matching the order of the original summed data.
     all_musicals = processed_dataframe["Show.Name"].unique().tolist()
+    totals = totals.loc[all_musicals].astype("int64")
 
-    # Each musical is added in order of the list to a new pandas dataframe to
-    # store only the total information for each musical.
-    summed_dataframe = pd.DataFrame({"ShowName": all_musicals})
-
-    # Blank lists are created prior to the following loop to collect the total
-    # information from each musical. By looping through the list of musicals
-    # in order and adding them to each list in order, we can be assured that
-    # the correct numbers correspond to each musical when adding to the
-    # dataframe later.
-    all_musicals_attendance = []
-    all_musicals_num_performances = []
-    all_musicals_length_of_run = []
-
-    # each unique musical is looped through, where all performances of that
-    # musical are pulled out of the complete dataframe and then the total
-    # attendance and number of performances are summed together. These are added
-    # to the prior created lists in the same order as the musicals.
-    # The number of weeks the musical was on broadway is also calculated based
-    # on the number of entries.
-    for musical in all_musicals:
-        all_performances_of_musical = processed_dataframe[
-            processed_dataframe["Show.Name"] == musical
-        ]
-
-        all_performances_of_musical = all_performances_of_musical.reset_index(
-            drop=True
-        )
+    summed_dataframe = pd.DataFrame(
+        {
+            "ShowName": all_musicals,
+            "Attendance": totals["Statistics.Attendance"].tolist(),
+            "NumPerformances": totals["Statistics.Performances"].tolist(),
+            "WeeksPerformed": totals["WeeksPerformed"].tolist(),
+        }
+    )
 
-        all_musicals_length_of_run.append(all_performances_of_musical.shape[0])
+    return summed_dataframe
 
-        attendance = int(
-            all_performances_of_musical["Statistics.Attendance"].sum()
-        )
-        all_musicals_attendance.append(attendance)
 
-        num_performances = int(
-            all_performances_of_musical["Statistics.Performances"].sum()
-        )
-        all_musicals_num_performances.append(num_performances)
+@instrumentation.timed_stage
+def sum_data(load_filepath=PROCESSED_FILE_PATH, save_filepath=SUMMED_FILE_PATH):
+    """
+    Sum the performance data of every musical, as calculate_summed_data does,
+    and write it to a new csv file.
 
-    # Each list is then added as a new column of the newly created dataframe.
-    summed_dataframe["Attendance"] = all_musicals_attendance
-    summed_dataframe["NumPerformances"] = all_musicals_num_performances
-    summed_dataframe["WeeksPerformed"] = all_musicals_length_of_run
+    Args:
+        load_filepath - string representing the path to the downloaded and
+            filtered broadway dataset in reference to the project folder.
+            Defaults to the default name of the processed file path.
+        save_filepath - string representing the path to write the summed data
+            to. Defaults to summed_broadway_data.csv.
+    Returns:
+        Nothing. A new csv file is written with summed attendance information.
+    """
+    summed_dataframe = calculate_summed_data(load_filepath)
 
     # Finally, this data is again written to a separate csv file in the project
     # directory.
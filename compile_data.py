@@ -2,37 +2,65 @@
 Functions to combine broadway data obtained in broadway_data.py with musical
 lyrics in genius_lyrics. Also provides plotting capabilities based on this data.
 
+pandas and Matplotlib are slow to import, so they are only imported inside the
+functions that use them. Importing this module (for example to score lyrics
+offline) does not load either of them.
+
 """
 
-import csv
-import matplotlib.pyplot as plt
-import pandas as pd
+import argparse
+import importlib.util
+import os
+import warnings
+import broadway_data as broadway
 import genius_lyrics as lyrics
-
-
-def find_corresponding_album():
+import instrumentation
+import lyric_metrics
+import plotting
+import score_cache
+import song_memo
+import weekly_analysis
+
+
+# The CSV file each result of the pipeline is written to. The summed data and
+# the matched data are intermediate results that only the next stage needs.
+RESULT_FILES = {
+    "summed_data": broadway.SUMMED_FILE_PATH,
+    "musical_genius_data": "musical_genius_data.csv",
+    "musical_scores": "musical_scores.csv",
+    "score_dataframe": "score_dataframe.csv",
+    "run_curves": weekly_analysis.RUN_CURVES_FILE,
+}
+INTERMEDIATE_RESULTS = ["summed_data", "musical_genius_data"]
+
+# The formats results can be exported in, and the package pandas needs to
+# write each one (None if it needs no extra package).
+EXPORT_FORMATS = {"csv": None, "parquet": "pyarrow"}
+
+
+@instrumentation.timed_stage
+def match_albums(musical_data):
     """
-    Find the lyrical uniqueness of all songs in the Broadway data set.
+    Find the Genius album of every musical in a dataframe of summed Broadway
+    data.
+
+    Each unique musical's corresponding album is found on Genius. The Genius
+    album ID and album name are added to the dataframe. If a match is not able
+    to be identified for a musical, then it is removed from the dataset.
 
-    Previously calculated Broadway data is loaded, and each unique musical's
-    corresponding album is found on Genius. The Genius album ID and album name
-    are added to the dataframe. If a match is not able to be identified for a
-    musical, then it is removed from the dataset.
+    Args:
+        musical_data: pandas dataframe of summed Broadway data, as returned by
+            broadway_data.calculate_summed_data.
+    Returns:
+        A new pandas dataframe with the GeniusID and AlbumTitle columns added.
     """
     # creates empty lists to hold future data
-    list_musical_title = []
     list_musical_genius_id = []
     list_album_title = []
 
-    with open("summed_broadway_data.csv", "r", encoding="utf-8") as file:
-        musical_data = pd.read_csv(file)
-
-    # adds the show names to the list of musical titles
-    list_musical_title.extend(musical_data["ShowName"].tolist())
-
     # finds the name of the Genius album and the Genius Album ID for each of the
     # shows in the list of musical titles.
-    for musical_title in list_musical_title:
+    for musical_title in musical_data["ShowName"].tolist():
         (musical_genius_id, album_title) = lyrics.find_album(musical_title)
         # adds all Genius Album IDs to the album id list
         list_musical_genius_id.append(musical_genius_id)
@@ -40,143 +68,375 @@ def find_corresponding_album():
         list_album_title.append(album_title)
 
     # creates new columns in musical_data to hold the album titles and IDs
+    musical_data = musical_data.copy()
     musical_data["GeniusID"] = list_musical_genius_id
     musical_data["AlbumTitle"] = list_album_title
     # removes musicals from the dataset if it's Genius Album can not be found
     musical_data = musical_data[musical_data["GeniusID"] != "-1"]
-    # resets the indexes in the dataset
+    # resets the indexes in the dataset, and stores the IDs as integers (the
+    # same as they are read back from a CSV file)
     musical_data = musical_data.reset_index(drop=True)
+    musical_data["GeniusID"] = musical_data["GeniusID"].astype("int64")
+
+    return musical_data
+
+
+@instrumentation.timed_stage
+def find_corresponding_album(
+    summed_file=RESULT_FILES["summed_data"],
+    musical_genius_data=RESULT_FILES["musical_genius_data"],
+):
+    """
+    Find the Genius album of every musical in the summed Broadway data file
+    and write the matched data to a new CSV file.
+
+    Args:
+        summed_file: optional string specifying input file path.
+        musical_genius_data: optional string specifying output file path.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    with open(summed_file, "r", encoding="utf-8") as file:
+        musical_data = pd.read_csv(file)
 
     # writes the dataset to a new CSV file
-    musical_data.to_csv(
-        "musical_genius_data.csv", encoding="utf-8", index=False
+    match_albums(musical_data).to_csv(
+        musical_genius_data, encoding="utf-8", index=False
     )
 
 
-def download_lyrics():
+@instrumentation.timed_stage
+def download_album_lyrics(musical_data, memo_file=None):
+    """
+    Downloads the lyrics of every album in a dataframe and puts them each in
+    separate csv files based on show. Albums whose lyrics are already saved
+    are not downloaded again.
+
+    Args:
+        musical_data: pandas dataframe with a GeniusID column, as returned by
+            match_albums.
+        memo_file: optional string specifying the file path of a song memo,
+            so that lyrics identical to a song seen before are not split into
+            words again. If None, no memo is kept.
+    """
+    # downloads all lyrics from a show to a CSV file
+    # repeats this for every show with a Genius ID
+    with song_memo.open_memo(memo_file) as memo:
+        for album_id in musical_data["GeniusID"]:
+            if lyrics.find_saved_lyrics_file(album_id) is None:
+                lyrics.write_lyrics_to_file(album_id, memo)
+
+
+@instrumentation.timed_stage
+def download_lyrics(
+    musical_genius_data=RESULT_FILES["musical_genius_data"], memo_file=None
+):
     """
     Downloads all lyrics from every listed musical and puts them each in
     separate csv files based on show.
+
+    Args:
+        musical_genius_data: optional string specifying input file path.
+        memo_file: optional string specifying the file path of a song memo.
+            If None, no memo is kept.
     """
-    with open("musical_genius_data.csv", "r", encoding="utf-8") as file:
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    with open(musical_genius_data, "r", encoding="utf-8") as file:
         musical_data = pd.read_csv(file)
 
-    # album_ids will hold the album's Genius ID
-    album_ids = musical_data["GeniusID"]
+    download_album_lyrics(musical_data, memo_file)
 
-    # downloads all lyrics from a show to a CSV file
-    # repeats this for every show with a Genius ID
-    for album_id in album_ids:
-        lyrics.get_all_lyrics(album_id)
 
+def get_score_signature(
+    window_size=lyric_metrics.WINDOW_SIZE, exclude_duplicates=False
+):
+    """
+    Describe how albums are scored, so that scores calculated any other way
+    (with different metrics, different metric code or a different window size)
+    are not mixed with them.
+
+    Args:
+        window_size: optional integer number of words in each window of the
+            windowed uniqueness score.
+        exclude_duplicates: optional boolean, True if near-duplicate songs are
+            left out when scoring each album.
+    Returns:
+        List of strings naming every registered metric, followed by a
+            fingerprint of the metrics' code and the scoring options.
+    """
+    score_columns = list(lyric_metrics.METRICS)
+    return score_columns + [
+        f"metrics_code={song_memo.fingerprint_metrics(score_columns)}",
+        f"window_size={window_size}",
+        f"exclude_duplicates={exclude_duplicates}",
+    ]
+
+
+@instrumentation.timed_stage
+def score_albums(
+    musical_data,
+    cache_file=score_cache.SCORE_CACHE_FILE,
+    window_size=lyric_metrics.WINDOW_SIZE,
+    exclude_duplicates=False,
+    memo_file=None,
+):
+    """
+    Calculates the uniqueness score, total lyric count and every other metric
+    registered in lyric_metrics for every musical in a dataframe.
+
+    The fingerprint and scores of each album's lyrics file are kept in a cache,
+    so albums whose lyrics have not changed since the last run are not
+    rescored.
 
+    Args:
+        musical_data: pandas dataframe with a GeniusID column, as returned by
+            match_albums.
+        cache_file: optional string specifying the score cache file path. If
+            None, every album is rescored and no cache is kept.
+        window_size: optional integer number of words in each window of the
+            windowed uniqueness score.
+        exclude_duplicates: optional boolean, True to leave out songs that are
+            near-duplicates of an earlier song on the same album (such as
+            reprises) when scoring each album.
+        memo_file: optional string specifying the file path of a song memo, so
+            that a song identical to one already scored (on any album) is not
+            scored again. If None, no memo is kept.
+    Returns:
+        A new pandas dataframe with a column added for every metric.
+    Raises:
+        ValueError: if window_size is not a positive number of words.
+    """
+    # checked before any album is scored, rather than on the first album
+    # that is not already cached
+    lyric_metrics.check_window_size(window_size)
+    cache = {} if cache_file is None else score_cache.load_cache(cache_file)
+
+    # cached scores are only reused if they were calculated by the same code
+    # for the metrics that are currently registered, with the same window size
+    score_columns = list(lyric_metrics.METRICS)
+    signature = get_score_signature(window_size, exclude_duplicates)
+
+    # dictionary of empty lists that will hold each musical's value for every
+    # metric
+    all_scores = {column: [] for column in score_columns}
+
+    # calculates every metric for each show and then adds them to the lists
+    with song_memo.open_memo(memo_file) as memo:
+        for album_id in musical_data["GeniusID"]:
+            scores = None
+            file_path = lyrics.find_saved_lyrics_file(album_id)
+
+            # albums whose lyrics file matches the cached fingerprint reuse
+            # their cached scores instead of being rescored
+            if file_path is not None:
+                fingerprint = score_cache.fingerprint_file(
+                    file_path,
+                    score_cache.get_previous_fingerprint(cache, album_id),
+                )
+                scores = score_cache.get_cached_scores(
+                    cache, album_id, fingerprint, signature
+                )
+
+            if scores is None:
+                instrumentation.count("albums.scored")
+                # streams (downloading first if needed) the album's lyrics one
+                # song at a time and calculates every metric from them in one
+                # pass
+                album_songs = lyrics.iter_album_songs(album_id)
+                if exclude_duplicates:
+                    # pylint: disable=import-outside-toplevel
+                    import near_duplicates
+
+                    album_songs = near_duplicates.iter_unique_songs(album_songs)
+                scores = lyric_metrics.calculate_album_metrics(
+                    album_songs, window_size=window_size, memo=memo
+                )
+                score_cache.store_scores(
+                    cache,
+                    album_id,
+                    score_cache.fingerprint_file(
+                        lyrics.find_saved_lyrics_file(album_id)
+                    ),
+                    signature,
+                    scores,
+                )
+            else:
+                instrumentation.count("albums.cached")
+
+            for column in score_columns:
+                all_scores[column].append(scores[column])
+
+    if cache_file is not None:
+        score_cache.save_cache(cache, cache_file)
+
+    # makes a new column in the dataframe to store each metric
+    musical_scores = musical_data.copy()
+    for column in score_columns:
+        musical_scores[column] = all_scores[column]
+
+    return musical_scores
+
+
+@instrumentation.timed_stage
 def find_all_uniqueness_scores(
-    musical_genius_data="musical_genius_data.csv",
-    musical_scores_file="musical_scores.csv",
+    musical_genius_data=RESULT_FILES["musical_genius_data"],
+    musical_scores_file=RESULT_FILES["musical_scores"],
+    cache_file=score_cache.SCORE_CACHE_FILE,
+    window_size=lyric_metrics.WINDOW_SIZE,
+    exclude_duplicates=False,
+    memo_file=None,
 ):
     """
-    Calculates the uniqueness score and total lyric count for every musical and
-    writes this data as well as the previous data to a new CSV file.
+    Calculates the uniqueness score, total lyric count and every other metric
+    registered in lyric_metrics for every musical and writes this data as well
+    as the previous data to a new CSV file. The scores are calculated by
+    score_albums.
 
     Args:
         musical_genius_data: optional string specifying input file path
         musical_scores_file: optional string specifying output file path
+        cache_file: optional string specifying the score cache file path. If
+            None, every album is rescored and no cache is kept.
+        window_size: optional integer number of words in each window of the
+            windowed uniqueness score.
+        exclude_duplicates: optional boolean, True to leave out songs that are
+            near-duplicates of an earlier song on the same album (such as
+            reprises) when scoring each album.
+        memo_file: optional string specifying the file path of a song memo.
+            If None, no memo is kept.
     """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
     with open(musical_genius_data, "r", encoding="utf-8") as file:
-        musical_scores = pd.read_csv(file)
-    # album_ids will hold the album's Genius ID
-    album_ids = musical_scores["GeniusID"]
-
-    # empty lists that will hold each musical's uniqueness score and total lyric
-    # count respectively
-    uniqueness_scores = []
-    lyric_totals = []
-
-    # calculates uniqueness score and total lyric count for each show and then
-    # adds them to the lists
-    for album_id in album_ids:
-        with open(f"lyrics/{album_id}.csv", "r", encoding="utf-8") as read_obj:
-            csv_reader = csv.reader(read_obj)
-            # convert string to list
-            all_lyrics = list(csv_reader)
-
-        score = lyrics.calculate_album_uniqueness(all_lyrics)
-        uniqueness_scores.append(score)
-
-        total_lyrics = lyrics.calculate_total_lyrics(
-            lyrics.get_all_lyrics(album_id)
-        )
-        lyric_totals.append(total_lyrics)
+        musical_data = pd.read_csv(file)
 
-    # makes new columns in the CSV file to store the uniqueness scores and total
-    # lyric count
-    musical_scores["UniquenessScore"] = uniqueness_scores
-    musical_scores["TotalLyricCount"] = lyric_totals
+    musical_scores = score_albums(
+        musical_data, cache_file, window_size, exclude_duplicates, memo_file
+    )
 
     # writes the new data to a new CSV file
     musical_scores.to_csv(musical_scores_file, encoding="utf-8", index=False)
 
 
-def avg_scores_data(
-    musical_scores_file="musical_scores.csv",
-    score_dataframe_file="score_dataframe.csv",
+@instrumentation.timed_stage
+def average_scores(
+    musical_scores,
+    aggregate_key=RESULT_FILES["score_dataframe"],
+    aggregate_cache_file=score_cache.AGGREGATE_CACHE_FILE,
 ):
     """
     Calculates the average attendance, number of weeks on broadway, and total
-    number of performances for each lyrical uniqueness score and stores this
-    data in a new CSV file titled score_dataframe.csv.
+    number of performances for each lyrical uniqueness score.
+
+    Rather than recomputing every average, the running sums and counts behind
+    them are kept in a cache and only adjusted for shows that changed since
+    the last run.
 
     Args:
-        musical_scores_file: optional string specifying input file path.
-        scores_dataframe_file: optional string specifying output file path.
+        musical_scores: pandas dataframe of musical scores, as returned by
+            score_albums.
+        aggregate_key: optional string naming the running sums in the cache,
+            normally the file path the averages are written to.
+        aggregate_cache_file: optional string specifying the file path of the
+            cached running sums. If None, the averages are computed from
+            scratch and no cache is kept.
+    Returns:
+        A pandas dataframe with the columns UniquenessScore, Attendance,
+            WeeksPerformed and NumPerformances.
     """
-    with open(musical_scores_file, "r", encoding="utf-8") as file:
-        musical_scores = pd.read_csv(file)
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
 
     # A numpy array of all unique uniqueness scores are pulled from
-    # musical_scores.csv and saved to a list for easier looping.
+    # the musical scores and saved to a list for easier looping.
     all_scores = musical_scores["UniquenessScore"].unique().tolist()
 
     # Each score is added in order of the list to a new pandas dataframe to
     # store only the total information for each score.
     score_dataframe = pd.DataFrame({"UniquenessScore": all_scores})
 
-    # Blank lists are created prior to the following loop to collect the total
-    # information for each score. By looping through the list of scores
-    # in order and adding them to each list in order, we can be assured that
-    # the correct numbers correspond to each score when adding to the
-    # dataframe later.
+    # The running sums are stored for each output file, since different score
+    # files (such as the testing data) average different sets of shows.
+    if aggregate_cache_file is None:
+        aggregates = {}
+    else:
+        aggregates = score_cache.load_cache(aggregate_cache_file)
+    state = aggregates.setdefault(aggregate_key, {})
+
+    # Each show's contribution is keyed by its name. A show name that appears
+    # more than once gets a numbered key so that each row is still counted.
+    rows = {}
+    for (show_name, *values) in zip(
+        musical_scores["ShowName"].tolist(),
+        musical_scores["UniquenessScore"].tolist(),
+        musical_scores["Attendance"].tolist(),
+        musical_scores["WeeksPerformed"].tolist(),
+        musical_scores["NumPerformances"].tolist(),
+    ):
+        key = show_name
+        while key in rows:
+            key = f"{key}#"
+        rows[key] = values
+    score_cache.update_aggregates(state, rows)
+
+    # Each unique score's averages are added to the lists in the same order as
+    # the scores, so the correct numbers correspond to each score when adding
+    # to the dataframe.
     all_scores_attendance = []
     all_scores_weeks = []
     all_scores_performances = []
-
-    # Each unique score is looped through, where all shows with that score are
-    # pulled out of the complete dataframe and then the total attendance,
-    # number of weeks on broadway, and total performances are each averaged.
-    # These are added to the previously created lists in the same order as the
-    # scores.
     for score in all_scores:
-        all_same_scores = musical_scores[
-            musical_scores["UniquenessScore"] == score
-        ]
-
-        # averaging attendance
-        attendance = all_same_scores["Attendance"].mean()
+        (attendance, weeks, performances) = score_cache.get_averages(
+            state, score
+        )
         all_scores_attendance.append(attendance)
-
-        # averaging the total number of weeks on Broadway
-        weeks = all_same_scores["WeeksPerformed"].mean()
         all_scores_weeks.append(weeks)
-
-        # averaging number of performances
-        performances = all_same_scores["NumPerformances"].mean()
         all_scores_performances.append(performances)
 
+    if aggregate_cache_file is not None:
+        score_cache.save_cache(aggregates, aggregate_cache_file)
+
     # Each list is then added as a new column of the newly created dataframe.
     score_dataframe["Attendance"] = all_scores_attendance
     score_dataframe["WeeksPerformed"] = all_scores_weeks
     score_dataframe["NumPerformances"] = all_scores_performances
 
+    return score_dataframe
+
+
+@instrumentation.timed_stage
+def avg_scores_data(
+    musical_scores_file=RESULT_FILES["musical_scores"],
+    score_dataframe_file=RESULT_FILES["score_dataframe"],
+    aggregate_cache_file=score_cache.AGGREGATE_CACHE_FILE,
+):
+    """
+    Calculates the average attendance, number of weeks on broadway, and total
+    number of performances for each lyrical uniqueness score and stores this
+    data in a new CSV file titled score_dataframe.csv. The averages are
+    calculated by average_scores.
+
+    Args:
+        musical_scores_file: optional string specifying input file path.
+        scores_dataframe_file: optional string specifying output file path.
+        aggregate_cache_file: optional string specifying the file path of the
+            cached running sums. If None, the averages are computed from
+            scratch and no cache is kept.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    with open(musical_scores_file, "r", encoding="utf-8") as file:
+        musical_scores = pd.read_csv(file)
+
+    score_dataframe = average_scores(
+        musical_scores, score_dataframe_file, aggregate_cache_file
+    )
+
     # Finally, this data is again written to a separate csv file in the project
     # directory.
     score_dataframe.to_csv(score_dataframe_file, encoding="utf-8", index=False)
@@ -195,19 +455,19 @@ def plot_data_unique_attendance(score_dataframe="score_dataframe.csv"):
     Returns:
         Nothing. Creates plot.
     """
+    # pyplot is only imported once a plot is requested, since it is slow to
+    # import and needs a display. plotting.render_all_plots renders these
+    # plots to image files without one.
+    # pylint: disable=import-outside-toplevel
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
     # plot average attendance for each unique score
 
     with open(score_dataframe, "r", encoding="utf-8") as file:
         scores_dataframe = pd.read_csv(file)
 
-    plt.plot(
-        scores_dataframe["UniquenessScore"],
-        scores_dataframe["Attendance"],
-        "bo",
-    )
-    plt.xlabel("Lyrical Uniqueness Score")
-    plt.ylabel("Average Attendance")
-    plt.title("Average Attendance for Each Lyrical Uniqueness Score")
+    plotting.draw_unique_attendance(plt.gca(), scores_dataframe)
     plt.show()
 
 
@@ -223,21 +483,15 @@ def plot_data_unique_weeks(score_dataframe="score_dataframe.csv"):
     Returns:
         Nothing. Creates plot.
     """
+    # pylint: disable=import-outside-toplevel
+    import matplotlib.pyplot as plt
+    import pandas as pd
 
     with open(score_dataframe, "r", encoding="utf-8") as file:
         scores_dataframe = pd.read_csv(file)
 
     # plot average number of weeks on broadway for each unique score
-    plt.plot(
-        scores_dataframe["UniquenessScore"],
-        scores_dataframe["WeeksPerformed"],
-        "bo",
-    )
-    plt.xlabel("Lyrical Uniqueness Score")
-    plt.ylabel("Average Number of Weeks on Broadway")
-    plt.title(
-        "Average Number of Weeks on Broadway for Each Lyrical Uniqueness Score"
-    )
+    plotting.draw_unique_weeks(plt.gca(), scores_dataframe)
     plt.show()
 
 
@@ -254,15 +508,194 @@ def plot_data_total_attendance(musical_scores="musical_scores.csv"):
     Returns:
         Nothing. Creates plot.
     """
+    # pylint: disable=import-outside-toplevel
+    import matplotlib.pyplot as plt
+    import pandas as pd
 
     with open(musical_scores, "r", encoding="utf-8") as file:
         musical_scores = pd.read_csv(file)
 
     # plot attendance compared to total lyric count
-    plt.plot(
-        musical_scores["TotalLyricCount"], musical_scores["Attendance"], "bo"
-    )
-    plt.xlabel("Total Number of Lyrics")
-    plt.ylabel("Attendance")
-    plt.title("Total Broadway Attendance for Different Number of Total Lyrics")
+    plotting.draw_total_attendance(plt.gca(), musical_scores)
     plt.show()
+
+
+def get_export_formats():
+    """
+    Find the formats results can be exported in with the packages installed.
+
+    Returns:
+        List of strings naming each format, always including "csv".
+    """
+    return [
+        export_format
+        for (export_format, package) in EXPORT_FORMATS.items()
+        if package is None or importlib.util.find_spec(package) is not None
+    ]
+
+
+@instrumentation.timed_stage
+def export_results(
+    results, output_directory=".", export_formats=None, intermediates=False
+):
+    """
+    Write every result of a pipeline run to disk in a single pass at the end
+    of the run.
+
+    Args:
+        results: dictionary mapping the keys of RESULT_FILES to pandas
+            dataframes, as returned by run_pipeline.
+        output_directory: optional string specifying the directory to write
+            the files to.
+        export_formats: optional list of strings naming the formats to write
+            each result in. Defaults to every format returned by
+            get_export_formats, with a warning for any format that is not
+            available.
+        intermediates: optional boolean, True to also write the intermediate
+            results named in INTERMEDIATE_RESULTS.
+    Returns:
+        List of strings representing the path of each file written.
+    Raises:
+        ValueError: if a format is unknown or its package is not installed.
+    """
+    if export_formats is None:
+        export_formats = get_export_formats()
+        missing_formats = sorted(set(EXPORT_FORMATS) - set(export_formats))
+        if missing_formats:
+            warnings.warn(
+                f"Results are not exported as {', '.join(missing_formats)}, "
+                "since the packages needed are not installed (see "
+                "requirements.txt)."
+            )
+    for export_format in export_formats:
+        if export_format not in get_export_formats():
+            raise ValueError(f"Results can not be exported as {export_format}.")
+
+    os.makedirs(output_directory, exist_ok=True)
+    written_files = []
+    for (name, dataframe) in results.items():
+        if name in INTERMEDIATE_RESULTS and not intermediates:
+            continue
+        file_stem = os.path.splitext(RESULT_FILES[name])[0]
+        for export_format in export_formats:
+            file_path = os.path.join(
+                output_directory, f"{file_stem}.{export_format}"
+            )
+            if export_format == "csv":
+                dataframe.to_csv(file_path, encoding="utf-8", index=False)
+            else:
+                dataframe.to_parquet(file_path, index=False)
+            instrumentation.count_file_bytes("io.bytes_written", file_path)
+            written_files.append(file_path)
+    return written_files
+
+
+def run_pipeline(
+    profile=None,
+    report_file=instrumentation.REPORT_FILE,
+    output_directory=".",
+    export_formats=None,
+    intermediates=False,
+    memo_file=song_memo.MEMO_FILE,
+):
+    """
+    Runs every stage of the analysis in order: summing the Broadway data,
+    matching each musical to its Genius album, downloading lyrics, scoring
+    every album, averaging the data for each uniqueness score and joining
+    each show's weekly run curve to its scores.
+
+    The results are passed from stage to stage as dataframes in memory, and
+    are only written to disk once, by export_results, at the end of the run.
+
+    If profiling is on, a report of the time spent in each stage and on each
+    Genius endpoint, along with the number of bytes read and words scored, is
+    written at the end of the run.
+
+    Args:
+        profile: optional boolean, True to profile the run and False not to.
+            Defaults to profiling only if the LYRICS_PROFILE environment
+            variable is set.
+        report_file: optional string specifying the file path of the JSON
+            profiling report. A text version is written next to it.
+        output_directory: optional string specifying the directory to write
+            the results to.
+        export_formats: optional list of strings naming the formats to write
+            each result in. Defaults to CSV, and Parquet if pyarrow is
+            installed.
+        intermediates: optional boolean, True to also write the summed and
+            matched data.
+        memo_file: optional string specifying the file path of the song memo
+            shared by downloading and scoring, so each distinct song is only
+            split into words and scored once. If None, no memo is kept.
+    Returns:
+        Dictionary mapping the keys of RESULT_FILES to the pandas dataframe of
+            each result.
+    """
+    if profile is not None:
+        instrumentation.enable(profile)
+    instrumentation.reset()
+
+    results = {"summed_data": broadway.calculate_summed_data()}
+    results["musical_genius_data"] = match_albums(results["summed_data"])
+    download_album_lyrics(results["musical_genius_data"], memo_file)
+    results["musical_scores"] = score_albums(
+        results["musical_genius_data"], memo_file=memo_file
+    )
+    results["score_dataframe"] = average_scores(results["musical_scores"])
+    results["run_curves"] = weekly_analysis.join_run_curves(
+        results["musical_scores"]
+    )
+    export_results(results, output_directory, export_formats, intermediates)
+
+    if instrumentation.is_enabled():
+        instrumentation.write_report(report_file)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the Broadway lyric analysis pipeline."
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=None,
+        help="write a report of where the run spent its time",
+    )
+    parser.add_argument(
+        "--report-file",
+        default=instrumentation.REPORT_FILE,
+        help="file path of the JSON profiling report",
+    )
+    parser.add_argument(
+        "--output-directory",
+        default=".",
+        help="directory to write the results to",
+    )
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=list(EXPORT_FORMATS),
+        default=None,
+        help="formats to write the results in (default: every one available)",
+    )
+    parser.add_argument(
+        "--intermediates",
+        action="store_true",
+        help="also write the summed and matched data",
+    )
+    parser.add_argument(
+        "--no-memo",
+        action="store_true",
+        help="do not keep a memo of each song's words and scores",
+    )
+    arguments = parser.parse_args()
+    run_pipeline(
+        arguments.profile,
+        arguments.report_file,
+        arguments.output_directory,
+        arguments.formats,
+        arguments.intermediates,
+        None if arguments.no_memo else song_memo.MEMO_FILE,
+    )
@@ -0,0 +1,163 @@
+"""
+Shared pytest configuration and fixtures for test_lyric_analysis.py.
+
+The outputs of the pipeline stages run on the testing data are calculated
+once per test session and shared by every test that reads them, and are
+written to a temporary directory rather than the testing directory, so tests
+can run in any order or in parallel (for example with pytest-xdist, where
+each worker has its own temporary directory).
+
+Tests are not allowed to reach the network unless they are marked with
+@pytest.mark.network, and marked tests are skipped unless pytest is run with
+--allow-network. Connections to this machine (such as to the query service)
+are always allowed.
+"""
+
+import socket
+import pytest
+import broadway_data as broadway
+import compile_data as cd
+
+
+PROCESSED_TESTING_DATA = "testing/processed_testing_data.csv"
+UNIQUENESS_TESTING_DATA = "testing/uniqueness_test_data.csv"
+
+# The hosts tests can always connect to.
+LOOPBACK_HOSTS = {None, "", "localhost", "127.0.0.1", "::1"}
+
+
+class NetworkAccessError(RuntimeError):
+    """
+    Raised when a test that is not marked as needing the network tries to
+    reach it.
+    """
+
+
+def pytest_addoption(parser):
+    """
+    Add the --allow-network option.
+    """
+    parser.addoption(
+        "--allow-network",
+        action="store_true",
+        default=False,
+        help="run tests marked network, which need internet access",
+    )
+
+
+def pytest_configure(config):
+    """
+    Register the network marker.
+    """
+    config.addinivalue_line(
+        "markers",
+        "network: test needs internet access, skipped unless --allow-network",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """
+    Skip tests marked network unless --allow-network was given.
+    """
+    if config.getoption("--allow-network"):
+        return
+    skip_network = pytest.mark.skip(reason="needs --allow-network")
+    for item in items:
+        if "network" in item.keywords:
+            item.add_marker(skip_network)
+
+
+def _check_host(host):
+    """
+    Raise NetworkAccessError if a host is not this machine.
+    """
+    if isinstance(host, bytes):
+        host = host.decode("ascii", "replace")
+    if host not in LOOPBACK_HOSTS:
+        raise NetworkAccessError(
+            f"Test tried to reach {host!r}. Mark it with "
+            "@pytest.mark.network if it needs the network."
+        )
+
+
+@pytest.fixture(name="offline", autouse=True)
+def fixture_offline(request, monkeypatch):
+    """
+    Make every connection to another machine fail straight away, instead of
+    waiting for a request to time out, unless the test is marked network.
+    """
+    if request.node.get_closest_marker("network") is not None:
+        yield
+        return
+
+    original_getaddrinfo = socket.getaddrinfo
+    original_connect = socket.socket.connect
+    original_connect_ex = socket.socket.connect_ex
+
+    def guarded_getaddrinfo(host, *args, **kwargs):
+        _check_host(host)
+        return original_getaddrinfo(host, *args, **kwargs)
+
+    def guarded_connect(sock, address):
+        if sock.family in (socket.AF_INET, socket.AF_INET6):
+            _check_host(address[0])
+        return original_connect(sock, address)
+
+    def guarded_connect_ex(sock, address):
+        if sock.family in (socket.AF_INET, socket.AF_INET6):
+            _check_host(address[0])
+        return original_connect_ex(sock, address)
+
+    monkeypatch.setattr(socket, "getaddrinfo", guarded_getaddrinfo)
+    monkeypatch.setattr(socket.socket, "connect", guarded_connect)
+    monkeypatch.setattr(socket.socket, "connect_ex", guarded_connect_ex)
+    yield
+
+
+@pytest.fixture(name="results_directory", scope="session")
+def fixture_results_directory(tmp_path_factory):
+    """
+    A temporary directory for the outputs shared by the whole session.
+    """
+    return tmp_path_factory.mktemp("results")
+
+
+@pytest.fixture(name="summed_test_data_file", scope="session")
+def fixture_summed_test_data_file(results_directory):
+    """
+    Sum the processed testing data once, returning the path of the summed
+    data file.
+    """
+    summed_file = str(results_directory / "summed_test_data.csv")
+    broadway.sum_data(PROCESSED_TESTING_DATA, summed_file)
+    return summed_file
+
+
+@pytest.fixture(name="test_musical_scores_file", scope="session")
+def fixture_test_musical_scores_file(results_directory):
+    """
+    Score the uniqueness testing data once, without a score cache, returning
+    the path of the musical scores file.
+    """
+    musical_scores_file = str(results_directory / "test_musical_scores.csv")
+    cd.find_all_uniqueness_scores(
+        UNIQUENESS_TESTING_DATA, musical_scores_file, cache_file=None
+    )
+    return musical_scores_file
+
+
+@pytest.fixture(name="test_score_dataframe_file", scope="session")
+def fixture_test_score_dataframe_file(
+    results_directory, test_musical_scores_file
+):
+    """
+    Average the scored testing data once, without an aggregate cache,
+    returning the path of the averaged score data file.
+    """
+    score_dataframe_file = str(results_directory / "test_score_dataframe.csv")
+    cd.avg_scores_data(
+        test_musical_scores_file,
+        score_dataframe_file,
+        aggregate_cache_file=None,
+    )
+    return score_dataframe_file
@@ -1,15 +1,35 @@
 """
 Various functions that work to grab album, song, and lyrical information about
 songs using the Genius API.
+
+The lyricsgenius library and the api_keys.py file are only needed to download
+from Genius, so they are not imported until a download is made. Lyrics that
+are already saved in the lyrics folder can be processed without either.
 """
 
+import contextlib
 import csv
-import lyricsgenius as lg
-import api_keys as key
+import json
+import os
+import sys
+import tempfile
+import instrumentation
 
 
 LIST_OF_ALBUM_KEYWORDS = ["Broadway", "Cast", "Recording"]
 
+# Directory that each album's lyrics are saved to.
+LYRICS_DIRECTORY = "lyrics"
+
+# Directory that the track list of each album is cached in, so that an album's
+# tracks only need to be listed from Genius once.
+TRACKS_DIRECTORY = "tracks"
+
+# The number of tracks requested for each page of an album's track list (the
+# most that Genius allows), and the number of pages requested at once.
+TRACKS_PER_PAGE = 50
+PAGE_FETCH_WORKERS = 4
+
 # A list of punctuation marks to ignore when doing lyrical analysis. This is
 # copied from Python's built-in string.punctuation, however, the brackets []
 # have been removed since anything inside of brackets will be removed entirely
@@ -18,6 +38,39 @@ LIST_OF_ALBUM_KEYWORDS = ["Broadway", "Cast", "Recording"]
 PUNCTUATION_MARKS = "\"!#$%&'()*+,-./:;<=>?@\^_`{|}~"
 
 
+def create_genius_object():
+    """
+    Create a lyricsgenius Genius object to make requests to the Genius API.
+
+    The Genius client access token is read from CLIENT_ACCESS_TOKEN in the
+    api_keys.py file. If that file does not exist, the GENIUS_ACCESS_TOKEN
+    environment variable is used instead.
+
+    Returns:
+        A lyricsgenius Genius object.
+    Raises:
+        ModuleNotFoundError: if neither api_keys.py nor the GENIUS_ACCESS_TOKEN
+            environment variable provide an access token.
+    """
+    # pylint: disable=import-outside-toplevel
+    import lyricsgenius as lg
+
+    try:
+        import api_keys as key
+
+        access_token = key.CLIENT_ACCESS_TOKEN
+    except ModuleNotFoundError as error:
+        access_token = os.environ.get("GENIUS_ACCESS_TOKEN")
+        if access_token is None:
+            raise ModuleNotFoundError(
+                "A Genius access token is needed to download from Genius. "
+                "Create api_keys.py from api_keys.py.example or set the "
+                "GENIUS_ACCESS_TOKEN environment variable."
+            ) from error
+
+    return lg.Genius(access_token)
+
+
 def find_album(name):
     """
     Using the lyricsgenius library, search for a given musical's album on
@@ -38,7 +91,7 @@ def find_album(name):
             String consisting of the name of the album found to be matching.
     """
 
-    genius_object = lg.Genius(key.CLIENT_ACCESS_TOKEN)
+    genius_object = create_genius_object()
 
     # Some musicals have years in the name that causes issues with Genius
     # results. If the name contains such a year (either in the format 'YY or
@@ -61,7 +114,8 @@ def find_album(name):
     # Use the genius object from lyricsgenius to search Genius for an album of
     # the given musical's name. This returns 5 results in a dictionary in
     # JSON-format.
-    album_dict = genius_object.search_albums(name)
+    with instrumentation.network_call("search_albums"):
+        album_dict = genius_object.search_albums(name)
 
     # Remove unnecessary JSON nesting sections for the returned results.
     album_dict = album_dict["sections"][0]["hits"]
@@ -142,7 +196,7 @@ def split_and_format_song_lyrics(song_lyrics):
     return song_lyrics_filtered
 
 
-def download_song_lyrics(song_id):
+def download_song_lyrics(song_id, memo=None):
     """
     Given a Genius ID of a song, download the lyrics of that song.
 
@@ -152,48 +206,137 @@ def download_song_lyrics(song_id):
 
     Args:
         song_id: string representing the numerical Genius ID of a song
+        memo: optional song_memo.SongMemo. If given, lyrics identical to a
+            song seen before reuse that song's words instead of being split
+            again.
     Returns:
         list of strings representing the individual words that make up the
             song's lyrics
 
     """
-    genius_object_song = lg.Genius(key.CLIENT_ACCESS_TOKEN)
+    genius_object_song = create_genius_object()
 
     # Uses lyricsgenius to get the lyrics for the requested song based on
     # it's ID
     #
     # _NOTE: The Genius API doesn't provide lyrics directly, so the
     # lyricsgenius library scraped
-    song_lyrics = genius_object_song.lyrics(song_id)
+    with instrumentation.network_call("lyrics"):
+        song_lyrics = genius_object_song.lyrics(song_id)
 
+    if memo is not None:
+        return memo.tokenize(song_lyrics)
     return split_and_format_song_lyrics(song_lyrics)
 
 
-def download_all_lyrics(album_id):
+def get_album_tracks(album_id, genius_object=None, use_cache=True):
+    """
+    Given an ID of a Genius album, list every track on that album.
+
+    Genius splits an album's tracks into pages of at most TRACKS_PER_PAGE
+    tracks. Every page is followed, so large cast albums are not cut short.
+    Genius does not say how many pages an album has, so once the first page
+    shows that there are more, the following pages are requested
+    PAGE_FETCH_WORKERS at a time in parallel until the last page is reached.
+
+    The track list is saved to a JSON file in TRACKS_DIRECTORY and loaded from
+    there on later calls. A saved file that can not be read (such as one cut
+    short by an earlier run) is ignored, and the tracks are listed again.
+
+    Args:
+        album_id: string representing the numerical Genius ID of the album.
+        genius_object: optional lyricsgenius Genius object (or any object with
+            the same album_tracks method) to make the requests with. Defaults
+            to creating one with create_genius_object.
+        use_cache: optional boolean, False to ignore any saved track list and
+            list the tracks from Genius again.
+    Returns:
+        A list of dictionaries, one for each track in album order, each
+            containing the track's "number" and a "song" dictionary with the
+            song's "id", "title", "instrumental" and "lyrics_state".
+    """
+    cache_path = os.path.join(TRACKS_DIRECTORY, f"{album_id}.json")
+
+    if use_cache:
+        try:
+            with open(cache_path, "r", encoding="utf-8") as file:
+                return json.load(file)["tracks"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError):
+            instrumentation.count("tracks.unreadable")
+
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ThreadPoolExecutor
+
+    if genius_object is None:
+        genius_object = create_genius_object()
+
+    def fetch_page(page):
+        with instrumentation.network_call("album_tracks"):
+            return genius_object.album_tracks(
+                album_id, per_page=TRACKS_PER_PAGE, page=page
+            )
+
+    first_page = fetch_page(1)
+    all_tracks = list(first_page["tracks"])
+    next_page = first_page["next_page"]
+
+    # Later pages are requested in parallel batches. Any pages requested past
+    # the end of the album come back empty and are ignored.
+    with ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS) as executor:
+        while next_page is not None:
+            pages = range(next_page, next_page + PAGE_FETCH_WORKERS)
+            for page_results in executor.map(fetch_page, pages):
+                all_tracks.extend(page_results["tracks"])
+                next_page = page_results["next_page"]
+                if next_page is None:
+                    break
+
+    # Only the track information used later is kept in the cache.
+    all_tracks = [
+        {
+            "number": track.get("number"),
+            "song": {
+                "id": track["song"]["id"],
+                "title": track["song"].get("title"),
+                "instrumental": track["song"]["instrumental"],
+                "lyrics_state": track["song"]["lyrics_state"],
+            },
+        }
+        for track in all_tracks
+    ]
+
+    os.makedirs(TRACKS_DIRECTORY, exist_ok=True)
+    with replace_file(cache_path, "w", encoding="utf-8") as file:
+        json.dump(
+            {"album_id": album_id, "tracks": all_tracks}, file, indent=4
+        )
+
+    return all_tracks
+
+
+def download_all_lyrics(album_id, memo=None):
     """
     Given an ID of a genius album, get all lyrics of all songs on that album.
 
     Args:
         album_id: string representing the numerical Genius ID of the album
+        memo: optional song_memo.SongMemo passed to download_song_lyrics.
     Returns:
         A list of lists. Each embedded list contains strings representing each
             individual word in the song.
     """
 
-    genius_object = lg.Genius(key.CLIENT_ACCESS_TOKEN)
-
     # If the find_album method fails to find a match for an album, it returns
     # -1, so any album IDs equal to -1 should be ignored and an empty string
     # should be returned.
     if album_id == -1:
         return []
 
-    # Get a dictionary representing all of the tracks in an album and their
-    # associated data.
-    all_tracks = genius_object.album_tracks(album_id)
-
-    # Remove extra dictionary later
-    all_tracks = all_tracks["tracks"]
+    # Get a list of all of the tracks in an album (from every page of the
+    # album's track list) and their associated data.
+    all_tracks = get_album_tracks(album_id)
 
     # Create empty list to store each individual song's list of lyrics
     album_lyrics = []
@@ -216,15 +359,15 @@ def download_all_lyrics(album_id):
 
         # Each list is appended to the master list for all songs in the album.
         # Songs that do not have lyrics for any reason are excluded.
-        song_lyrics = download_song_lyrics(song_id)
+        song_lyrics = download_song_lyrics(song_id, memo)
         empty_string = []
         if song_lyrics is not empty_string:
-            album_lyrics.append(download_song_lyrics(song_id))
+            album_lyrics.append(song_lyrics)
 
     return album_lyrics
 
 
-def write_lyrics_to_file(album_id):
+def write_lyrics_to_file(album_id, memo=None):
     """
     Save a musical's lyrics to a CSV file.
 
@@ -238,19 +381,164 @@ def write_lyrics_to_file(album_id):
 
     Args:
         album_id: string, numerical ID for an album on Genius.
+        memo: optional song_memo.SongMemo passed to download_song_lyrics.
     Returns:
         Nothing.
     """
 
-    lyrics = download_all_lyrics(album_id)
+    lyrics = download_all_lyrics(album_id, memo)
+    save_album_lyrics(album_id, lyrics)
+
+
+def save_album_lyrics(album_id, all_album_lyrics):
+    """
+    Write an album's lyrics to its CSV file, one song per row.
+
+    The lyrics are written to a temporary file that then replaces the album's
+    file, so a run that stops partway through never leaves a truncated lyrics
+    file that later runs would trust.
 
-    filepath = f"lyrics/{album_id}.csv"
+    Args:
+        album_id: string, numerical ID for an album on Genius.
+        all_album_lyrics: list of lists of strings, one list for each song.
+    Returns:
+        String representing the path of the album's lyrics file.
+    """
+    filepath = get_lyrics_file(album_id)
 
-    with open(filepath, "w", encoding="utf-8") as file:
+    with replace_file(filepath, "w", encoding="utf-8") as file:
         csv_writer = csv.writer(file)
-        csv_writer.writerows(lyrics)
+        csv_writer.writerows(all_album_lyrics)
+
+    instrumentation.count_file_bytes("io.bytes_written", filepath)
+    return filepath
+
+
+@contextlib.contextmanager
+def replace_file(filepath, mode="w", **kwargs):
+    """
+    Open a temporary file next to a file, which replaces the file once the
+    block is left without an exception, used as a context manager:
+
+        with replace_file(filepath, "w", encoding="utf-8") as file:
+            ...
 
+    The file is never left partly written: until the block is done it keeps
+    its old contents, and if the block fails the temporary file is removed.
+
+    Args:
+        filepath: string representing the path of the file to replace.
+        mode: optional string, the mode to open the temporary file with, "w"
+            or "wb".
+        **kwargs: any other arguments to open, such as the encoding.
+    Yields:
+        The open temporary file.
+    """
+    (file_descriptor, temporary_filepath) = tempfile.mkstemp(
+        suffix=".tmp", dir=os.path.dirname(filepath) or "."
+    )
+
+    try:
+        with open(file_descriptor, mode, **kwargs) as file:
+            yield file
+        os.replace(temporary_filepath, filepath)
+    except BaseException:
+        os.remove(temporary_filepath)
+        raise
 
+
+def get_lyrics_file(album_id):
+    """
+    Find the path of the CSV file an album's lyrics are saved to.
+
+    Args:
+        album_id: string representing the album's numerical Genius ID
+    Returns:
+        String representing the path of the album's lyrics file.
+    """
+    return os.path.join(LYRICS_DIRECTORY, f"{album_id}.csv")
+
+
+def find_saved_lyrics_file(album_id):
+    """
+    Find the file an album's lyrics are saved in, either as a CSV file or
+    compressed by lyric_storage. The CSV file is used if there are both.
+
+    Args:
+        album_id: string representing the album's numerical Genius ID
+    Returns:
+        String representing the path of the album's saved lyrics, or None if
+            the album's lyrics have not been saved.
+    """
+    # pylint: disable=import-outside-toplevel
+    import lyric_storage
+
+    for file_path in (
+        get_lyrics_file(album_id),
+        lyric_storage.get_compressed_file(album_id),
+    ):
+        if os.path.exists(file_path):
+            return file_path
+    return None
+
+
+def iter_album_songs(album_id):
+    """
+    Given an album ID, yield the lyrics of each song on the album one at a
+    time, rather than loading the whole album at once. Like get_all_lyrics,
+    the album is downloaded first if it has not already been downloaded.
+
+    Each song is a tuple of words, and each word is interned so that a word
+    repeated throughout the corpus is only stored once in memory.
+
+    Albums compressed by lyric_storage are read too. These are decoded a whole
+    album at a time, which is faster than parsing a CSV file.
+
+    Args:
+        album_id: string representing the album's numerical Genius ID
+    Yields:
+        Tuple of strings for each individual word in a song's lyrics, for each
+            song on the album in order.
+    """
+    file_path = find_saved_lyrics_file(album_id)
+
+    if file_path is None:
+        write_lyrics_to_file(album_id)
+        file_path = get_lyrics_file(album_id)
+
+    instrumentation.count_file_bytes("io.bytes_read", file_path)
+    instrumentation.count("io.albums_read")
+
+    if file_path != get_lyrics_file(album_id):
+        # pylint: disable=import-outside-toplevel
+        import lyric_storage
+
+        yield from lyric_storage.read_album(album_id)
+        return
+
+    with open(file_path, "r", encoding="utf-8") as file:
+        # Use CSV library to read the CSV one row (song) at a time.
+        for song in csv.reader(file):
+            yield tuple(sys.intern(word) for word in song)
+
+
+def iter_corpus(album_ids):
+    """
+    Yield every song of every given album one at a time, so that the whole
+    corpus can be processed while only holding a single song in memory.
+
+    Args:
+        album_ids: iterable of the albums' numerical Genius IDs.
+    Yields:
+        A tuple containing the song's album ID and a tuple of strings for each
+            individual word in the song's lyrics.
+    """
+    for album_id in album_ids:
+        for song in iter_album_songs(album_id):
+            yield (album_id, song)
+
+
+@instrumentation.timed_stage
 def get_all_lyrics(album_id):
     """
     Given an album ID, this function will first try to load the lyrics from a
@@ -258,6 +546,9 @@ def get_all_lyrics(album_id):
     downloaded, it is grabbed from Genius and then loaded from the file
     created.
 
+    To process an album without holding all of its lyrics in memory at once,
+    use iter_album_songs instead.
+
     Args:
         album_id: string representing the album's numerical Genius ID
     Returns:
@@ -265,25 +556,7 @@ def get_all_lyrics(album_id):
             individual word in a songs lyrics. Each song on the album
             gets its own embedded list.
     """
-
-    file_path = f"lyrics/{album_id}.csv"
-
-    lyrics = []
-    try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            # Use CSV library to open CSV; create list of lists in the format
-            # that we are looking for.
-            csv_reader = csv.reader(file)
-            lyrics = list(csv_reader)
-    except FileNotFoundError:
-        write_lyrics_to_file(album_id)
-        with open(file_path, "r", encoding="utf-8") as file:
-            # Use CSV library to open CSV; create list of lists in the format
-            # that we are looking for.
-            csv_reader = csv.reader(file)
-            lyrics = list(csv_reader)
-
-    return lyrics
+    return [list(song) for song in iter_album_songs(album_id)]
 
 
 def calculate_lyrical_uniqueness(lyrics):
@@ -314,7 +587,7 @@ def calculate_lyrical_uniqueness(lyrics):
         return 0
 
 
-def calculate_album_uniqueness(all_album_lyrics):
+def calculate_album_uniqueness(all_album_lyrics, exclude_duplicates=False):
     """
     Calculate the average uniqueness of all songs in an album.
 
@@ -322,21 +595,36 @@ def calculate_album_uniqueness(all_album_lyrics):
     averaged to find a (rounded, whole number) percent uniqueness of the album's
     lyrics.
 
+    Albums often contain reprises, alternate recordings or duplicated tracks,
+    which lower the album's score. These can optionally be left out.
+
     Args:
         all_album_lyrics: list of lists of strings, which each embedded list
             containing each word in the lyrics of one of the album's song as
-            individual strings.
+            individual strings. This can also be an iterator of songs, such as
+            iter_album_songs.
+        exclude_duplicates: optional boolean, True to leave out any song that
+            is a near-duplicate of an earlier song on the album (as found by
+            near_duplicates.iter_unique_songs).
     Return:
         Integer representing the percent uniqueness of an album's lyrics, on
             average
     """
+    if exclude_duplicates:
+        # pylint: disable=import-outside-toplevel
+        import near_duplicates
+
+        all_album_lyrics = near_duplicates.iter_unique_songs(all_album_lyrics)
 
     total_percentages = 0
+    num_songs = 0
 
     for song in all_album_lyrics:
         total_percentages += calculate_lyrical_uniqueness(song)
+        num_songs += 1
+        instrumentation.count("tokens.processed", len(song))
 
-    return int(total_percentages / len(all_album_lyrics))
+    return int(total_percentages / num_songs)
 
 
 def calculate_total_lyrics(lyrics):
@@ -346,7 +634,8 @@ def calculate_total_lyrics(lyrics):
     Args:
         lyrics: A list of lists, which each embedded list containing strings for
             each individual word in a songs lyrics. Each song on the album gets
-            its own embedded list.
+            its own embedded list. This can also be an iterator of songs, such
+            as iter_album_songs.
     Return:
         Integer representing the total number of lyrics in an album
 
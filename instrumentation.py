@@ -0,0 +1,340 @@
+"""
+Timers and counters to profile where a run of the project spends its time.
+
+Instrumentation is off by default, and is switched on by setting the
+LYRICS_PROFILE environment variable or by calling enable (which
+compile_data.run_pipeline does when asked to profile). While it is off, every
+function in this module returns immediately without recording anything, so
+leaving the instrumentation in place costs close to nothing.
+
+Three kinds of measurements are recorded:
+    * stages: the number of calls and total wall time of each pipeline stage.
+    * network: the number of calls, total and maximum latency, and a latency
+        histogram for each Genius API endpoint.
+    * counters: running totals, such as bytes of lyrics read and written and
+        the number of words scored.
+
+Measurements can be recorded from several threads at once (such as the
+download and scoring threads), so every update is made while holding a lock.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+
+
+ENVIRONMENT_VARIABLE = "LYRICS_PROFILE"
+REPORT_FILE = "profile_report.json"
+
+# The upper bounds, in seconds, of each bucket in the network latency
+# histograms. Any call slower than the last bound goes in a final overflow
+# bucket.
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+_enabled = os.environ.get(ENVIRONMENT_VARIABLE, "") not in ("", "0")
+_stages = {}
+_network = {}
+_counters = {}
+
+# Held while the measurements are updated or read.
+_lock = threading.Lock()
+
+
+class _NullTimer:
+    """
+    A context manager that does nothing, returned while instrumentation is off.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    """
+    A context manager that passes the wall time spent inside it to a function.
+    """
+
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def enable(enabled=True):
+    """
+    Switch instrumentation on or off.
+
+    Args:
+        enabled: optional boolean, False to switch instrumentation off.
+    Returns:
+        Nothing.
+    """
+    global _enabled  # pylint: disable=global-statement
+    _enabled = enabled
+
+
+def is_enabled():
+    """
+    Check whether instrumentation is switched on.
+
+    Returns:
+        True if measurements are being recorded, False otherwise.
+    """
+    return _enabled
+
+
+def reset():
+    """
+    Discard every measurement recorded so far.
+
+    Returns:
+        Nothing.
+    """
+    with _lock:
+        _stages.clear()
+        _network.clear()
+        _counters.clear()
+
+
+def count(name, amount=1):
+    """
+    Add to one of the running counters.
+
+    Args:
+        name: string representing the name of the counter.
+        amount: optional number to add to the counter. Defaults to 1.
+    Returns:
+        Nothing.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def count_file_bytes(name, file_path):
+    """
+    Add the size of a file to one of the running counters. The file is only
+    checked while instrumentation is on.
+
+    Args:
+        name: string representing the name of the counter, such as
+            "io.bytes_read".
+        file_path: string representing the path of the file.
+    Returns:
+        Nothing.
+    """
+    if not _enabled:
+        return
+    count(name, os.path.getsize(file_path))
+
+
+def _record_stage(name, seconds):
+    """
+    Record one call of a pipeline stage.
+    """
+    with _lock:
+        stage_times = _stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+        stage_times["calls"] += 1
+        stage_times["seconds"] += seconds
+
+
+def _record_network_call(endpoint, seconds):
+    """
+    Record the latency of one call to a network endpoint.
+    """
+    bucket = len(LATENCY_BUCKETS)
+    for (index, bound) in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            bucket = index
+            break
+
+    with _lock:
+        endpoint_times = _network.setdefault(
+            endpoint,
+            {
+                "calls": 0,
+                "seconds": 0.0,
+                "max_seconds": 0.0,
+                "histogram": [0] * (len(LATENCY_BUCKETS) + 1),
+            },
+        )
+        endpoint_times["calls"] += 1
+        endpoint_times["seconds"] += seconds
+        endpoint_times["max_seconds"] = max(
+            endpoint_times["max_seconds"], seconds
+        )
+        endpoint_times["histogram"][bucket] += 1
+
+
+def stage(name):
+    """
+    Time a pipeline stage, used as a context manager:
+
+        with instrumentation.stage("scoring"):
+            ...
+
+    Args:
+        name: string representing the name of the stage.
+    Returns:
+        A context manager that records the wall time spent inside it.
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(_record_stage, name)
+
+
+def network_call(endpoint):
+    """
+    Time a call to a network endpoint, used as a context manager:
+
+        with instrumentation.network_call("search_albums"):
+            ...
+
+    Args:
+        endpoint: string representing the name of the endpoint.
+    Returns:
+        A context manager that records the latency of the call.
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(_record_network_call, endpoint)
+
+
+def timed_stage(function):
+    """
+    Decorator that times every call of a function as a pipeline stage named
+    after the function.
+
+    Args:
+        function: the function to time.
+    Returns:
+        The wrapped function.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return function(*args, **kwargs)
+        with _Timer(_record_stage, function.__name__):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def get_report():
+    """
+    Collect every measurement recorded so far into a report.
+
+    Returns:
+        Dictionary with the keys "stages", "network" and "counters". Each
+            network endpoint's histogram is given as a dictionary mapping the
+            upper bound of each bucket to its number of calls. For every pair
+            of counters named "{name}.hits" and "{name}.misses", the counters
+            also include "{name}.hit_rate", the fraction of lookups that hit.
+    """
+    bucket_names = [f"<={bound}s" for bound in LATENCY_BUCKETS]
+    bucket_names.append(f">{LATENCY_BUCKETS[-1]}s")
+
+    # the measurements are copied in one go, so a report never mixes values
+    # from before and after another thread's update
+    with _lock:
+        stages = {name: dict(times) for (name, times) in _stages.items()}
+        network = {}
+        for (endpoint, endpoint_times) in _network.items():
+            network[endpoint] = dict(endpoint_times)
+            network[endpoint]["histogram"] = dict(
+                zip(bucket_names, endpoint_times["histogram"])
+            )
+        counters = dict(_counters)
+
+    for prefix in sorted(
+        {
+            name.rsplit(".", 1)[0]
+            for name in counters
+            if name.endswith((".hits", ".misses"))
+        }
+    ):
+        hits = counters.get(f"{prefix}.hits", 0)
+        lookups = hits + counters.get(f"{prefix}.misses", 0)
+        counters[f"{prefix}.hit_rate"] = round(hits / lookups, 4)
+
+    return {
+        "stages": stages,
+        "network": network,
+        "counters": counters,
+    }
+
+
+def format_report(report):
+    """
+    Format a report from get_report as readable text.
+
+    Args:
+        report: dictionary returned by get_report.
+    Returns:
+        String containing the report, one measurement per line.
+    """
+    lines = ["Stages:"]
+    for (name, times) in report["stages"].items():
+        lines.append(
+            f"  {name}: {times['seconds']:.3f}s over {times['calls']} calls"
+        )
+
+    lines.append("Network:")
+    for (endpoint, times) in report["network"].items():
+        lines.append(
+            f"  {endpoint}: {times['seconds']:.3f}s over {times['calls']} "
+            f"calls (max {times['max_seconds']:.3f}s)"
+        )
+        histogram = ", ".join(
+            f"{bucket} {calls}"
+            for (bucket, calls) in times["histogram"].items()
+            if calls > 0
+        )
+        lines.append(f"    {histogram}")
+
+    lines.append("Counters:")
+    for (name, value) in report["counters"].items():
+        lines.append(f"  {name}: {value}")
+
+    return "\n".join(lines)
+
+
+def write_report(report_file=REPORT_FILE):
+    """
+    Write every measurement recorded so far to a JSON report, and a text
+    version of the report next to it.
+
+    Args:
+        report_file: optional string representing the filepath of the JSON
+            report. The text report has the same path with a .txt extension.
+    Returns:
+        Dictionary holding the report that was written.
+    """
+    report = get_report()
+
+    with open(report_file, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=4)
+
+    text_file = f"{os.path.splitext(report_file)[0]}.txt"
+    with open(text_file, "w", encoding="utf-8") as file:
+        file.write(format_report(report) + "\n")
+
+    return report
@@ -0,0 +1,431 @@
+"""
+A pluggable set of lyrical metrics that are all calculated in a single pass
+over an album's lyrics.
+
+Each metric is registered once with register_metric and is then automatically
+calculated by calculate_album_metrics and written as its own column of
+musical_scores.csv by compile_data.find_all_uniqueness_scores.
+
+A metric is made up of two functions: one that calculates a value for a single
+song, and one that combines the values of every song into a value for the
+whole album.
+"""
+
+import math
+from collections import Counter
+import instrumentation
+
+
+# Dictionary mapping each metric's column name to a tuple of its song function,
+# its album aggregate function and whether the song function takes the window
+# size, in the order the metrics were registered.
+METRICS = {}
+
+# The default number of words in each window of the windowed uniqueness score.
+WINDOW_SIZE = 50
+
+# The type-token ratio at which MTLD considers a run of words to be a complete
+# factor, as suggested by McCarthy and Jarvis (2010).
+MTLD_THRESHOLD = 0.72
+
+# The length of the phrases compared when finding repeated phrases (such as a
+# chorus) within a song.
+REPEATED_PHRASE_LENGTH = 4
+
+
+def average_score(song_values):
+    """
+    Average the values of every song in an album, rounded down to a whole
+    number in the same way as the album uniqueness score.
+
+    Args:
+        song_values: list of numbers, one for each song in the album.
+    Returns:
+        Integer average of the values, or 0 for an album with no songs.
+    """
+    if len(song_values) == 0:
+        return 0
+    return int(sum(song_values) / len(song_values))
+
+
+def average_rounded(song_values):
+    """
+    Average the values of every song in an album, rounded to 4 decimal places.
+
+    Args:
+        song_values: list of numbers, one for each song in the album.
+    Returns:
+        Float average of the values, or 0 for an album with no songs.
+    """
+    if len(song_values) == 0:
+        return 0
+    return round(sum(song_values) / len(song_values), 4)
+
+
+def ratio_of_sums(song_values):
+    """
+    Divide the summed numerators of every song by the summed denominators, so
+    that longer songs carry more weight than shorter ones.
+
+    Args:
+        song_values: list of pairs of numbers (numerator, denominator), one for
+            each song in the album.
+    Returns:
+        Float ratio rounded to 4 decimal places, or 0 if every denominator is
+            zero.
+    """
+    numerator = sum(value[0] for value in song_values)
+    denominator = sum(value[1] for value in song_values)
+    if denominator == 0:
+        return 0
+    return round(numerator / denominator, 4)
+
+
+def count_album_hapaxes(song_values):
+    """
+    Combine the word counts of every song in an album and count the words
+    used exactly once in the whole album. A word used once in each of two
+    songs is used twice on the album, so it is not counted.
+
+    Args:
+        song_values: list of dictionaries, one for each song in the album,
+            mapping each word in the song to the number of times it is used.
+    Returns:
+        Integer number of words used exactly once in the album.
+    """
+    album_counts = Counter()
+    for word_counts in song_values:
+        album_counts.update(word_counts)
+    return sum(1 for count in album_counts.values() if count == 1)
+
+
+def register_metric(column, aggregate=average_rounded, uses_window=False):
+    """
+    Register a song function as a metric that is calculated for every album.
+
+    This is intended to be used as a decorator:
+
+        @register_metric("LongestWord", aggregate=max)
+        def song_longest_word(song, word_counts):
+            ...
+
+    Args:
+        column: string representing the name of the metric's column in
+            musical_scores.csv.
+        aggregate: function that is given a list of the song function's values
+            for every song in an album and returns the album's value. Defaults
+            to averaging the songs' values.
+        uses_window: optional boolean, True if the song function takes the
+            window size as a third argument.
+    Returns:
+        A decorator that registers the song function and returns it unchanged.
+    """
+
+    def decorator(song_function):
+        METRICS[column] = (song_function, aggregate, uses_window)
+        return song_function
+
+    return decorator
+
+
+def check_window_size(window_size):
+    """
+    Make sure a window size can be used by the windowed metrics.
+
+    Args:
+        window_size: integer number of words in each window.
+    Raises:
+        ValueError: if window_size is not a positive number of words.
+    """
+    if window_size <= 0:
+        raise ValueError(
+            f"window_size must be a positive number of words, not "
+            f"{window_size}."
+        )
+
+
+def calculate_song_metrics(song, metrics=None, window_size=WINDOW_SIZE):
+    """
+    Calculate every registered metric for a single song.
+
+    The song's word counts are found once and shared between all of the
+    metrics.
+
+    Args:
+        song: list or tuple of strings representing each word in the song.
+        metrics: optional list of strings naming the metrics to calculate.
+            Defaults to every registered metric.
+        window_size: optional integer number of words in each window of the
+            windowed metrics. Defaults to WINDOW_SIZE.
+    Returns:
+        Dictionary mapping each metric's column name to the song function's
+            value for the song.
+    """
+    if metrics is None:
+        metrics = list(METRICS)
+
+    instrumentation.count("tokens.processed", len(song))
+    word_counts = Counter(song)
+    song_values = {}
+    for column in metrics:
+        (song_function, _, uses_window) = METRICS[column]
+        if uses_window:
+            song_values[column] = song_function(song, word_counts, window_size)
+        else:
+            song_values[column] = song_function(song, word_counts)
+    return song_values
+
+
+@instrumentation.timed_stage
+def calculate_album_metrics(
+    all_album_lyrics, metrics=None, window_size=WINDOW_SIZE, memo=None
+):
+    """
+    Calculate every registered metric for an album in a single pass over its
+    songs.
+
+    Each song's word counts are found once and shared between all of the
+    metrics, so adding a metric does not require reading the lyrics again.
+
+    Args:
+        all_album_lyrics: list of lists of strings, which each embedded list
+            containing each word in the lyrics of one of the album's songs.
+            This can also be an iterator of songs, such as
+            genius_lyrics.iter_album_songs, in which case only one song is held
+            in memory at a time.
+        metrics: optional list of strings naming the metrics to calculate.
+            Defaults to every registered metric.
+        window_size: optional integer number of words in each window of the
+            windowed metrics. Defaults to WINDOW_SIZE.
+        memo: optional song_memo.SongMemo. If given, each song's values are
+            looked up by the song's content, and only calculated for songs
+            that have not been seen before.
+    Returns:
+        Dictionary mapping each metric's column name to its value for the
+            album.
+    Raises:
+        ValueError: if window_size is not a positive number of words.
+    """
+    check_window_size(window_size)
+    if metrics is None:
+        metrics = list(METRICS)
+
+    song_values = {column: [] for column in metrics}
+
+    for song in all_album_lyrics:
+        if memo is None:
+            values = calculate_song_metrics(song, metrics, window_size)
+        else:
+            values = memo.song_metrics(song, metrics, window_size)
+        for column in metrics:
+            song_values[column].append(values[column])
+
+    return {
+        column: METRICS[column][1](song_values[column]) for column in metrics
+    }
+
+
+@register_metric("UniquenessScore", aggregate=average_score)
+def song_uniqueness(song, word_counts):
+    """
+    Find the percentage of unique words compared to the total number of words
+    in a song, matching genius_lyrics.calculate_lyrical_uniqueness.
+
+    Args:
+        song: list of strings representing each word in the song.
+        word_counts: Counter of the number of times each word is in the song.
+    Returns:
+        Integer (rounded down) percentage of words that are unique in the song,
+            or 0 for a song with no lyrics.
+    """
+    if len(song) == 0:
+        return 0
+    return int((len(word_counts) / len(song)) * 100)
+
+
+@register_metric("WindowedUniquenessScore", uses_window=True)
+def song_windowed_uniqueness(song, word_counts, window_size):
+    """
+    Find the moving-average uniqueness of a song: the percentage of unique
+    words in every window of window_size words, averaged over all windows.
+
+    The uniqueness score of a whole song falls as the song gets longer, which
+    penalizes long and sung-through songs. Averaging over fixed-size windows
+    removes this effect. Rather than recounting every window, the word counts
+    are updated as the window slides forward one word at a time, so each song
+    only takes a single pass.
+
+    Args:
+        song: list of strings representing each word in the song.
+        word_counts: Counter of the number of times each word is in the song.
+        window_size: integer number of words in each window.
+    Returns:
+        Float percentage of unique words per window. Songs shorter than a
+            window get their whole-song percentage, and a song with no lyrics
+            gets 0.
+    """
+    if len(song) == 0:
+        return 0
+    if len(song) <= window_size:
+        return (len(word_counts) / len(song)) * 100
+
+    window_counts = Counter(song[:window_size])
+    total_unique = len(window_counts)
+
+    for index in range(window_size, len(song)):
+        # the word leaving the window is removed before the new word is added
+        leaving_word = song[index - window_size]
+        window_counts[leaving_word] -= 1
+        if window_counts[leaving_word] == 0:
+            del window_counts[leaving_word]
+        window_counts[song[index]] += 1
+        total_unique += len(window_counts)
+
+    num_windows = len(song) - window_size + 1
+    return (total_unique / (num_windows * window_size)) * 100
+
+
+@register_metric("TotalLyricCount", aggregate=sum)
+def song_total_lyrics(song, _):
+    """
+    Find the total number of words in a song.
+
+    Args:
+        song: list of strings representing each word in the song.
+    Returns:
+        Integer representing the number of words in the song.
+    """
+    return len(song)
+
+
+def _mtld_factors(song):
+    """
+    Count the MTLD factors in one direction through a song.
+
+    Words are added to a running segment until the segment's type-token ratio
+    drops to MTLD_THRESHOLD, at which point a factor is counted and a new
+    segment is started. The leftover segment counts as a partial factor.
+
+    Args:
+        song: list of strings representing each word in the song.
+    Returns:
+        Float number of factors in the song.
+    """
+    factors = 0.0
+    segment_words = set()
+    segment_length = 0
+
+    for word in song:
+        segment_words.add(word)
+        segment_length += 1
+        if len(segment_words) / segment_length <= MTLD_THRESHOLD:
+            factors += 1
+            segment_words = set()
+            segment_length = 0
+
+    if segment_length > 0:
+        segment_ratio = len(segment_words) / segment_length
+        factors += (1 - segment_ratio) / (1 - MTLD_THRESHOLD)
+
+    return factors
+
+
+@register_metric("MTLD")
+def song_mtld(song, _):
+    """
+    Find the measure of textual lexical diversity (MTLD) of a song.
+
+    Unlike the uniqueness score, MTLD does not fall as a song gets longer: it
+    is the average number of words it takes for the type-token ratio to drop
+    to MTLD_THRESHOLD, averaged over a forwards and a backwards pass.
+
+    Args:
+        song: list of strings representing each word in the song.
+    Returns:
+        Float MTLD of the song. A song that never repeats a word has no
+            factors, so its length is returned instead.
+    """
+    lengths = []
+    for direction in (song, song[::-1]):
+        factors = _mtld_factors(direction)
+        lengths.append(len(song) / factors if factors > 0 else len(song))
+    return sum(lengths) / 2
+
+
+@register_metric("HerdanC")
+def song_herdan_c(song, word_counts):
+    """
+    Find Herdan's C of a song, the logarithm of the number of unique words
+    divided by the logarithm of the total number of words.
+
+    Args:
+        song: list of strings representing each word in the song.
+        word_counts: Counter of the number of times each word is in the song.
+    Returns:
+        Float Herdan's C of the song, or 0 for a song with fewer than 2 words.
+    """
+    if len(song) < 2:
+        return 0
+    return math.log(len(word_counts)) / math.log(len(song))
+
+
+@register_metric("RepetitionDensity", aggregate=ratio_of_sums)
+def song_repetition(song, _):
+    """
+    Find how many words in a song are part of a repeated phrase, such as a
+    chorus or a repeated refrain.
+
+    A phrase is REPEATED_PHRASE_LENGTH words in a row, and a word is counted
+    as repeated if it is part of any phrase that appears more than once in the
+    song. The album's value is the fraction of all its words that are
+    repeated.
+
+    Args:
+        song: list of strings representing each word in the song.
+    Returns:
+        A tuple of integers containing the number of repeated words and the
+            total number of words in the song.
+    """
+    phrases = [
+        tuple(song[start : start + REPEATED_PHRASE_LENGTH])
+        for start in range(len(song) - REPEATED_PHRASE_LENGTH + 1)
+    ]
+    phrase_counts = Counter(phrases)
+
+    repeated = [False] * len(song)
+    for (start, phrase) in enumerate(phrases):
+        if phrase_counts[phrase] > 1:
+            for index in range(start, start + REPEATED_PHRASE_LENGTH):
+                repeated[index] = True
+
+    return (sum(repeated), len(song))
+
+
+@register_metric("HapaxCount", aggregate=count_album_hapaxes)
+def song_hapax_count(_, word_counts):
+    """
+    Find the number of times each word is used in a song, so that the hapax
+    legomena (words used exactly once) of the whole album can be counted.
+
+    Args:
+        word_counts: Counter of the number of times each word is in the song.
+    Returns:
+        Dictionary mapping each word in the song to the number of times it is
+            used.
+    """
+    return dict(word_counts)
+
+
+@register_metric("MeanWordLength", aggregate=ratio_of_sums)
+def song_word_length(song, _):
+    """
+    Find the total length of the words in a song, so that the album's average
+    word length can be found.
+
+    Args:
+        song: list of strings representing each word in the song.
+    Returns:
+        A tuple of integers containing the total number of characters and the
+            total number of words in the song.
+    """
+    return (sum(len(word) for word in song), len(song))
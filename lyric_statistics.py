@@ -0,0 +1,221 @@
+"""
+Functions to measure the relationship between a musical's lyrics and its
+success on Broadway, using the data in musical_scores.csv.
+
+For every pair of a lyric measure (such as UniquenessScore) and a performance
+measure (such as Attendance), the Pearson correlation is found along with a
+bootstrap confidence interval and a permutation test p-value. The thousands of
+resamples these need are all calculated at once with numpy arrays rather than
+one at a time, and a seeded random number generator makes every result
+reproducible.
+"""
+
+MUSICAL_SCORES_FILE = "musical_scores.csv"
+
+LYRIC_COLUMNS = ["UniquenessScore", "TotalLyricCount"]
+PERFORMANCE_COLUMNS = ["Attendance", "WeeksPerformed", "NumPerformances"]
+
+NUM_RESAMPLES = 10000
+CONFIDENCE_LEVEL = 0.95
+SEED = 0
+
+# Resamples are calculated in chunks of this many, so that memory use stays
+# bounded no matter how many resamples or shows there are.
+RESAMPLE_CHUNK_SIZE = 1000
+
+
+def row_correlations(x_values, y_values):
+    """
+    Find the Pearson correlation of each row of two arrays at once.
+
+    Args:
+        x_values: 2D numpy array, with one sample in each row.
+        y_values: 2D numpy array the same shape as x_values.
+    Returns:
+        1D numpy array with the correlation of each row. Rows where either
+            sample has no variation have a correlation of NaN.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    x_centered = x_values - x_values.mean(axis=1, keepdims=True)
+    y_centered = y_values - y_values.mean(axis=1, keepdims=True)
+    covariance = (x_centered * y_centered).sum(axis=1)
+    spread = np.sqrt(
+        (x_centered**2).sum(axis=1) * (y_centered**2).sum(axis=1)
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return covariance / spread
+
+
+def _iter_chunks(num_resamples):
+    """
+    Yield the number of resamples in each chunk.
+    """
+    for start in range(0, num_resamples, RESAMPLE_CHUNK_SIZE):
+        yield min(RESAMPLE_CHUNK_SIZE, num_resamples - start)
+
+
+def bootstrap_correlation(
+    x_values,
+    y_values,
+    random_generator,
+    num_resamples=NUM_RESAMPLES,
+    confidence_level=CONFIDENCE_LEVEL,
+):
+    """
+    Find a bootstrap confidence interval for the correlation of two samples.
+
+    Shows are resampled with replacement, and the interval is taken from the
+    percentiles of the resampled correlations.
+
+    Args:
+        x_values: 1D numpy array of values.
+        y_values: 1D numpy array of values, one for each value in x_values.
+        random_generator: numpy random Generator to resample with.
+        num_resamples: optional integer number of bootstrap resamples.
+        confidence_level: optional float, the fraction of resamples the
+            interval should contain.
+    Returns:
+        A tuple of floats containing the lower and upper end of the interval,
+            or NaN for both if no resample has a correlation (such as when
+            either sample has no variation).
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    all_correlations = []
+    for chunk_size in _iter_chunks(num_resamples):
+        indices = random_generator.integers(
+            0, len(x_values), size=(chunk_size, len(x_values))
+        )
+        all_correlations.append(
+            row_correlations(x_values[indices], y_values[indices])
+        )
+    all_correlations = np.concatenate(all_correlations)
+    if np.isnan(all_correlations).all():
+        return (float("nan"), float("nan"))
+
+    tail = (1 - confidence_level) / 2 * 100
+    (low, high) = np.nanpercentile(all_correlations, [tail, 100 - tail])
+    return (float(low), float(high))
+
+
+def permutation_test(
+    x_values, y_values, random_generator, num_resamples=NUM_RESAMPLES
+):
+    """
+    Find the two-sided permutation test p-value of the correlation of two
+    samples: how often shuffling y_values gives a correlation at least as
+    strong as the real one.
+
+    Args:
+        x_values: 1D numpy array of values.
+        y_values: 1D numpy array of values, one for each value in x_values.
+        random_generator: numpy random Generator to shuffle with.
+        num_resamples: optional integer number of permutations.
+    Returns:
+        Float p-value. One is added to both the count and the number of
+            permutations, so the p-value is never exactly zero. The p-value
+            is NaN if the samples have no correlation, such as when either
+            sample has no variation.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    observed = abs(
+        row_correlations(x_values[np.newaxis, :], y_values[np.newaxis, :])[0]
+    )
+    if np.isnan(observed):
+        return float("nan")
+
+    num_as_strong = 0
+    for chunk_size in _iter_chunks(num_resamples):
+        shuffled = random_generator.permuted(
+            np.tile(y_values, (chunk_size, 1)), axis=1
+        )
+        permuted_correlations = row_correlations(
+            np.tile(x_values, (chunk_size, 1)), shuffled
+        )
+        num_as_strong += int(
+            (np.abs(permuted_correlations) >= observed - 1e-12).sum()
+        )
+
+    return (num_as_strong + 1) / (num_resamples + 1)
+
+
+def analyze_relationships(
+    musical_scores_file=MUSICAL_SCORES_FILE,
+    lyric_columns=None,
+    performance_columns=None,
+    num_resamples=NUM_RESAMPLES,
+    seed=SEED,
+):
+    """
+    Find the correlation, bootstrap confidence interval and permutation test
+    p-value between every lyric measure and every performance measure.
+
+    Args:
+        musical_scores_file: optional string specifying input file path.
+            Defaults to the default output of
+            compile_data.find_all_uniqueness_scores.
+        lyric_columns: optional list of strings naming the lyric measures.
+            Defaults to LYRIC_COLUMNS.
+        performance_columns: optional list of strings naming the performance
+            measures. Defaults to PERFORMANCE_COLUMNS.
+        num_resamples: optional integer number of bootstrap resamples and
+            permutations for each pair.
+        seed: optional integer seed for the random number generator, so the
+            same results are found on every run.
+    Returns:
+        A pandas dataframe with one row for each pair of measures, and the
+            columns LyricMetric, PerformanceMetric, NumShows, Correlation,
+            CILow, CIHigh and PValue.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+    import pandas as pd
+
+    if lyric_columns is None:
+        lyric_columns = LYRIC_COLUMNS
+    if performance_columns is None:
+        performance_columns = PERFORMANCE_COLUMNS
+
+    with open(musical_scores_file, "r", encoding="utf-8") as file:
+        musical_scores = pd.read_csv(file)
+
+    random_generator = np.random.default_rng(seed)
+    all_results = []
+
+    for lyric_column in lyric_columns:
+        for performance_column in performance_columns:
+            # shows missing either value are left out of this pair only
+            pair_data = musical_scores[
+                [lyric_column, performance_column]
+            ].dropna()
+            x_values = pair_data[lyric_column].to_numpy(dtype=float)
+            y_values = pair_data[performance_column].to_numpy(dtype=float)
+
+            correlation = row_correlations(
+                x_values[np.newaxis, :], y_values[np.newaxis, :]
+            )[0]
+            (ci_low, ci_high) = bootstrap_correlation(
+                x_values, y_values, random_generator, num_resamples
+            )
+            p_value = permutation_test(
+                x_values, y_values, random_generator, num_resamples
+            )
+
+            all_results.append(
+                {
+                    "LyricMetric": lyric_column,
+                    "PerformanceMetric": performance_column,
+                    "NumShows": len(pair_data),
+                    "Correlation": float(correlation),
+                    "CILow": ci_low,
+                    "CIHigh": ci_high,
+                    "PValue": p_value,
+                }
+            )
+
+    return pd.DataFrame(all_results)
@@ -0,0 +1,690 @@
+"""
+Compressed storage for the lyrics in the lyrics directory, as an alternative
+to one word per cell CSV files.
+
+Every word in the corpus is given a number, with the most common words given
+the smallest numbers, and each album is stored as the numbers of its words.
+Most words then take a single byte, and the numbers are compressed again with
+zstd (or zlib, if the zstandard package is not installed) using a dictionary
+trained on the whole corpus, so that even short albums compress well. The
+vocabulary and the trained dictionary are shared by every album and kept in
+one dictionary file next to the albums.
+
+Each album is kept in its own {album_id}.lyz file, so one album can be read
+without reading any other. The album's words are compressed as one frame,
+which compresses better than one frame per song, and a small header lists
+where each song starts in the decompressed numbers. Reading one song still
+decompresses its whole album, but only the song's own numbers are turned back
+into words. Decoding is done with numpy for a whole album at a time, which is
+faster than parsing the album's CSV file.
+
+Words that are not in the shared vocabulary are kept in the album's own
+header, so an album downloaded after the dictionary was built can be added
+with write_album and the existing dictionary. compress_corpus instead builds a
+new dictionary from every album, decoding the albums that are already
+compressed and compressing them again with it.
+
+Every album's header holds the checksum of the dictionary it was compressed
+with. While compress_corpus replaces the albums, both the old and the new
+dictionary are kept under names that include their checksums, and each album
+is read with the dictionary named in its header, so every album stays
+readable even if the run stops partway through. Every file is written to a
+temporary file first and then replaces the old one, so no file is ever left
+partly written.
+
+The CSV lyrics of every album can be compressed from the command line, which
+can be run again whenever new albums have been downloaded:
+
+    python lyric_storage.py --remove-csv
+"""
+
+import argparse
+import csv
+import functools
+import glob
+import hashlib
+import lzma
+import os
+import struct
+import sys
+import zlib
+from collections import Counter
+import genius_lyrics as lyrics
+
+
+DICTIONARY_FILE = "lyrics.dict"
+COMPRESSED_EXTENSION = ".lyz"
+
+# The most bytes in the trained compression dictionary. zlib can not use more
+# than 32 KiB.
+DICTIONARY_SIZE = 32768
+
+ZSTD_LEVEL = 19
+ZLIB_LEVEL = 9
+
+_ALBUM_MAGIC = b"LYZ1"
+_DICTIONARY_MAGIC = b"LYD1"
+_CODECS = {"zstd": b"s", "zlib": b"z"}
+
+# Album header: magic, codec, dictionary checksum, number of songs and length
+# of the album's own words.
+_ALBUM_HEADER = struct.Struct("<4sc8sII")
+# Dictionary header: magic, codec, length of the vocabulary and length of the
+# compression dictionary.
+_DICTIONARY_HEADER = struct.Struct("<4scII")
+
+
+def get_default_codec():
+    """
+    Find the best compression codec that can be used.
+
+    Returns:
+        "zstd" if the zstandard package is installed, or "zlib" if not.
+    """
+    try:
+        # pylint: disable=import-outside-toplevel,unused-import
+        import zstandard  # noqa: F401
+    except ModuleNotFoundError:
+        return "zlib"
+    return "zstd"
+
+
+def _import_zstandard():
+    """
+    Import zstandard, explaining how to fix a missing package.
+    """
+    try:
+        # pylint: disable=import-outside-toplevel
+        import zstandard
+    except ModuleNotFoundError as error:
+        raise ModuleNotFoundError(
+            "These lyrics were compressed with zstd. Install the zstandard "
+            "package to read them."
+        ) from error
+    return zstandard
+
+
+def get_dictionary_file(lyrics_directory=None, checksum=None):
+    """
+    Find the file path of the shared dictionary.
+
+    Args:
+        lyrics_directory: optional string representing the directory the
+            lyrics are kept in. Defaults to genius_lyrics.LYRICS_DIRECTORY.
+        checksum: optional bytes of a dictionary's checksum, to find the copy
+            of that dictionary kept while compress_corpus replaces the
+            albums. Defaults to the current dictionary.
+    Returns:
+        String representing the file path of the dictionary.
+    """
+    if lyrics_directory is None:
+        lyrics_directory = lyrics.LYRICS_DIRECTORY
+    if checksum is None:
+        return os.path.join(lyrics_directory, DICTIONARY_FILE)
+    (name, extension) = os.path.splitext(DICTIONARY_FILE)
+    return os.path.join(
+        lyrics_directory, f"{name}.{checksum.hex()}{extension}"
+    )
+
+
+def get_compressed_file(album_id, lyrics_directory=None):
+    """
+    Find the file path of an album's compressed lyrics.
+
+    Args:
+        album_id: the album's numerical Genius ID.
+        lyrics_directory: optional string representing the directory the
+            lyrics are kept in. Defaults to genius_lyrics.LYRICS_DIRECTORY.
+    Returns:
+        String representing the file path of the album's compressed lyrics.
+    """
+    if lyrics_directory is None:
+        lyrics_directory = lyrics.LYRICS_DIRECTORY
+    return os.path.join(lyrics_directory, f"{album_id}{COMPRESSED_EXTENSION}")
+
+
+def _encode_numbers(numbers):
+    """
+    Encode whole numbers as variable length bytes (7 bits per byte, with the
+    top bit set on every byte but the last of each number).
+    """
+    encoded = bytearray()
+    for number in numbers:
+        while number >= 0x80:
+            encoded.append((number & 0x7F) | 0x80)
+            number >>= 7
+        encoded.append(number)
+    return bytes(encoded)
+
+
+def _decode_numbers(encoded):
+    """
+    Decode every number in variable length bytes at once with numpy.
+
+    Returns:
+        A tuple of a numpy array of the numbers and a numpy array of the index
+            of the last byte of each number.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    all_bytes = np.frombuffer(encoded, dtype=np.uint8)
+    last_bytes = np.flatnonzero(all_bytes < 0x80)
+    first_bytes = np.concatenate(([0], last_bytes[:-1] + 1))
+    lengths = last_bytes - first_bytes + 1
+    values = (all_bytes & 0x7F).astype(np.int64)
+
+    numbers = values[first_bytes]
+    for position in range(1, int(lengths.max(initial=1))):
+        longer = lengths > position
+        numbers[longer] |= values[first_bytes[longer] + position] << (
+            7 * position
+        )
+    return (numbers, last_bytes)
+
+
+def _create_compressor(dictionary):
+    """
+    Create a function that compresses bytes with a dictionary's codec.
+    """
+    if dictionary["codec"] == "zstd":
+        zstandard = _import_zstandard()
+        compressor = zstandard.ZstdCompressor(
+            level=ZSTD_LEVEL,
+            dict_data=zstandard.ZstdCompressionDict(dictionary["trained"]),
+        )
+        return compressor.compress
+
+    def compress(data):
+        compressor = zlib.compressobj(ZLIB_LEVEL, zdict=dictionary["trained"])
+        return compressor.compress(data) + compressor.flush()
+
+    return compress
+
+
+def _decompress(dictionary, data):
+    """
+    Decompress bytes compressed with a dictionary's codec.
+    """
+    if dictionary["codec"] == "zstd":
+        zstandard = _import_zstandard()
+        decompressor = zstandard.ZstdDecompressor(
+            dict_data=zstandard.ZstdCompressionDict(dictionary["trained"])
+        )
+        return decompressor.decompress(data)
+
+    decompressor = zlib.decompressobj(zdict=dictionary["trained"])
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def _train_dictionary(codec, samples):
+    """
+    Train a compression dictionary on the encoded albums of the corpus.
+
+    Returns:
+        Bytes of the trained dictionary.
+    """
+    if codec == "zstd":
+        zstandard = _import_zstandard()
+        try:
+            return zstandard.train_dictionary(
+                DICTIONARY_SIZE, samples, level=ZSTD_LEVEL
+            ).as_bytes()
+        except zstandard.ZstdError:
+            # corpora too small to train on use their content directly, as
+            # zlib does
+            pass
+
+    # zlib can only use the content of the dictionary as it is, and finds
+    # repeats at the end of the dictionary most cheaply
+    return b"".join(samples)[-DICTIONARY_SIZE:]
+
+
+def _create_dictionary(codec, vocabulary, trained):
+    """
+    Create a shared dictionary from its codec, vocabulary and trained
+    compression dictionary. The arguments and returned keys are described in
+    build_dictionary.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    return {
+        "codec": codec,
+        "vocabulary": vocabulary,
+        "numbers": {word: number for (number, word) in enumerate(vocabulary)},
+        "trained": trained,
+        # an array of the words, so numbers can be turned into words at once
+        "words": np.array(vocabulary, dtype=object),
+        # kept in every album, so an album is never decoded with the wrong
+        # dictionary
+        "checksum": hashlib.sha256(
+            "\n".join(vocabulary).encode("utf-8") + trained
+        ).digest()[:8],
+    }
+
+
+def build_dictionary(all_album_lyrics, codec=None):
+    """
+    Build a shared dictionary from the lyrics of a corpus.
+
+    Args:
+        all_album_lyrics: list of albums, each a list of lists of strings with
+            each embedded list containing each word in the lyrics of one of
+            the album's songs.
+        codec: optional string, "zstd" or "zlib". Defaults to zstd if the
+            zstandard package is installed.
+    Returns:
+        Dictionary with the keys "codec", "vocabulary" (the list of every
+            word, most common first), "numbers" (mapping each word to its
+            number), "trained" (bytes of the compression dictionary), "words"
+            (a numpy array of the vocabulary) and "checksum".
+    """
+    if codec is None:
+        codec = get_default_codec()
+
+    word_counts = Counter(
+        word for album in all_album_lyrics for song in album for word in song
+    )
+    # ties are broken alphabetically, so the same corpus always gives the same
+    # vocabulary
+    vocabulary = [
+        sys.intern(word)
+        for (word, _) in sorted(
+            word_counts.items(), key=lambda item: (-item[1], item[0])
+        )
+    ]
+    numbers = {word: number for (number, word) in enumerate(vocabulary)}
+
+    # the compression dictionary is trained on the encoded albums, since that
+    # is what it will compress
+    samples = [
+        _encode_numbers(numbers[word] for song in album for word in song)
+        for album in all_album_lyrics
+    ]
+    return _create_dictionary(
+        codec, vocabulary, _train_dictionary(codec, samples)
+    )
+
+
+def save_dictionary(dictionary, dictionary_file):
+    """
+    Save a shared dictionary to a file.
+
+    Args:
+        dictionary: dictionary returned by build_dictionary.
+        dictionary_file: string specifying output file path.
+    Returns:
+        Nothing.
+    """
+    # the vocabulary is only read once per run, so it is compressed as much
+    # as possible rather than as quickly as possible
+    vocabulary = lzma.compress(
+        "\n".join(dictionary["vocabulary"]).encode("utf-8"),
+        preset=9 | lzma.PRESET_EXTREME,
+    )
+    with lyrics.replace_file(dictionary_file, "wb") as file:
+        file.write(
+            _DICTIONARY_HEADER.pack(
+                _DICTIONARY_MAGIC,
+                _CODECS[dictionary["codec"]],
+                len(vocabulary),
+                len(dictionary["trained"]),
+            )
+        )
+        file.write(vocabulary)
+        file.write(dictionary["trained"])
+
+
+@functools.lru_cache(maxsize=8)
+def _load_dictionary_cached(dictionary_file, _modified_time):
+    """
+    Load a shared dictionary, cached until the file is modified.
+    """
+    with open(dictionary_file, "rb") as file:
+        (magic, codec, vocabulary_length, trained_length) = (
+            _DICTIONARY_HEADER.unpack(file.read(_DICTIONARY_HEADER.size))
+        )
+        if magic != _DICTIONARY_MAGIC:
+            raise ValueError(f"{dictionary_file} is not a lyrics dictionary.")
+        vocabulary_text = lzma.decompress(file.read(vocabulary_length))
+        trained = file.read(trained_length)
+
+    vocabulary = [
+        sys.intern(word)
+        for word in vocabulary_text.decode("utf-8").split("\n")
+    ]
+    if vocabulary == [""]:
+        vocabulary = []
+
+    codec_names = {value: name for (name, value) in _CODECS.items()}
+    return _create_dictionary(codec_names[codec], vocabulary, trained)
+
+
+def load_dictionary(dictionary_file=None):
+    """
+    Load a shared dictionary from a file. The dictionary is only read again
+    if the file has been modified since it was last loaded.
+
+    Args:
+        dictionary_file: optional string specifying input file path. Defaults
+            to the dictionary in the lyrics directory.
+    Returns:
+        Dictionary as returned by build_dictionary.
+    """
+    if dictionary_file is None:
+        dictionary_file = get_dictionary_file()
+    return _load_dictionary_cached(
+        dictionary_file, os.stat(dictionary_file).st_mtime_ns
+    )
+
+
+def write_album(album_id, all_album_lyrics, dictionary, lyrics_directory=None):
+    """
+    Compress an album's lyrics to its .lyz file.
+
+    Args:
+        album_id: the album's numerical Genius ID.
+        all_album_lyrics: list of lists of strings, which each embedded list
+            containing each word in the lyrics of one of the album's songs.
+        dictionary: dictionary returned by build_dictionary or
+            load_dictionary.
+        lyrics_directory: optional string representing the directory to save
+            the album to. Defaults to genius_lyrics.LYRICS_DIRECTORY.
+    Returns:
+        String representing the file path of the compressed album.
+    """
+    numbers = dictionary["numbers"]
+    own_words = {}
+
+    # words missing from the shared vocabulary are numbered after it
+    def get_number(word):
+        if word in numbers:
+            return numbers[word]
+        if word not in own_words:
+            own_words[word] = len(numbers) + len(own_words)
+        return own_words[word]
+
+    all_songs = [
+        _encode_numbers(get_number(word) for word in song)
+        for song in all_album_lyrics
+    ]
+    song_offsets = [0]
+    for song in all_songs:
+        song_offsets.append(song_offsets[-1] + len(song))
+    own_vocabulary = "\n".join(own_words).encode("utf-8")
+
+    file_path = get_compressed_file(album_id, lyrics_directory)
+    with lyrics.replace_file(file_path, "wb") as file:
+        file.write(
+            _ALBUM_HEADER.pack(
+                _ALBUM_MAGIC,
+                _CODECS[dictionary["codec"]],
+                dictionary["checksum"],
+                len(all_songs),
+                len(own_vocabulary),
+            )
+        )
+        file.write(struct.pack(f"<{len(song_offsets)}I", *song_offsets))
+        file.write(own_vocabulary)
+        file.write(_create_compressor(dictionary)(b"".join(all_songs)))
+
+    return file_path
+
+
+def _load_album_dictionary(checksum, lyrics_directory):
+    """
+    Load the dictionary an album was compressed with: the copy named by its
+    checksum if compress_corpus is replacing the albums (or stopped before it
+    finished), or the current dictionary otherwise.
+    """
+    dictionary_file = get_dictionary_file(lyrics_directory, checksum)
+    if not os.path.exists(dictionary_file):
+        dictionary_file = get_dictionary_file(lyrics_directory)
+    return load_dictionary(dictionary_file)
+
+
+def _read_album_file(file_path, dictionary, lyrics_directory):
+    """
+    Read and decompress a .lyz file. If dictionary is None, the dictionary
+    named in the file's header is loaded from lyrics_directory.
+
+    Returns:
+        A tuple of the list of the byte offset of each song, the album's own
+            words, the decompressed numbers of every word and the dictionary
+            used.
+    """
+    with open(file_path, "rb") as file:
+        contents = file.read()
+
+    (magic, _, checksum, num_songs, own_length) = _ALBUM_HEADER.unpack_from(
+        contents
+    )
+    if magic != _ALBUM_MAGIC:
+        raise ValueError(f"{file_path} is not a compressed lyrics file.")
+    if dictionary is None:
+        dictionary = _load_album_dictionary(checksum, lyrics_directory)
+    if checksum != dictionary["checksum"]:
+        raise ValueError(
+            f"{file_path} was compressed with a different dictionary."
+        )
+
+    position = _ALBUM_HEADER.size
+    song_offsets = list(
+        struct.unpack_from(f"<{num_songs + 1}I", contents, position)
+    )
+    position += 4 * (num_songs + 1)
+    own_words = contents[position : position + own_length].decode("utf-8")
+    position += own_length
+
+    encoded = _decompress(dictionary, contents[position:])
+    own_words = own_words.split("\n") if own_words else []
+    return (song_offsets, own_words, encoded, dictionary)
+
+
+def _decode_words(encoded, own_words, dictionary):
+    """
+    Turn encoded numbers back into words.
+
+    Returns:
+        A tuple of a list of the words and a numpy array of the index of the
+            last byte of each word.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    (numbers, last_bytes) = _decode_numbers(encoded)
+    words = dictionary["words"]
+    if own_words:
+        own_words = [sys.intern(word) for word in own_words]
+        words = np.concatenate((words, np.array(own_words, dtype=object)))
+    return (words[numbers].tolist(), last_bytes)
+
+
+def read_album(album_id, dictionary=None, lyrics_directory=None):
+    """
+    Read every song of a compressed album, in the same format as
+    genius_lyrics.iter_album_songs.
+
+    Args:
+        album_id: the album's numerical Genius ID.
+        dictionary: optional dictionary returned by load_dictionary. Defaults
+            to the dictionary the album was compressed with, in the lyrics
+            directory.
+        lyrics_directory: optional string representing the directory the
+            album is kept in. Defaults to genius_lyrics.LYRICS_DIRECTORY.
+    Returns:
+        List of tuples of strings, one for each song on the album in order.
+            Every word is interned.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    (song_offsets, own_words, encoded, dictionary) = _read_album_file(
+        get_compressed_file(album_id, lyrics_directory),
+        dictionary,
+        lyrics_directory,
+    )
+    if not encoded:
+        return [() for _ in song_offsets[1:]]
+    (all_words, last_bytes) = _decode_words(encoded, own_words, dictionary)
+
+    # each song's byte offset is turned into the index of its first word
+    word_offsets = np.searchsorted(last_bytes, song_offsets).tolist()
+    return [
+        tuple(all_words[start:end])
+        for (start, end) in zip(word_offsets[:-1], word_offsets[1:])
+    ]
+
+
+def read_song(album_id, song_index, dictionary=None, lyrics_directory=None):
+    """
+    Read one song of a compressed album. The whole album is decompressed,
+    but only the song's own numbers are turned back into words.
+
+    Args:
+        album_id: the album's numerical Genius ID.
+        song_index: integer position of the song on the album, from 0.
+        dictionary: optional dictionary returned by load_dictionary. Defaults
+            to the dictionary the album was compressed with, in the lyrics
+            directory.
+        lyrics_directory: optional string representing the directory the
+            album is kept in. Defaults to genius_lyrics.LYRICS_DIRECTORY.
+    Returns:
+        Tuple of strings for each word in the song.
+    Raises:
+        IndexError: if the album has no song at song_index.
+    """
+    (song_offsets, own_words, encoded, dictionary) = _read_album_file(
+        get_compressed_file(album_id, lyrics_directory),
+        dictionary,
+        lyrics_directory,
+    )
+    if not 0 <= song_index < len(song_offsets) - 1:
+        raise IndexError(f"Album {album_id} has no song {song_index}.")
+
+    (start, end) = song_offsets[song_index : song_index + 2]
+    song_bytes = encoded[start:end]
+    if not song_bytes:
+        return ()
+    return tuple(_decode_words(song_bytes, own_words, dictionary)[0])
+
+
+def compress_corpus(lyrics_directory=None, codec=None, remove_csv=False):
+    """
+    Compress the lyrics of every album in a lyrics directory with a new shared
+    dictionary built from all of them.
+
+    Albums that were compressed by an earlier run (and no longer have a CSV
+    file) are decoded with the old dictionary and compressed again with the
+    new one, so they can still be read. An album with both a CSV file and a
+    compressed file is compressed from its CSV file.
+
+    Until every album has been replaced, the old and new dictionaries are both
+    kept under names that include their checksums, so if the run stops
+    partway through every album can still be read, and running it again
+    finishes the job.
+
+    Args:
+        lyrics_directory: optional string representing the directory the
+            lyrics are kept in. Defaults to genius_lyrics.LYRICS_DIRECTORY.
+        codec: optional string, "zstd" or "zlib". Defaults to zstd if the
+            zstandard package is installed.
+        remove_csv: optional boolean, True to delete each CSV file once its
+            album has been compressed.
+    Returns:
+        Dictionary with the keys "csv_bytes" (the total size of the CSV files)
+            and "compressed_bytes" (the total size of the compressed files,
+            including the shared dictionary).
+    """
+    if lyrics_directory is None:
+        lyrics_directory = lyrics.LYRICS_DIRECTORY
+
+    csv_files = sorted(glob.glob(os.path.join(lyrics_directory, "*.csv")))
+    all_albums = {}
+    for csv_file in csv_files:
+        album_id = os.path.splitext(os.path.basename(csv_file))[0]
+        with open(csv_file, "r", encoding="utf-8") as file:
+            all_albums[album_id] = list(csv.reader(file))
+
+    dictionary_file = get_dictionary_file(lyrics_directory)
+    if os.path.exists(dictionary_file):
+        # the current dictionary is kept under its checksum too, so the
+        # albums compressed with it can be read until they are all replaced
+        old_dictionary = load_dictionary(dictionary_file)
+        old_dictionary_file = get_dictionary_file(
+            lyrics_directory, old_dictionary["checksum"]
+        )
+        if not os.path.exists(old_dictionary_file):
+            save_dictionary(old_dictionary, old_dictionary_file)
+
+    compressed_pattern = f"*{COMPRESSED_EXTENSION}"
+    for compressed_file in sorted(
+        glob.glob(os.path.join(lyrics_directory, compressed_pattern))
+    ):
+        album_id = os.path.splitext(os.path.basename(compressed_file))[0]
+        if album_id not in all_albums:
+            # each album is decoded with the dictionary it was compressed
+            # with, which differs between albums if an earlier run stopped
+            # partway through
+            all_albums[album_id] = [
+                list(song)
+                for song in read_album(album_id, None, lyrics_directory)
+            ]
+
+    dictionary = build_dictionary(list(all_albums.values()), codec)
+
+    new_dictionary_file = get_dictionary_file(
+        lyrics_directory, dictionary["checksum"]
+    )
+    save_dictionary(dictionary, new_dictionary_file)
+    for (album_id, album_lyrics) in all_albums.items():
+        write_album(album_id, album_lyrics, dictionary, lyrics_directory)
+    save_dictionary(dictionary, dictionary_file)
+
+    # once every album uses the current dictionary, the copies kept by
+    # checksum are no longer needed
+    (name, extension) = os.path.splitext(DICTIONARY_FILE)
+    for checksum_file in glob.glob(
+        os.path.join(lyrics_directory, f"{name}.*{extension}")
+    ):
+        os.remove(checksum_file)
+
+    sizes = {
+        "csv_bytes": sum(os.path.getsize(path) for path in csv_files),
+        "compressed_bytes": os.path.getsize(dictionary_file)
+        + sum(
+            os.path.getsize(get_compressed_file(album_id, lyrics_directory))
+            for album_id in all_albums
+        ),
+    }
+    if remove_csv:
+        for csv_file in csv_files:
+            os.remove(csv_file)
+
+    return sizes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compress the CSV lyrics of every album."
+    )
+    parser.add_argument(
+        "--codec",
+        choices=sorted(_CODECS),
+        help="compression codec, defaults to zstd if it is installed",
+    )
+    parser.add_argument(
+        "--remove-csv",
+        action="store_true",
+        help="delete each CSV file once its album is compressed",
+    )
+    arguments = parser.parse_args()
+
+    all_sizes = compress_corpus(
+        codec=arguments.codec, remove_csv=arguments.remove_csv
+    )
+    print(
+        f"{all_sizes['csv_bytes']} bytes of CSV lyrics compressed to "
+        f"{all_sizes['compressed_bytes']} bytes."
+    )
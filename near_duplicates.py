@@ -0,0 +1,294 @@
+"""
+Functions to find near-duplicate songs (such as reprises, alternate
+recordings and duplicated tracks) within and across albums.
+
+Across the corpus, two songs are near-duplicates if most of their phrases are
+shared (their Jaccard similarity is high), as with alternate recordings and
+duplicated tracks. Within an album, a reprise usually repeats only part of a
+song, which shares few phrases with the song as a whole, so songs are instead
+near-duplicates if most of the shorter song's phrases are in the other song
+(their containment is high).
+
+Comparing every pair of songs in the corpus takes time proportional to the
+square of the number of songs. Instead, each song is summarized by a MinHash
+signature, and signatures are grouped with locality-sensitive hashing (LSH):
+each signature is split into bands, and only songs that share an identical band
+are compared. Songs that are similar are very likely to share a band, while
+dissimilar songs rarely do, so only a small number of pairs are ever compared.
+
+numpy is only imported once a signature is calculated, so importing this module
+stays fast.
+"""
+
+import zlib
+import instrumentation
+
+
+# The number of hash functions in each MinHash signature, and the number of
+# bands each signature is split into for LSH. With 16 bands of 8 rows, pairs
+# of songs sharing about 70% of their phrases or more are very likely to be
+# compared.
+NUM_PERMUTATIONS = 128
+NUM_BANDS = 16
+
+# The number of words in each phrase (shingle) compared between songs.
+SHINGLE_LENGTH = 3
+
+# The estimated fraction of phrases two songs must share to be near-duplicates.
+SIMILARITY_THRESHOLD = 0.8
+
+# The fraction of the shorter song's phrases that must be in the other song
+# for two songs on the same album to be near-duplicates.
+CONTAINMENT_THRESHOLD = 0.8
+
+# The hash functions are of the form (a * x + b) % prime, where x is a 32-bit
+# hash of a phrase. This prime is the largest below 2 ** 32, which keeps every
+# calculation within 64 bits.
+_PRIME = 4294967291
+_SEED = 1
+
+
+def _get_hash_parameters():
+    """
+    Create the parameters of the MinHash hash functions. A fixed seed is used
+    so that signatures can be compared between runs.
+
+    Returns:
+        A tuple of two numpy arrays of integers, the a and b parameter of each
+            hash function.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    random_generator = np.random.default_rng(_SEED)
+    hash_a = random_generator.integers(1, _PRIME, NUM_PERMUTATIONS)
+    hash_b = random_generator.integers(0, _PRIME, NUM_PERMUTATIONS)
+    return (hash_a.astype(np.uint64), hash_b.astype(np.uint64))
+
+
+_hash_parameters = []
+
+
+def get_shingles(song):
+    """
+    Break a song into overlapping phrases of SHINGLE_LENGTH words. Songs
+    shorter than a phrase are treated as one phrase.
+
+    Args:
+        song: list of strings representing each word in the song.
+    Returns:
+        Set of the 32-bit hash of each distinct phrase in the song.
+    """
+    num_shingles = max(len(song) - SHINGLE_LENGTH + 1, 1)
+    return {
+        zlib.crc32(" ".join(song[start : start + SHINGLE_LENGTH]).encode())
+        for start in range(num_shingles)
+    }
+
+
+def containment(first_shingles, second_shingles):
+    """
+    Find the fraction of the shorter song's phrases that are also in the
+    other song. A reprise of part of a song is contained in the song even
+    though the two share few of the song's phrases.
+
+    Args:
+        first_shingles: set returned by get_shingles.
+        second_shingles: set returned by get_shingles.
+    Returns:
+        Float between 0 and 1.
+    """
+    shorter_length = min(len(first_shingles), len(second_shingles))
+    if shorter_length == 0:
+        return 0.0
+    return len(first_shingles & second_shingles) / shorter_length
+
+
+def minhash_signature(song):
+    """
+    Calculate the MinHash signature of a song.
+
+    The song is broken into overlapping phrases of SHINGLE_LENGTH words. For
+    each hash function, the signature keeps the smallest hash of any phrase.
+    The fraction of hash functions for which two songs' signatures match
+    estimates the fraction of phrases the songs share (their Jaccard
+    similarity).
+
+    Args:
+        song: list of strings representing each word in the song.
+    Returns:
+        A numpy array of NUM_PERMUTATIONS integers, or None for a song with no
+            lyrics.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    if len(song) == 0:
+        return None
+
+    if not _hash_parameters:
+        _hash_parameters.extend(_get_hash_parameters())
+    (hash_a, hash_b) = _hash_parameters
+
+    unique_shingles = get_shingles(song)
+    shingle_hashes = np.fromiter(
+        unique_shingles, dtype=np.uint64, count=len(unique_shingles)
+    )
+
+    # every hash function is applied to every phrase at once, giving a table
+    # with one row per hash function
+    all_hashes = (
+        np.outer(hash_a, shingle_hashes) + hash_b[:, np.newaxis]
+    ) % np.uint64(_PRIME)
+    return all_hashes.min(axis=1)
+
+
+def estimate_similarity(first_signature, second_signature):
+    """
+    Estimate the fraction of phrases two songs share from their signatures.
+
+    Args:
+        first_signature: numpy array returned by minhash_signature.
+        second_signature: numpy array returned by minhash_signature.
+    Returns:
+        Float between 0 and 1.
+    """
+    return float((first_signature == second_signature).mean())
+
+
+def _get_bands(signature):
+    """
+    Split a signature into NUM_BANDS bands, each identified by its band number
+    and the bytes of its rows.
+    """
+    rows_per_band = NUM_PERMUTATIONS // NUM_BANDS
+    return [
+        (band, signature[band * rows_per_band : (band + 1) * rows_per_band])
+        for band in range(NUM_BANDS)
+    ]
+
+
+def create_lsh_index():
+    """
+    Create an empty LSH index.
+
+    Returns:
+        Dictionary with the keys "buckets" (mapping each band to the keys of
+            the songs with that band) and "signatures" (mapping each song's key
+            to its signature).
+    """
+    return {"buckets": {}, "signatures": {}}
+
+
+def add_to_index(index, key, signature):
+    """
+    Add a song's signature to an LSH index.
+
+    Args:
+        index: dictionary returned by create_lsh_index.
+        key: a unique key for the song, such as a tuple of its album ID and its
+            position on the album.
+        signature: numpy array returned by minhash_signature.
+    Returns:
+        Nothing.
+    """
+    index["signatures"][key] = signature
+    for (band, rows) in _get_bands(signature):
+        index["buckets"].setdefault((band, rows.tobytes()), []).append(key)
+
+
+def query_index(index, signature, threshold=SIMILARITY_THRESHOLD):
+    """
+    Find the songs in an LSH index that are near-duplicates of a song.
+
+    Only songs sharing at least one band with the song are compared.
+
+    Args:
+        index: dictionary returned by create_lsh_index.
+        signature: numpy array returned by minhash_signature.
+        threshold: optional float, the estimated similarity at or above which
+            songs are near-duplicates.
+    Returns:
+        List of tuples containing the key and estimated similarity of each
+            near-duplicate song.
+    """
+    candidates = set()
+    for (band, rows) in _get_bands(signature):
+        candidates.update(index["buckets"].get((band, rows.tobytes()), []))
+
+    near_duplicates = []
+    for key in candidates:
+        similarity = estimate_similarity(signature, index["signatures"][key])
+        if similarity >= threshold:
+            near_duplicates.append((key, similarity))
+    return near_duplicates
+
+
+def find_near_duplicates(corpus, threshold=SIMILARITY_THRESHOLD):
+    """
+    Find every pair of near-duplicate songs within and across albums.
+
+    Args:
+        corpus: iterable of tuples containing an album ID and a song, such as
+            genius_lyrics.iter_corpus. Only one song is held in memory at a
+            time; just its signature is kept.
+        threshold: optional float, the estimated similarity at or above which
+            songs are near-duplicates.
+    Returns:
+        List of tuples, one for each pair of near-duplicate songs, containing
+            the key of the earlier song, the key of the later song and their
+            estimated similarity. Each key is a tuple of the song's album ID
+            and its position on the album (counting from 0).
+    """
+    index = create_lsh_index()
+    song_positions = {}
+    all_pairs = []
+
+    for (album_id, song) in corpus:
+        position = song_positions.get(album_id, 0)
+        song_positions[album_id] = position + 1
+        signature = minhash_signature(song)
+        if signature is None:
+            continue
+
+        key = (album_id, position)
+        for (earlier_key, similarity) in query_index(
+            index, signature, threshold
+        ):
+            all_pairs.append((earlier_key, key, similarity))
+        add_to_index(index, key, signature)
+
+    return sorted(all_pairs)
+
+
+def iter_unique_songs(all_album_lyrics, threshold=CONTAINMENT_THRESHOLD):
+    """
+    Yield the songs of an album, skipping any song that is a near-duplicate
+    of an earlier song on the album, such as a reprise of part of it.
+
+    An album has few enough songs that each song's phrases are compared with
+    those of every earlier song directly, rather than through an LSH index.
+
+    Args:
+        all_album_lyrics: list (or iterator) of lists of strings, which each
+            embedded list containing each word in the lyrics of one of the
+            album's songs.
+        threshold: optional float, the containment at or above which songs
+            are near-duplicates.
+    Yields:
+        Each song that is not a near-duplicate of an earlier song, in order.
+            Songs with no lyrics are always kept.
+    """
+    all_kept_shingles = []
+
+    for song in all_album_lyrics:
+        if len(song) > 0:
+            shingles = get_shingles(song)
+            if any(
+                containment(shingles, kept_shingles) >= threshold
+                for kept_shingles in all_kept_shingles
+            ):
+                instrumentation.count("songs.duplicates_excluded")
+                continue
+            all_kept_shingles.append(shingles)
+        yield song
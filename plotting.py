@@ -0,0 +1,190 @@
+"""
+Functions to draw the project's predefined plots, and to render all of them
+headlessly to image files (such as the graphs in essay_images) without a
+display.
+
+Headless rendering uses Matplotlib's Agg canvas directly rather than pyplot,
+so it never blocks on plt.show() and works on machines with no display.
+"""
+
+import os
+import instrumentation
+
+
+SCORE_DATAFRAME_FILE = "score_dataframe.csv"
+MUSICAL_SCORES_FILE = "musical_scores.csv"
+OUTPUT_DIRECTORY = "essay_images"
+
+
+def draw_unique_attendance(axes, scores_dataframe):
+    """
+    Draw the average attendance for each lyrical uniqueness score. The lyrical
+    uniqueness score is along the x-axis and the average attendance is along
+    the y-axis.
+
+    Args:
+        axes: Matplotlib axes to draw the plot on.
+        scores_dataframe: pandas dataframe as written by
+            compile_data.avg_scores_data.
+    Returns:
+        Nothing.
+    """
+    axes.plot(
+        scores_dataframe["UniquenessScore"],
+        scores_dataframe["Attendance"],
+        "bo",
+    )
+    axes.set_xlabel("Lyrical Uniqueness Score")
+    axes.set_ylabel("Average Attendance")
+    axes.set_title("Average Attendance for Each Lyrical Uniqueness Score")
+
+
+def draw_unique_weeks(axes, scores_dataframe):
+    """
+    Draw the average number of weeks on broadway for each lyrical uniqueness
+    score. The lyrical uniqueness score is along the x-axis and the average
+    number of weeks on broadway is along the y-axis.
+
+    Args:
+        axes: Matplotlib axes to draw the plot on.
+        scores_dataframe: pandas dataframe as written by
+            compile_data.avg_scores_data.
+    Returns:
+        Nothing.
+    """
+    axes.plot(
+        scores_dataframe["UniquenessScore"],
+        scores_dataframe["WeeksPerformed"],
+        "bo",
+    )
+    axes.set_xlabel("Lyrical Uniqueness Score")
+    axes.set_ylabel("Average Number of Weeks on Broadway")
+    axes.set_title(
+        "Average Number of Weeks on Broadway for Each Lyrical Uniqueness Score"
+    )
+
+
+def draw_total_attendance(axes, musical_scores):
+    """
+    Draw the attendance in comparison to the total number of lyrics in a
+    broadway show. The number of lyrics in the show is along the x-axis and the
+    attendance is along the y-axis.
+
+    Args:
+        axes: Matplotlib axes to draw the plot on.
+        musical_scores: pandas dataframe as written by
+            compile_data.find_all_uniqueness_scores.
+    Returns:
+        Nothing.
+    """
+    axes.plot(
+        musical_scores["TotalLyricCount"], musical_scores["Attendance"], "bo"
+    )
+    axes.set_xlabel("Total Number of Lyrics")
+    axes.set_ylabel("Attendance")
+    axes.set_title(
+        "Total Broadway Attendance for Different Number of Total Lyrics"
+    )
+
+
+# Each predefined plot, keyed by the name of the image file it is rendered to,
+# with the data it is drawn from and the function that draws it.
+PLOTS = {
+    "graph_1": ("score_dataframe", draw_unique_attendance),
+    "graph_2": ("score_dataframe", draw_unique_weeks),
+    "graph_3": ("musical_scores", draw_total_attendance),
+}
+
+
+def render_plot(name, data, output_directory, formats):
+    """
+    Render one of the predefined plots to image files using the Agg canvas.
+
+    Matplotlib is only imported once a plot is actually rendered, and pyplot
+    is never imported, so no display or GUI backend is needed.
+
+    Args:
+        name: string representing the name of the plot in PLOTS, which is also
+            used as the image file name.
+        data: pandas dataframe to draw the plot from.
+        output_directory: string representing the directory to save the
+            images to.
+        formats: list of strings representing the image formats to save the
+            plot as, such as "png" or "svg".
+    Returns:
+        List of strings representing the filepaths of the rendered images.
+    """
+    # pylint: disable=import-outside-toplevel
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    PLOTS[name][1](figure.add_subplot(), data)
+
+    image_paths = []
+    for image_format in formats:
+        image_path = os.path.join(output_directory, f"{name}.{image_format}")
+        figure.savefig(image_path, format=image_format, bbox_inches="tight")
+        image_paths.append(image_path)
+
+    return image_paths
+
+
+@instrumentation.timed_stage
+def render_all_plots(
+    output_directory=OUTPUT_DIRECTORY,
+    formats=("png",),
+    score_dataframe_file=SCORE_DATAFRAME_FILE,
+    musical_scores_file=MUSICAL_SCORES_FILE,
+    max_workers=None,
+):
+    """
+    Render every predefined plot to image files in parallel.
+
+    Each input CSV file is only loaded once and shared by every plot drawn
+    from it. The plots are then rendered in separate processes, since
+    Matplotlib figures can not safely be drawn from several threads at once.
+
+    Args:
+        output_directory: optional string representing the directory to save
+            the images to. Defaults to essay_images.
+        formats: optional list of strings representing the image formats to
+            save each plot as. Defaults to PNG only.
+        score_dataframe_file: optional string representing the filepath to
+            the averaged uniqueness scores data.
+        musical_scores_file: optional string representing the filepath to the
+            musical scores data.
+        max_workers: optional integer number of processes to render with.
+            Defaults to one for each CPU.
+    Returns:
+        List of strings representing the filepaths of the rendered images.
+    """
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ProcessPoolExecutor
+    import pandas as pd
+
+    all_data = {}
+    with open(score_dataframe_file, "r", encoding="utf-8") as file:
+        all_data["score_dataframe"] = pd.read_csv(file)
+    with open(musical_scores_file, "r", encoding="utf-8") as file:
+        all_data["musical_scores"] = pd.read_csv(file)
+
+    os.makedirs(output_directory, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                render_plot,
+                name,
+                all_data[data_name],
+                output_directory,
+                list(formats),
+            )
+            for (name, (data_name, _)) in PLOTS.items()
+        ]
+        image_paths = []
+        for future in futures:
+            image_paths.extend(future.result())
+
+    return image_paths
@@ -0,0 +1,299 @@
+"""
+A local, read-only HTTP service that answers questions about the computed
+results as JSON, such as the scores and attendance of a show or the most
+lyrically unique shows.
+
+The musical scores and the averaged score data are loaded once when the service
+starts, and indexed by show name, Genius ID and uniqueness score so each lookup
+is a dictionary access. Derived queries (such as the top shows by a measure)
+and the lyrics of each album are kept in bounded LRU caches. Every request is
+handled in its own thread, and the loaded data is never changed, so any number
+of readers can query the service at once.
+
+The service can be started from the command line:
+
+    python query_service.py --port 8000
+
+and then queried with, for example:
+
+    /shows/Wicked                   the scores of every show named Wicked
+    /albums/148251                  the scores of the shows with a Genius ID
+    /albums/148251/songs            the lyrics of an album, one list per song
+    /scores/57                      the averages for a uniqueness score
+    /top?metric=UniquenessScore&n=20&order=desc
+                                    the 20 most lyrically unique shows
+"""
+
+import argparse
+import functools
+import json
+import math
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+import genius_lyrics as lyrics
+
+
+MUSICAL_SCORES_FILE = "musical_scores.csv"
+SCORE_DATAFRAME_FILE = "score_dataframe.csv"
+
+HOST = "127.0.0.1"
+PORT = 8000
+
+# The number of shows returned by a top query if none is asked for, and the
+# most that can be asked for.
+DEFAULT_TOP_COUNT = 20
+MAX_TOP_COUNT = 1000
+
+# The number of derived query results and albums of lyrics kept in memory.
+TOP_CACHE_SIZE = 256
+ALBUM_CACHE_SIZE = 64
+
+
+def _load_records(filepath):
+    """
+    Load a CSV file as a list of dictionaries, one for each row, with missing
+    values as None so that every row can be written as JSON.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    with open(filepath, "r", encoding="utf-8") as file:
+        dataframe = pd.read_csv(file)
+
+    records = dataframe.to_dict("records")
+    for record in records:
+        for (column, value) in record.items():
+            if isinstance(value, float) and math.isnan(value):
+                record[column] = None
+    return records
+
+
+def _normalize_name(show_name):
+    """
+    Normalize a show name so that lookups ignore case and surrounding spaces.
+    """
+    return show_name.strip().casefold()
+
+
+def load_index(
+    musical_scores_file=MUSICAL_SCORES_FILE,
+    score_dataframe_file=SCORE_DATAFRAME_FILE,
+):
+    """
+    Load the computed results and index them for fast lookups.
+
+    Args:
+        musical_scores_file: optional string specifying the file path of the
+            musical scores, as written by
+            compile_data.find_all_uniqueness_scores.
+        score_dataframe_file: optional string specifying the file path of the
+            averaged score data, as written by compile_data.avg_scores_data.
+    Returns:
+        Dictionary with the keys "shows" (the list of every show's row),
+            "by_name" (mapping each normalized show name to a list of its
+            rows), "by_genius_id" (mapping each Genius ID to a list of the
+            rows of every show matched to that album), "by_score" (mapping
+            each uniqueness score to its averages) and "metrics" (the list of
+            numerical columns shows can be ranked by).
+    """
+    shows = _load_records(musical_scores_file)
+    score_averages = _load_records(score_dataframe_file)
+
+    index = {
+        "shows": shows,
+        "by_name": {},
+        "by_genius_id": {},
+        "by_score": {
+            int(row["UniquenessScore"]): row for row in score_averages
+        },
+        "metrics": [
+            column
+            for column in (shows[0] if shows else {})
+            if column != "GeniusID"
+            and all(
+                isinstance(row[column], (int, float)) or row[column] is None
+                for row in shows
+            )
+        ],
+    }
+    for row in shows:
+        index["by_name"].setdefault(
+            _normalize_name(str(row["ShowName"])), []
+        ).append(row)
+        index["by_genius_id"].setdefault(int(row["GeniusID"]), []).append(row)
+
+    # the cached queries are created for each index, so results are never
+    # shared between indexes loaded from different files
+    index["top_shows"] = functools.lru_cache(maxsize=TOP_CACHE_SIZE)(
+        functools.partial(_top_shows, index)
+    )
+    index["album_songs"] = functools.lru_cache(maxsize=ALBUM_CACHE_SIZE)(
+        _album_songs
+    )
+    return index
+
+
+def _top_shows(index, metric, count, descending):
+    """
+    Find the shows with the highest (or lowest) value of a measure. Shows with
+    no value for the measure are left out.
+
+    Returns:
+        Tuple of the rows of the top shows, in order.
+    """
+    ranked = sorted(
+        (row for row in index["shows"] if row[metric] is not None),
+        key=lambda row: row[metric],
+        reverse=descending,
+    )
+    return tuple(ranked[:count])
+
+
+def _album_songs(genius_id):
+    """
+    Load the lyrics of an album that have already been downloaded. Lyrics are
+    never downloaded by the service.
+
+    Returns:
+        Tuple of tuples of strings, one for each song, or None if the album's
+            lyrics have not been downloaded.
+    """
+    if lyrics.find_saved_lyrics_file(genius_id) is None:
+        return None
+    return tuple(lyrics.iter_album_songs(genius_id))
+
+
+def answer_query(index, path, query=None):
+    """
+    Answer a query against an index.
+
+    Args:
+        index: dictionary returned by load_index.
+        path: string representing the path of the query, such as
+            "/shows/Wicked".
+        query: optional dictionary mapping each query parameter to a list of
+            its values, as returned by urllib.parse.parse_qs.
+    Returns:
+        A tuple containing the integer HTTP status and a dictionary to send as
+            JSON.
+    """
+    query = query or {}
+    parts = [unquote(part) for part in path.strip("/").split("/")]
+
+    if len(parts) == 2 and parts[0] == "shows":
+        rows = index["by_name"].get(_normalize_name(parts[1]))
+        if rows is None:
+            return (404, {"error": f"No show named {parts[1]!r}."})
+        return (200, {"shows": rows})
+
+    if len(parts) in (2, 3) and parts[0] == "albums":
+        if not parts[1].isdigit():
+            return (400, {"error": "Genius IDs must be whole numbers."})
+        genius_id = int(parts[1])
+        rows = index["by_genius_id"].get(genius_id)
+        if rows is None:
+            return (404, {"error": f"No show with Genius ID {genius_id}."})
+        if len(parts) == 2:
+            return (200, {"shows": rows})
+        if parts[2] == "songs":
+            songs = index["album_songs"](genius_id)
+            if songs is None:
+                return (404, {"error": "This album has no saved lyrics."})
+            return (200, {"GeniusID": genius_id, "songs": songs})
+
+    if len(parts) == 2 and parts[0] == "scores":
+        if not parts[1].isdigit():
+            return (400, {"error": "Uniqueness scores must be whole numbers."})
+        averages = index["by_score"].get(int(parts[1]))
+        if averages is None:
+            return (404, {"error": f"No shows have a score of {parts[1]}."})
+        return (200, {"averages": averages})
+
+    if parts == ["top"]:
+        metric = query.get("metric", ["UniquenessScore"])[0]
+        count = query.get("n", [str(DEFAULT_TOP_COUNT)])[0]
+        order = query.get("order", ["desc"])[0]
+        if metric not in index["metrics"]:
+            return (400, {"error": f"Shows can not be ranked by {metric!r}."})
+        if not count.isdigit() or not 0 < int(count) <= MAX_TOP_COUNT:
+            return (
+                400,
+                {"error": f"n must be between 1 and {MAX_TOP_COUNT}."},
+            )
+        if order not in ("asc", "desc"):
+            return (400, {"error": "order must be asc or desc."})
+        shows = index["top_shows"](metric, int(count), order == "desc")
+        return (200, {"metric": metric, "shows": shows})
+
+    return (404, {"error": f"Unknown query {path!r}."})
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Answer GET requests with JSON, using the index of the server the handler
+    belongs to.
+    """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Answer a single GET request.
+        """
+        url = urlsplit(self.path)
+        (status, answer) = answer_query(
+            self.server.index, url.path, parse_qs(url.query)
+        )
+        body = json.dumps(answer).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(host=HOST, port=PORT, index=None):
+    """
+    Create the query service, loading the computed results once.
+
+    Args:
+        host: optional string representing the address to listen on. Defaults
+            to only accepting connections from this machine.
+        port: optional integer port to listen on. A port of 0 picks any free
+            port, which can be found from the server's server_address.
+        index: optional dictionary returned by load_index. Defaults to loading
+            the default results files.
+    Returns:
+        A ThreadingHTTPServer that has not started serving yet. Call its
+            serve_forever method to start answering queries.
+    """
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.index = load_index() if index is None else index
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve the computed results as JSON."
+    )
+    parser.add_argument("--host", default=HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=PORT, help="port")
+    parser.add_argument(
+        "--musical-scores",
+        default=MUSICAL_SCORES_FILE,
+        help="file path of the musical scores",
+    )
+    parser.add_argument(
+        "--score-dataframe",
+        default=SCORE_DATAFRAME_FILE,
+        help="file path of the averaged score data",
+    )
+    arguments = parser.parse_args()
+
+    query_server = create_server(
+        arguments.host,
+        arguments.port,
+        load_index(arguments.musical_scores, arguments.score_dataframe),
+    )
+    print(f"Serving on http://{arguments.host}:{query_server.server_port}")
+    query_server.serve_forever()
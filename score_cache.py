@@ -0,0 +1,230 @@
+"""
+Functions to cache lyrical scores between runs so that only albums whose
+lyrics have changed need to be rescored, and to keep the running sums behind
+the per-score averages written by compile_data.avg_scores_data.
+"""
+
+import hashlib
+import json
+import os
+
+
+SCORE_CACHE_FILE = "score_cache.json"
+AGGREGATE_CACHE_FILE = "score_aggregates.json"
+
+# Size of each block read from a lyrics file while hashing it. Lyric files are
+# small enough that this mostly matters for very large sung-through shows.
+HASH_BLOCK_SIZE = 1 << 16
+
+
+def load_cache(cache_file):
+    """
+    Load a cache previously written by save_cache.
+
+    A missing or unreadable cache file is treated as an empty cache, since the
+    worst outcome of losing the cache is that every album gets rescored.
+
+    Args:
+        cache_file: string representing the filepath of the cache.
+    Returns:
+        Dictionary holding the cached data.
+    """
+    try:
+        with open(cache_file, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_cache(cache, cache_file):
+    """
+    Write a cache dictionary to a JSON file.
+
+    The cache is first written to a temporary file which then replaces the old
+    cache, so a run that is interrupted part way through never leaves a half
+    written cache behind.
+
+    Args:
+        cache: dictionary holding the data to cache.
+        cache_file: string representing the filepath of the cache.
+    Returns:
+        Nothing.
+    """
+    temporary_file = f"{cache_file}.tmp"
+    with open(temporary_file, "w", encoding="utf-8") as file:
+        json.dump(cache, file)
+    os.replace(temporary_file, cache_file)
+
+
+def fingerprint_file(file_path, previous=None):
+    """
+    Find the fingerprint (modification time, size and SHA-256 hash) of a file.
+
+    Hashing a file means reading all of it, so if the modification time and
+    size match a previous fingerprint the previous hash is reused instead.
+    When only the modification time changed (for example when an album is
+    re-downloaded with identical lyrics), the hash still matches and the album
+    does not need to be rescored.
+
+    Args:
+        file_path: string representing the path of the file.
+        previous: optional dictionary holding a previous fingerprint of the
+            same file.
+    Returns:
+        Dictionary with the keys "mtime_ns", "size" and "sha256".
+    """
+    file_stats = os.stat(file_path)
+
+    if (
+        previous is not None
+        and previous.get("mtime_ns") == file_stats.st_mtime_ns
+        and previous.get("size") == file_stats.st_size
+    ):
+        return previous
+
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            file_hash.update(block)
+
+    return {
+        "mtime_ns": file_stats.st_mtime_ns,
+        "size": file_stats.st_size,
+        "sha256": file_hash.hexdigest(),
+    }
+
+
+def get_cached_scores(cache, album_id, fingerprint, signature):
+    """
+    Look up the cached scores of an album.
+
+    Args:
+        cache: dictionary loaded with load_cache.
+        album_id: the album's numerical Genius ID.
+        fingerprint: dictionary returned by fingerprint_file for the album's
+            lyrics file.
+        signature: list of strings describing how the scores were calculated
+            (for example the score column names). Scores calculated with a
+            different signature are not reused.
+    Returns:
+        Dictionary mapping each score column to its value, or None if the album
+            has no cached scores matching its current lyrics.
+    """
+    entry = cache.get("albums", {}).get(str(album_id))
+
+    if (
+        entry is None
+        or entry["fingerprint"]["sha256"] != fingerprint["sha256"]
+        or entry["signature"] != list(signature)
+    ):
+        return None
+
+    # The hash matched, so store the newest modification time to skip hashing
+    # the file again on the next run.
+    entry["fingerprint"] = fingerprint
+    return entry["scores"]
+
+
+def store_scores(cache, album_id, fingerprint, signature, scores):
+    """
+    Store the scores of an album in the cache.
+
+    Args:
+        cache: dictionary loaded with load_cache.
+        album_id: the album's numerical Genius ID.
+        fingerprint: dictionary returned by fingerprint_file for the album's
+            lyrics file.
+        signature: list of strings describing how the scores were calculated.
+        scores: dictionary mapping each score column to its value.
+    Returns:
+        Nothing.
+    """
+    cache.setdefault("albums", {})[str(album_id)] = {
+        "fingerprint": fingerprint,
+        "signature": list(signature),
+        "scores": scores,
+    }
+
+
+def get_previous_fingerprint(cache, album_id):
+    """
+    Find the fingerprint stored for an album on a previous run.
+
+    Args:
+        cache: dictionary loaded with load_cache.
+        album_id: the album's numerical Genius ID.
+    Returns:
+        Dictionary holding the previous fingerprint, or None if the album has
+            not been cached.
+    """
+    entry = cache.get("albums", {}).get(str(album_id))
+    if entry is None:
+        return None
+    return entry["fingerprint"]
+
+
+def update_aggregates(state, rows):
+    """
+    Update the running sums and counts for each uniqueness score.
+
+    The state remembers the values each show contributed on the previous run.
+    Shows that were removed or changed have their old values subtracted, and
+    new or changed shows have their new values added, so only the shows that
+    actually changed are touched.
+
+    Args:
+        state: dictionary with the keys "rows" (the values each show
+            contributed previously) and "sums" (a list of the summed
+            attendance, weeks performed, number of performances and the number
+            of shows, keyed by uniqueness score). Updated in place.
+        rows: dictionary mapping a key for each show to a list containing its
+            uniqueness score, attendance, weeks performed and number of
+            performances.
+    Returns:
+        Integer representing the number of shows whose contribution changed.
+    """
+    previous_rows = state.setdefault("rows", {})
+    sums = state.setdefault("sums", {})
+    num_changed = 0
+
+    for key in set(previous_rows) | set(rows):
+        old_row = previous_rows.get(key)
+        new_row = rows.get(key)
+        if old_row == new_row:
+            continue
+        num_changed += 1
+
+        # remove the show's previous contribution from its old score
+        if old_row is not None:
+            old_sums = sums[str(old_row[0])]
+            for index, value in enumerate(old_row[1:]):
+                old_sums[index] -= value
+            old_sums[3] -= 1
+            if old_sums[3] == 0:
+                del sums[str(old_row[0])]
+
+        # add the show's new contribution to its new score
+        if new_row is not None:
+            new_sums = sums.setdefault(str(new_row[0]), [0, 0, 0, 0])
+            for index, value in enumerate(new_row[1:]):
+                new_sums[index] += value
+            new_sums[3] += 1
+
+    state["rows"] = rows
+    return num_changed
+
+
+def get_averages(state, score):
+    """
+    Find the average attendance, weeks performed and number of performances of
+    every show with a given uniqueness score.
+
+    Args:
+        state: dictionary updated with update_aggregates.
+        score: the uniqueness score to average.
+    Returns:
+        A tuple of floats containing the average attendance, weeks performed
+            and number of performances.
+    """
+    attendance, weeks, performances, count = state["sums"][str(score)]
+    return (attendance / count, weeks / count, performances / count)
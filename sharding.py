@@ -0,0 +1,289 @@
+"""
+Functions to split the lyric scoring across several machines (or processes).
+
+The albums in musical_genius_data.csv are partitioned into shards by a stable
+hash of their Genius ID, so every node given the same number of shards agrees
+on which albums belong to which shard. Each node scores only its own shard's
+albums into a partial output file, and merge_shards combines the partial
+outputs into a single musical_scores.csv identical to a serial run.
+
+Each node can be run from the command line:
+
+    python sharding.py --shard 0 --num-shards 4
+    python sharding.py --merge shards/*.csv
+
+Every shard must have finished before merging: merge_shards refuses to write
+an output with any album missing, or with shards that were scored from
+different input files or in different ways.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import compile_data as cd
+
+
+SHARD_DIRECTORY = "shards"
+
+# Column added to each shard's rows to remember their position in the full
+# input file, so that the merged output keeps the original order.
+ROW_ORDER_COLUMN = "RowOrder"
+
+
+def shard_for(album_id, num_shards):
+    """
+    Find the shard an album belongs to.
+
+    A cryptographic hash is used rather than Python's built-in hash, which
+    changes between runs, so the same album is always assigned to the same
+    shard on every machine.
+
+    Args:
+        album_id: the album's numerical Genius ID.
+        num_shards: integer number of shards the albums are split into.
+    Returns:
+        Integer index of the album's shard, from 0 up to num_shards - 1.
+    """
+    album_hash = hashlib.sha256(str(album_id).encode("utf-8")).digest()
+    return int.from_bytes(album_hash[:8], "big") % num_shards
+
+
+def get_partial_file(shard_index, num_shards, output_directory=SHARD_DIRECTORY):
+    """
+    Find the file path of a shard's partial musical scores output.
+
+    Args:
+        shard_index: integer index of the shard.
+        num_shards: integer number of shards the albums are split into.
+        output_directory: optional string representing the directory that the
+            partial outputs are written to.
+    Returns:
+        String representing the file path of the shard's partial output.
+    """
+    return os.path.join(
+        output_directory,
+        f"musical_scores.shard-{shard_index}-of-{num_shards}.csv",
+    )
+
+
+def get_manifest_file(partial_file):
+    """
+    Find the file path of the manifest written next to a shard's partial
+    output once the shard has finished.
+
+    Args:
+        partial_file: string representing the file path of the shard's
+            partial output.
+    Returns:
+        String representing the file path of the shard's manifest.
+    """
+    return f"{os.path.splitext(partial_file)[0]}.manifest.json"
+
+
+def fingerprint_input(musical_genius_data):
+    """
+    Hash the content of an input file, so shards can check that they were all
+    given the same albums.
+
+    Args:
+        musical_genius_data: string specifying input file path.
+    Returns:
+        String of the hexadecimal SHA-256 digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(musical_genius_data, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def process_shard(
+    shard_index,
+    num_shards,
+    musical_genius_data="musical_genius_data.csv",
+    output_directory=SHARD_DIRECTORY,
+):
+    """
+    Score every album belonging to one shard, downloading any lyrics that are
+    not already saved, and write the results to the shard's partial output.
+
+    Each shard keeps its own score cache, so several shards can be processed
+    at the same time on one machine without overwriting each other's cache.
+
+    Once the partial output is written, a manifest recording the shard's index,
+    the number of shards, the number of rows in the full input, a hash of the
+    input file and how the albums were scored is written next to it, so
+    merge_shards can check that every shard finished the same job.
+
+    Args:
+        shard_index: integer index of the shard to process.
+        num_shards: integer number of shards the albums are split into.
+        musical_genius_data: optional string specifying input file path.
+        output_directory: optional string representing the directory to write
+            the partial output to.
+    Returns:
+        String representing the file path of the shard's partial output.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    with open(musical_genius_data, "r", encoding="utf-8") as file:
+        musical_data = pd.read_csv(file)
+
+    # each row remembers its position before the rows of other shards are
+    # removed
+    musical_data[ROW_ORDER_COLUMN] = range(len(musical_data))
+    in_shard = [
+        shard_for(album_id, num_shards) == shard_index
+        for album_id in musical_data["GeniusID"]
+    ]
+    shard_data = musical_data[in_shard]
+
+    os.makedirs(output_directory, exist_ok=True)
+    partial_file = get_partial_file(shard_index, num_shards, output_directory)
+    # a manifest left by an earlier run is removed, so this shard only counts
+    # as finished once it finishes again
+    if os.path.exists(get_manifest_file(partial_file)):
+        os.remove(get_manifest_file(partial_file))
+    shard_input_file = f"{os.path.splitext(partial_file)[0]}.input.csv"
+    shard_data.to_csv(shard_input_file, encoding="utf-8", index=False)
+
+    cd.find_all_uniqueness_scores(
+        shard_input_file,
+        partial_file,
+        cache_file=f"{os.path.splitext(partial_file)[0]}.cache.json",
+    )
+    os.remove(shard_input_file)
+
+    with open(get_manifest_file(partial_file), "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "shard_index": shard_index,
+                "num_shards": num_shards,
+                "total_rows": len(musical_data),
+                "input_hash": fingerprint_input(musical_genius_data),
+                "score_signature": cd.get_score_signature(),
+            },
+            file,
+        )
+
+    return partial_file
+
+
+def merge_shards(partial_files, musical_scores_file="musical_scores.csv"):
+    """
+    Combine the partial outputs of every shard into a single musical scores
+    file, in the same order as the original input.
+
+    Args:
+        partial_files: list of strings representing the file paths of each
+            shard's partial output.
+        musical_scores_file: optional string specifying output file path.
+    Returns:
+        Nothing.
+    Raises:
+        ValueError: if a partial output has no manifest (because its shard did
+            not finish), the shards were processed with different numbers of
+            shards, input files or scoring, a shard is missing or repeated, or
+            the merged rows are not exactly the rows of the full input.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    all_partials = []
+    all_manifests = []
+    for partial_file in sorted(partial_files):
+        manifest_file = get_manifest_file(partial_file)
+        if not os.path.exists(manifest_file):
+            raise ValueError(f"{partial_file} has no manifest.")
+        with open(manifest_file, "r", encoding="utf-8") as file:
+            all_manifests.append(json.load(file))
+        with open(partial_file, "r", encoding="utf-8") as file:
+            all_partials.append(pd.read_csv(file))
+
+    if not all_manifests:
+        raise ValueError("There are no partial outputs to merge.")
+    # manifests written before the input hash and score signature were
+    # recorded never match a newer shard
+    for (key, difference) in [
+        ("num_shards", "numbers of shards"),
+        ("total_rows", "numbers of input rows"),
+        ("input_hash", "input files"),
+        ("score_signature", "metrics or scoring options"),
+    ]:
+        if len({str(manifest.get(key)) for manifest in all_manifests}) != 1:
+            raise ValueError(
+                f"The shards were processed with different {difference}."
+            )
+    num_shards = all_manifests[0]["num_shards"]
+    total_rows = all_manifests[0]["total_rows"]
+    shard_indexes = sorted(
+        manifest["shard_index"] for manifest in all_manifests
+    )
+    if shard_indexes != list(range(num_shards)):
+        raise ValueError(
+            f"Expected shards 0 to {num_shards - 1}, got {shard_indexes}."
+        )
+
+    # shards that had no albums are left out so they can't change the column
+    # types of the merged data, unless every shard was empty
+    non_empty_partials = [
+        partial for partial in all_partials if not partial.empty
+    ] or all_partials[:1]
+    musical_scores = pd.concat(non_empty_partials, ignore_index=True)
+
+    if musical_scores[ROW_ORDER_COLUMN].duplicated().any():
+        raise ValueError("The same row appears in more than one shard.")
+
+    # a stable sort on the original positions makes the merge deterministic
+    # regardless of the order the shards finished in
+    musical_scores = musical_scores.sort_values(
+        ROW_ORDER_COLUMN, kind="mergesort"
+    )
+    if musical_scores[ROW_ORDER_COLUMN].tolist() != list(range(total_rows)):
+        raise ValueError("The shards do not contain every row of the input.")
+    musical_scores = musical_scores.drop(columns=ROW_ORDER_COLUMN)
+
+    musical_scores.to_csv(musical_scores_file, encoding="utf-8", index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Score one shard of the albums, or merge scored shards."
+    )
+    parser.add_argument("--shard", type=int, help="index of the shard to score")
+    parser.add_argument("--num-shards", type=int, help="total number of shards")
+    parser.add_argument(
+        "--input",
+        default="musical_genius_data.csv",
+        help="file path of the musical data to score",
+    )
+    parser.add_argument(
+        "--output-directory",
+        default=SHARD_DIRECTORY,
+        help="directory to write each shard's partial output to",
+    )
+    parser.add_argument(
+        "--merge",
+        nargs="+",
+        metavar="PARTIAL_FILE",
+        help="merge these partial outputs into musical_scores.csv",
+    )
+    arguments = parser.parse_args()
+
+    if arguments.merge:
+        merge_shards(arguments.merge)
+    else:
+        if arguments.shard is None or arguments.num_shards is None:
+            parser.error(
+                "--shard and --num-shards are required unless --merge is given"
+            )
+        if not 0 <= arguments.shard < arguments.num_shards:
+            parser.error("--shard must be from 0 up to --num-shards - 1")
+        process_shard(
+            arguments.shard,
+            arguments.num_shards,
+            arguments.input,
+            arguments.output_directory,
+        )
@@ -0,0 +1,299 @@
+"""
+A memo of per-song work, keyed by a hash of each song's content, so that a
+song that appears on several albums (such as the original cast, revival and
+film recordings of the same show) is only tokenized and scored once.
+
+Two kinds of entries are kept:
+    * tokens: the list of words split from a song's downloaded lyrics text,
+        keyed by a hash of the text.
+    * metrics: the value of every metric for a song, keyed by a hash of the
+        song's words along with the metrics and window size they were
+        calculated with, and the source code of the modules the metrics are
+        defined in (so changing a metric never reuses its old values).
+
+Entries are stored in an SQLite database, so they are reused between runs.
+The memo holds at most max_entries entries: each lookup marks its entry as
+recently used, and once the memo is full the least recently used entries are
+evicted. Hits and misses are counted by instrumentation (as "memo.hits" and
+"memo.misses"), so the run report includes the memo's hit rate.
+"""
+
+import contextlib
+import functools
+import hashlib
+import inspect
+import json
+import sqlite3
+import genius_lyrics as lyrics
+import instrumentation
+import lyric_metrics
+
+
+MEMO_FILE = "song_memo.sqlite"
+
+# The most entries kept in the memo.
+MAX_ENTRIES = 100000
+
+# The fraction of max_entries left after an eviction. Evicting a batch at a
+# time, rather than one entry per insert, keeps inserts cheap once the memo is
+# full.
+EVICT_TO_FRACTION = 0.9
+
+# Changed whenever genius_lyrics.split_and_format_song_lyrics changes, so
+# token lists memoized by an older tokenizer are no longer found.
+TOKENIZER_VERSION = 1
+
+
+def hash_content(*parts):
+    """
+    Hash the content of a song (and anything it was processed with) into a
+    memo key.
+
+    Args:
+        *parts: strings to hash together, in order.
+    Returns:
+        String of the hexadecimal SHA-256 digest of the parts.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        # separates the parts, so that moving text between parts changes the
+        # hash
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=32)
+def _fingerprint_functions(song_functions):
+    """
+    Hash the source code of the modules that define a tuple of functions.
+    """
+    sources = []
+    for song_function in song_functions:
+        module = inspect.getmodule(song_function)
+        try:
+            source = inspect.getsource(module)
+        except (OSError, TypeError):
+            # functions defined without a source file (such as interactively)
+            # are fingerprinted by their compiled code instead
+            code = song_function.__code__
+            source = code.co_code.hex() + repr(code.co_consts)
+        sources.append(f"{song_function.__qualname__}\n{source}")
+    return hash_content(*sources)
+
+
+def fingerprint_metrics(metrics):
+    """
+    Fingerprint the code that calculates a list of metrics, so that values
+    calculated by an older version of a metric are not reused. The whole
+    module each song function is defined in is hashed, so changes to the
+    helper functions a metric uses are noticed too.
+
+    Args:
+        metrics: list of strings naming registered metrics.
+    Returns:
+        String of the hexadecimal SHA-256 digest of the metrics' code.
+    """
+    return _fingerprint_functions(
+        tuple(lyric_metrics.METRICS[column][0] for column in metrics)
+    )
+
+
+class SongMemo:
+    """
+    A bounded, least recently used memo of per-song results, stored in an
+    SQLite database.
+
+    Changes are written to the database when the memo is closed, so it should
+    be used as a context manager:
+
+        with song_memo.SongMemo() as memo:
+            scores = lyric_metrics.calculate_album_metrics(songs, memo=memo)
+
+    A memo should only be used from the thread that created it.
+    """
+
+    def __init__(self, memo_file=MEMO_FILE, max_entries=MAX_ENTRIES):
+        """
+        Open a memo, creating its database if it does not exist yet.
+
+        Args:
+            memo_file: optional string specifying the file path of the memo's
+                database. ":memory:" keeps the memo in memory only.
+            max_entries: optional integer, the most entries kept in the memo.
+        """
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(memo_file)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS memo "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "last_used INTEGER NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS memo_last_used ON memo (last_used)"
+        )
+        (self.num_entries, last_used) = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(MAX(last_used), 0) FROM memo"
+        ).fetchone()
+        # each lookup or insert is given the next tick, so the entries with
+        # the lowest ticks are the least recently used
+        self.clock = last_used
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self.num_entries
+
+    def _tick(self):
+        """
+        Advance the memo's clock, returning the new tick.
+        """
+        self.clock += 1
+        return self.clock
+
+    def lookup(self, key):
+        """
+        Find a memoized value, marking it as recently used.
+
+        Args:
+            key: string key the value was stored with.
+        Returns:
+            The stored value, or None if the key is not in the memo.
+        """
+        row = self.connection.execute(
+            "SELECT value FROM memo WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            instrumentation.count("memo.misses")
+            return None
+
+        instrumentation.count("memo.hits")
+        self.connection.execute(
+            "UPDATE memo SET last_used = ? WHERE key = ?", (self._tick(), key)
+        )
+        return json.loads(row[0])
+
+    def store(self, key, value):
+        """
+        Memoize a value, evicting the least recently used entries if the memo
+        is full.
+
+        Args:
+            key: string key to store the value with.
+            value: value to store, which must be serializable as JSON. Tuples
+                are read back as lists.
+        """
+        # a replaced entry does not change the number of entries
+        is_new = (
+            self.connection.execute(
+                "SELECT 1 FROM memo WHERE key = ?", (key,)
+            ).fetchone()
+            is None
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO memo (key, value, last_used) "
+            "VALUES (?, ?, ?)",
+            (key, json.dumps(value), self._tick()),
+        )
+        if is_new:
+            self.num_entries += 1
+
+        if self.num_entries > self.max_entries:
+            num_evicted = self.num_entries - int(
+                self.max_entries * EVICT_TO_FRACTION
+            )
+            self.connection.execute(
+                "DELETE FROM memo WHERE key IN "
+                "(SELECT key FROM memo ORDER BY last_used LIMIT ?)",
+                (num_evicted,),
+            )
+            self.num_entries -= num_evicted
+            instrumentation.count("memo.evictions", num_evicted)
+
+    def tokenize(self, song_lyrics):
+        """
+        Split a song's lyrics text into words, as
+        genius_lyrics.split_and_format_song_lyrics does, reusing the words of
+        any identical text seen before.
+
+        Args:
+            song_lyrics: string representing all the lyrics in a song, or None
+                if the song has no lyrics.
+        Returns:
+            A list of strings where each string is an individual word in the
+                lyrics.
+        """
+        if song_lyrics is None:
+            return []
+
+        key = hash_content("tokens", str(TOKENIZER_VERSION), song_lyrics)
+        song = self.lookup(key)
+        if song is None:
+            song = lyrics.split_and_format_song_lyrics(song_lyrics)
+            self.store(key, song)
+        return song
+
+    def song_metrics(self, song, metrics, window_size):
+        """
+        Calculate every given metric for a song, as
+        lyric_metrics.calculate_song_metrics does, reusing the values of any
+        identical song seen before.
+
+        Args:
+            song: list or tuple of strings representing each word in the song.
+            metrics: list of strings naming the metrics to calculate.
+            window_size: integer number of words in each window of the
+                windowed metrics.
+        Returns:
+            Dictionary mapping each metric's column name to the song
+                function's value for the song.
+        """
+        # the words are split on whitespace, so they never contain a space
+        key = hash_content(
+            "metrics",
+            ",".join(metrics),
+            fingerprint_metrics(metrics),
+            str(window_size),
+            " ".join(song),
+        )
+        song_values = self.lookup(key)
+        if song_values is None:
+            song_values = lyric_metrics.calculate_song_metrics(
+                song, metrics, window_size
+            )
+            self.store(key, song_values)
+        return song_values
+
+    def close(self):
+        """
+        Write every change to the memo's database and close it.
+        """
+        self.connection.commit()
+        self.connection.close()
+
+
+def open_memo(memo_file=MEMO_FILE, max_entries=MAX_ENTRIES):
+    """
+    Open a memo to use as a context manager, or no memo at all:
+
+        with song_memo.open_memo(memo_file) as memo:
+            ...
+
+    Changes are written to the memo's database when the block is left, even
+    if it is left by an exception, so no memoized results are lost.
+
+    Args:
+        memo_file: optional string specifying the file path of the memo's
+            database. If None, no memo is opened.
+        max_entries: optional integer, the most entries kept in the memo.
+    Returns:
+        A context manager giving a SongMemo, or None if memo_file is None.
+    """
+    if memo_file is None:
+        return contextlib.nullcontext()
+    return SongMemo(memo_file, max_entries)
@@ -0,0 +1,398 @@
+"""
+Functions to generate a deterministic synthetic corpus, in the same formats as
+the real data, for benchmarks and memory tests at much larger scales than the
+real corpus.
+
+The generated corpus is made up of:
+
+* A lyrics directory with one {album_id}.csv file for each album, in the same
+  format as genius_lyrics.write_lyrics_to_file.
+* A processed Broadway data file with a row for every week of every show, in
+  the same format as broadway_data.get_broadway_data.
+* A musical_genius_data.csv file matching each show to its album, in the same
+  format as compile_data.find_corresponding_album.
+
+Word frequencies follow Zipf's law, and song lengths and album sizes follow
+distributions fitted to the real corpus (178 albums of about 18 songs, with a
+median of about 230 words per song). Every album and show is generated from
+its own random number generator seeded by the corpus seed and its index, so
+the same seed always gives exactly the same files, and the first albums of a
+large corpus are the same as those of a small one.
+
+A corpus can be generated from the command line, for example at 100 times the
+size of the real corpus:
+
+    python synthetic_data.py --scale 100 --output-directory synthetic
+"""
+
+import argparse
+import csv
+import os
+from datetime import date, timedelta
+
+
+SYNTHETIC_DIRECTORY = "synthetic"
+SEED = 0
+
+# The number of albums in the real corpus, which a scale of 1 matches.
+REAL_ALBUM_COUNT = 178
+
+# Synthetic Genius IDs start here, well above any real ID, so that synthetic
+# lyrics files can never be mistaken for real ones.
+FIRST_ALBUM_ID = 900000000
+
+# Word frequencies are proportional to 1 / (rank + ZIPF_OFFSET) ** ZIPF_EXPONENT
+# (the Zipf-Mandelbrot law) over a vocabulary of VOCABULARY_SIZE words. These
+# are fitted to the real corpus, where the most common word ("the") is about 4%
+# of all words and the five most common are about 14%.
+VOCABULARY_SIZE = 35000
+ZIPF_EXPONENT = 1.2
+ZIPF_OFFSET = 5
+
+# Songs per album are normally distributed, and words per song are log-normally
+# distributed, both fitted to the real corpus.
+MEAN_SONGS_PER_ALBUM = 18
+SONGS_PER_ALBUM_DEVIATION = 10
+MEDIAN_SONG_LENGTH = 230
+SONG_LENGTH_LOG_DEVIATION = 0.75
+
+# Songs repeat a chorus of this many words a few times, so that repetition
+# measures see realistic choruses rather than only random words.
+CHORUS_LENGTH = 20
+MAX_CHORUS_REPEATS = 4
+
+# Runs start on a Sunday between these dates, and their lengths in weeks are
+# log-normally distributed.
+FIRST_WEEK = date(1995, 1, 1)
+LAST_WEEK = date(2016, 8, 14)
+MEDIAN_RUN_WEEKS = 40
+RUN_WEEKS_LOG_DEVIATION = 1.0
+PERFORMANCES_PER_WEEK = 8
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def create_vocabulary(seed=SEED, vocabulary_size=VOCABULARY_SIZE):
+    """
+    Create a vocabulary of unique made-up words, from most to least common.
+
+    As in real lyrics, common words are short and rare words are long.
+
+    Args:
+        seed: optional integer seed for the random number generator.
+        vocabulary_size: optional integer number of words to create.
+    Returns:
+        List of strings, one for each word, in order of how common they are.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    random_generator = np.random.default_rng([seed, vocabulary_size])
+    ranks = np.arange(1, vocabulary_size + 1)
+    word_lengths = 1 + random_generator.poisson(
+        np.minimum(7, 0.6 * np.log(ranks) + 1)
+    )
+
+    # the letters of every word are drawn at once, and only words that are
+    # already used are redrawn, each one letter longer than before
+    all_letters = "".join(
+        np.array(list(LETTERS))[
+            random_generator.integers(0, len(LETTERS), word_lengths.sum())
+        ].tolist()
+    )
+    boundaries = np.concatenate(([0], np.cumsum(word_lengths))).tolist()
+
+    vocabulary = []
+    used_words = set()
+    for (start, end) in zip(boundaries[:-1], boundaries[1:]):
+        word = all_letters[start:end]
+        word_length = end - start
+        while word in used_words:
+            word_length += 1
+            letters = random_generator.integers(0, len(LETTERS), word_length)
+            word = "".join(LETTERS[letter] for letter in letters)
+        used_words.add(word)
+        vocabulary.append(word)
+
+    return vocabulary
+
+
+def create_word_sampler(
+    vocabulary, zipf_exponent=ZIPF_EXPONENT, zipf_offset=ZIPF_OFFSET
+):
+    """
+    Create a function that draws words from a vocabulary with Zipfian
+    frequencies.
+
+    The cumulative distribution is found once, so each word drawn only needs
+    a binary search rather than recalculating the probabilities.
+
+    Args:
+        vocabulary: list of strings returned by create_vocabulary.
+        zipf_exponent: optional float exponent of Zipf's law.
+        zipf_offset: optional number added to each word's rank, which flattens
+            the frequencies of the most common words.
+    Returns:
+        A function that is given a numpy random Generator and a number of
+            words, and returns a list of that many words.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    ranks = np.arange(1, len(vocabulary) + 1)
+    weights = 1 / (ranks + zipf_offset) ** zipf_exponent
+    cumulative = np.cumsum(weights / weights.sum())
+    words = np.array(vocabulary, dtype=object)
+
+    def sample_words(random_generator, num_words):
+        positions = np.searchsorted(
+            cumulative, random_generator.random(num_words), side="right"
+        )
+        return words[np.minimum(positions, len(words) - 1)].tolist()
+
+    return sample_words
+
+
+def generate_album(album_index, sample_words, seed=SEED):
+    """
+    Generate the lyrics of one synthetic album.
+
+    Args:
+        album_index: integer index of the album in the corpus.
+        sample_words: function returned by create_word_sampler.
+        seed: optional integer seed of the corpus.
+    Returns:
+        List of lists of strings, with each embedded list containing each word
+            in the lyrics of one of the album's songs.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    random_generator = np.random.default_rng([seed, album_index, 0])
+    num_songs = max(
+        1,
+        round(
+            random_generator.normal(
+                MEAN_SONGS_PER_ALBUM, SONGS_PER_ALBUM_DEVIATION
+            )
+        ),
+    )
+
+    all_album_lyrics = []
+    for _ in range(num_songs):
+        song_length = max(
+            1,
+            round(
+                random_generator.lognormal(
+                    np.log(MEDIAN_SONG_LENGTH), SONG_LENGTH_LOG_DEVIATION
+                )
+            ),
+        )
+        chorus = sample_words(random_generator, CHORUS_LENGTH)
+        num_choruses = min(
+            int(random_generator.integers(0, MAX_CHORUS_REPEATS + 1)),
+            song_length // (2 * CHORUS_LENGTH),
+        )
+
+        # the verse of random words is split into parts, with the chorus
+        # repeated between each part
+        verse = sample_words(
+            random_generator, song_length - num_choruses * CHORUS_LENGTH
+        )
+        boundaries = [
+            len(verse) * part // (num_choruses + 1)
+            for part in range(num_choruses + 2)
+        ]
+        song = verse[: boundaries[1]]
+        for part in range(1, num_choruses + 1):
+            song.extend(chorus)
+            song.extend(verse[boundaries[part] : boundaries[part + 1]])
+        all_album_lyrics.append(song)
+
+    return all_album_lyrics
+
+
+def generate_run(album_index, seed=SEED):
+    """
+    Generate the weekly attendance and performances of one synthetic show.
+
+    Attendance rises to a peak in the first few weeks and then decays, with
+    some week-to-week noise.
+
+    Args:
+        album_index: integer index of the show's album in the corpus.
+        seed: optional integer seed of the corpus.
+    Returns:
+        List of tuples, one for each week of the run, containing the week's
+            date, attendance and number of performances.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    random_generator = np.random.default_rng([seed, album_index, 1])
+    total_weeks = (LAST_WEEK - FIRST_WEEK).days // 7 + 1
+    num_weeks = int(
+        min(
+            total_weeks,
+            max(
+                1,
+                round(
+                    random_generator.lognormal(
+                        np.log(MEDIAN_RUN_WEEKS), RUN_WEEKS_LOG_DEVIATION
+                    )
+                ),
+            ),
+        )
+    )
+    first_week = int(random_generator.integers(0, total_weeks - num_weeks + 1))
+
+    weeks = np.arange(num_weeks)
+    peak_attendance = random_generator.uniform(6000, 14000)
+    peak_week = random_generator.integers(0, min(num_weeks, 8))
+    decay_rate = random_generator.lognormal(np.log(0.005), 0.75)
+    curve = np.where(
+        weeks < peak_week,
+        0.7 + 0.3 * weeks / max(peak_week, 1),
+        np.exp(-decay_rate * (weeks - peak_week)),
+    )
+    noise = random_generator.normal(1, 0.05, num_weeks)
+    attendance = np.maximum(250, peak_attendance * curve * noise).astype(int)
+
+    # most weeks have the usual number of performances, but some have one
+    # more or less, or none at all before opening night
+    performances = PERFORMANCES_PER_WEEK + random_generator.choice(
+        [0, -1, 1, -PERFORMANCES_PER_WEEK],
+        num_weeks,
+        p=[0.9, 0.03, 0.02, 0.05],
+    )
+
+    return [
+        (
+            FIRST_WEEK + timedelta(weeks=first_week + week),
+            int(attendance[week]),
+            int(performances[week]),
+        )
+        for week in range(num_weeks)
+    ]
+
+
+def generate_corpus(
+    num_albums=REAL_ALBUM_COUNT,
+    output_directory=SYNTHETIC_DIRECTORY,
+    seed=SEED,
+):
+    """
+    Generate a synthetic corpus of lyrics, weekly Broadway data and matched
+    musical data.
+
+    Albums are generated and written one at a time, so memory use does not
+    grow with the number of albums, except for the weekly Broadway rows.
+
+    Args:
+        num_albums: optional integer number of albums (and shows) to generate.
+            Defaults to the size of the real corpus.
+        output_directory: optional string representing the directory to write
+            the corpus to.
+        seed: optional integer seed, so the same corpus is generated every
+            time.
+    Returns:
+        Dictionary with the keys "lyrics_directory", "processed_file" and
+            "musical_genius_data", each a string representing the path of the
+            generated lyrics directory or file.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    lyrics_directory = os.path.join(output_directory, "lyrics")
+    os.makedirs(lyrics_directory, exist_ok=True)
+    sample_words = create_word_sampler(create_vocabulary(seed))
+
+    all_weeks = []
+    all_musicals = []
+    for album_index in range(num_albums):
+        album_id = FIRST_ALBUM_ID + album_index
+        show_name = f"Synthetic Show {album_index + 1}"
+
+        album_file = os.path.join(lyrics_directory, f"{album_id}.csv")
+        with open(album_file, "w", encoding="utf-8", newline="") as file:
+            csv.writer(file).writerows(
+                generate_album(album_index, sample_words, seed)
+            )
+
+        run = generate_run(album_index, seed)
+        all_weeks.extend(
+            (week_date, show_name, "Musical", attendance, performances)
+            for (week_date, attendance, performances) in run
+        )
+        all_musicals.append(
+            {
+                "ShowName": show_name,
+                "Attendance": sum(week[1] for week in run),
+                "NumPerformances": sum(week[2] for week in run),
+                "WeeksPerformed": len(run),
+                "GeniusID": album_id,
+                "AlbumTitle": (
+                    f"{show_name} (Original Broadway Cast Recording)"
+                ),
+            }
+        )
+
+    # the weekly rows are sorted by date like the real data, and dates are
+    # written without leading zeros
+    processed_data = pd.DataFrame(
+        all_weeks,
+        columns=[
+            "Date.Full",
+            "Show.Name",
+            "Show.Type",
+            "Statistics.Attendance",
+            "Statistics.Performances",
+        ],
+    ).sort_values("Date.Full", kind="mergesort")
+    processed_data["Date.Full"] = [
+        f"{week_date.month}/{week_date.day}/{week_date.year}"
+        for week_date in processed_data["Date.Full"]
+    ]
+
+    processed_file = os.path.join(
+        output_directory, "processed_broadway_data.csv"
+    )
+    processed_data.to_csv(processed_file, encoding="utf-8", index=False)
+
+    musical_genius_data = os.path.join(
+        output_directory, "musical_genius_data.csv"
+    )
+    pd.DataFrame(all_musicals).to_csv(
+        musical_genius_data, encoding="utf-8", index=False
+    )
+
+    return {
+        "lyrics_directory": lyrics_directory,
+        "processed_file": processed_file,
+        "musical_genius_data": musical_genius_data,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a deterministic synthetic corpus."
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1,
+        help="size of the corpus as a multiple of the real corpus",
+    )
+    parser.add_argument(
+        "--output-directory",
+        default=SYNTHETIC_DIRECTORY,
+        help="directory to write the corpus to",
+    )
+    parser.add_argument("--seed", type=int, default=SEED, help="random seed")
+    arguments = parser.parse_args()
+
+    generate_corpus(
+        max(1, round(arguments.scale * REAL_ALBUM_COUNT)),
+        arguments.output_directory,
+        arguments.seed,
+    )
@@ -7,12 +7,37 @@ genius_lyrics) are not tested and should be evaluated manually.
 """
 
 import os
+import sys
 import csv
+import json
+import shutil
+import socket
+import subprocess
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 import pytest
 import genius_lyrics as lyrics
 import broadway_data as broadway
 import compile_data as cd
+import async_pipeline
+import near_duplicates
+import sharding
+import instrumentation
+import plotting
+import query_service
+import lyric_metrics
+import lyric_statistics
+import lyric_storage
+import score_cache
+import song_memo
+import synthetic_data
+import weekly_analysis
 
 
 #
@@ -160,6 +185,130 @@ def test_lyrics_with_one_word():
     assert lyrics.split_and_format_song_lyrics("word") == []
 
 
+class FakeGenius:
+    """
+    Stands in for the Genius API, serving an album's track list in pages the
+    same way Genius does.
+    """
+
+    def __init__(self, num_tracks):
+        self.num_tracks = num_tracks
+        self.pages_requested = []
+
+    def album_tracks(self, album_id, per_page, page):
+        """
+        Return one page of the album's tracks, with the number of the next page
+        or None if this is the last page.
+        """
+        self.pages_requested.append(page)
+        first_track = (page - 1) * per_page + 1
+        last_track = min(page * per_page, self.num_tracks)
+        tracks = [
+            {
+                "number": number,
+                "song": {
+                    "id": album_id * 1000 + number,
+                    "title": f"Song {number}",
+                    "instrumental": False,
+                    "lyrics_state": "complete",
+                },
+            }
+            for number in range(first_track, last_track + 1)
+        ]
+        next_page = page + 1 if last_track < self.num_tracks else None
+        return {"tracks": tracks, "next_page": next_page}
+
+
+@pytest.mark.parametrize("num_tracks", [0, 20, 50, 120, 333])
+def test_album_tracks_every_page(num_tracks, tmp_path, monkeypatch):
+    """
+    Tests that every page of an album's track list is followed, so the number
+    of tracks listed matches the album no matter how many pages it spans, and
+    that the tracks stay in album order.
+    """
+    monkeypatch.setattr(lyrics, "TRACKS_DIRECTORY", str(tmp_path))
+
+    all_tracks = lyrics.get_album_tracks(7, FakeGenius(num_tracks))
+
+    assert len(all_tracks) == num_tracks
+    assert [track["number"] for track in all_tracks] == list(
+        range(1, num_tracks + 1)
+    )
+
+
+def test_album_tracks_cached(tmp_path, monkeypatch):
+    """
+    Tests that an album's track list is saved after it is first listed, and
+    is loaded from the saved file afterwards without any further requests.
+    """
+    monkeypatch.setattr(lyrics, "TRACKS_DIRECTORY", str(tmp_path))
+    first_genius = FakeGenius(60)
+    second_genius = FakeGenius(60)
+
+    first_tracks = lyrics.get_album_tracks(7, first_genius)
+    second_tracks = lyrics.get_album_tracks(7, second_genius)
+
+    assert second_tracks == first_tracks
+    assert 1 in first_genius.pages_requested
+    assert not second_genius.pages_requested
+
+
+def test_truncated_album_tracks_listed_again(tmp_path, monkeypatch):
+    """
+    Tests that a saved track list that was cut short is listed again from
+    Genius and saved whole, instead of failing every later run.
+    """
+    monkeypatch.setattr(lyrics, "TRACKS_DIRECTORY", str(tmp_path))
+    (tmp_path / "7.json").write_text('{"album_id": 7, "tracks": [', "utf-8")
+    genius = FakeGenius(60)
+
+    all_tracks = lyrics.get_album_tracks(7, genius)
+
+    assert len(all_tracks) == 60
+    assert 1 in genius.pages_requested
+    assert lyrics.get_album_tracks(7, FakeGenius(60)) == all_tracks
+    assert os.listdir(tmp_path) == ["7.json"]
+
+
+def test_streamed_lyrics_match_loaded_lyrics():
+    """
+    Tests that streaming an album's songs gives the same words as loading the
+    whole album, and that streaming the corpus tags each song with its album.
+    """
+    streamed_album = [list(song) for song in lyrics.iter_album_songs(2)]
+    streamed_corpus = list(lyrics.iter_corpus([1, 3]))
+
+    assert streamed_album == lyrics.get_all_lyrics(2)
+    assert [album_id for (album_id, _) in streamed_corpus] == [1] * 5 + [3] * 3
+    assert streamed_corpus[0][1] == tuple(lyrics.get_all_lyrics(1)[0])
+
+
+def test_streamed_scoring_memory_flat(tmp_path, monkeypatch):
+    """
+    Tests that scoring a streamed album only needs a fraction of the memory of
+    scoring the album after loading all of it, and gives the same scores.
+    """
+    monkeypatch.setattr(lyrics, "LYRICS_DIRECTORY", str(tmp_path))
+    song = [f"word{index % 150}" for index in range(300)]
+    with open(lyrics.get_lyrics_file(9), "w", encoding="utf-8") as file:
+        csv.writer(file).writerows([song] * 500)
+
+    tracemalloc.start()
+    streamed_scores = lyric_metrics.calculate_album_metrics(
+        lyrics.iter_album_songs(9), ["UniquenessScore", "TotalLyricCount"]
+    )
+    (_, streamed_peak) = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    loaded_scores = lyric_metrics.calculate_album_metrics(
+        lyrics.get_all_lyrics(9), ["UniquenessScore", "TotalLyricCount"]
+    )
+    (_, loaded_peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert streamed_scores == loaded_scores
+    assert streamed_peak * 10 < loaded_peak
+
+
 #
 # Tests for broadway_data.py
 #
@@ -179,7 +328,8 @@ COLUMNS_TO_KEEP = [
 ]
 
 
-def test_downloaded_data_columns():
+@pytest.mark.network
+def test_downloaded_data_columns(tmp_path):
     """
     Assert that the wanted columns are written to the Broadway data CSV file
     while unwanted columns are removed.
@@ -198,9 +348,10 @@ def test_downloaded_data_columns():
 
     # Create a copy of the CORGIS broadway data with its own filename for
     # this test, and load as a data frame.
-    broadway.get_broadway_data(filepath="data_validation.csv")
+    data_file = str(tmp_path / "data_validation.csv")
+    broadway.get_broadway_data(filepath=data_file)
 
-    with open("data_validation.csv", "r", encoding="utf-8") as file:
+    with open(data_file, "r", encoding="utf-8") as file:
         testing_data_frame = pd.read_csv(file)
 
     # Assert that columns that shouldn't be included result in a KeyError
@@ -214,12 +365,8 @@ def test_downloaded_data_columns():
     for column in COLUMNS_TO_KEEP:
         _ = testing_data_frame[column]
 
-    # os.remove deletes the .csv file created for this test to reduce garbage in
-    # the directory.
-    os.remove("data_validation.csv")
 
-
-def test_summing_broadway_data():
+def test_summing_broadway_data(summed_test_data_file):
     """
     Test that data for two Broadway shows as created by the get_broadway_data
     function is correctly summed to reflect all shows by the sum_data function.
@@ -232,12 +379,7 @@ def test_summing_broadway_data():
     with only one show, which should encompass the range of possible occurrences
     for summing data.
     """
-
-    broadway.sum_data(
-        "testing/processed_testing_data.csv", "testing/summed_test_data.csv"
-    )
-
-    with open("testing/summed_test_data.csv", "r", encoding="utf-8") as file:
+    with open(summed_test_data_file, "r", encoding="utf-8") as file:
         csv_reader = csv.reader(file)
         test_data = list(csv_reader)
 
@@ -250,6 +392,36 @@ def test_summing_broadway_data():
     assert test_data == data_key
 
 
+def test_typed_loading_processed_data():
+    """
+    Test that the processed Broadway data is loaded with compact types, only
+    loading the columns asked for, and uses less memory than a default load.
+    """
+    processed_dataframe = broadway.load_processed_data(
+        "testing/processed_testing_data.csv",
+        columns=["Show.Name", "Date.Full", "Statistics.Attendance"],
+    )
+
+    assert list(processed_dataframe.columns) == [
+        "Show.Name",
+        "Date.Full",
+        "Statistics.Attendance",
+    ]
+    assert processed_dataframe["Show.Name"].dtype == "category"
+    assert processed_dataframe["Date.Full"].iloc[0] == pd.Timestamp(
+        "2022-11-01"
+    )
+    assert processed_dataframe["Statistics.Attendance"].dtype.itemsize < 8
+
+    memory_usage = broadway.compare_memory_usage(
+        "testing/processed_testing_data.csv"
+    )
+    assert memory_usage["saved_bytes"] > 0
+    assert memory_usage["saved_bytes"] == (
+        memory_usage["default_bytes"] - memory_usage["typed_bytes"]
+    )
+
+
 #
 # Tests for compile_data.py
 #
@@ -259,17 +431,13 @@ def test_summing_broadway_data():
 #
 
 
-def test_finding_all_uniqueness_scores():
+def test_finding_all_uniqueness_scores(test_musical_scores_file):
     """
-    Tests that the uniqueness scores and total lyric counts are correct for
-    cases in which all lyrics are unique and cases in which not all of the
-    lyrics are unique.
+    Tests that the uniqueness scores, total lyric counts and other registered
+    metrics are correct for cases in which all lyrics are unique and cases in
+    which not all of the lyrics are unique.
     """
-    cd.find_all_uniqueness_scores(
-        "testing/uniqueness_test_data.csv", "testing/test_musical_scores.csv"
-    )
-
-    with open("testing/test_musical_scores.csv", "r", encoding="utf-8") as file:
+    with open(test_musical_scores_file, "r", encoding="utf-8") as file:
         csv_reader = csv.reader(file)
         test_data = list(csv_reader)
 
@@ -282,7 +450,13 @@ def test_finding_all_uniqueness_scores():
             "GeniusID",
             "AlbumTitle",
             "UniquenessScore",
+            "WindowedUniquenessScore",
             "TotalLyricCount",
+            "MTLD",
+            "HerdanC",
+            "RepetitionDensity",
+            "HapaxCount",
+            "MeanWordLength",
         ],
         [
             "FWOP's Cool Show 1",
@@ -292,7 +466,13 @@ def test_finding_all_uniqueness_scores():
             "1",
             "FWOP's Cool Show 1",
             "100",
+            "100.0",
             "5",
+            "1.0",
+            "0.0",
+            "0.0",
+            "5",
+            "1.2",
         ],
         [
             "FWOP's Cool Show 2",
@@ -302,7 +482,13 @@ def test_finding_all_uniqueness_scores():
             "2",
             "FWOP's Cool Show 2",
             "87",
+            "87.5",
             "6",
+            "1.5",
+            "0.25",
+            "0.0",
+            "4",
+            "1.1667",
         ],
         [
             "FWOP's Cool Show 3",
@@ -312,26 +498,25 @@ def test_finding_all_uniqueness_scores():
             "3",
             "FWOP's Cool Show 3",
             "100",
+            "100.0",
+            "3",
+            "1.0",
+            "0.0",
+            "0.0",
             "3",
+            "1.3333",
         ],
     ]
 
     assert test_data == data_key
 
 
-def test_avg_scores_data():
+def test_avg_scores_data(test_score_dataframe_file):
     """
     Tests that the uniqueness scores, attendances, number of weeks performed,
     and number of performances are properly averaged for each uniqueness score.
     """
-
-    cd.avg_scores_data(
-        "testing/test_musical_scores.csv", "testing/test_score_dataframe.csv"
-    )
-
-    with open(
-        "testing/test_score_dataframe.csv", "r", encoding="utf-8"
-    ) as file:
+    with open(test_score_dataframe_file, "r", encoding="utf-8") as file:
         csv_reader = csv.reader(file)
         test_data = list(csv_reader)
 
@@ -342,3 +527,1591 @@ def test_avg_scores_data():
     ]
 
     assert test_data == data_key
+
+
+def test_pipeline_exports_match_stage_files(tmp_path, monkeypatch):
+    """
+    Tests that a pipeline run carried through memory and exported once writes
+    the same files as running each stage from the previous stage's file, and
+    that intermediate results are only written when asked for.
+    """
+    corpus_files = synthetic_data.generate_corpus(4, str(tmp_path / "corpus"))
+    albums = pd.read_csv(corpus_files["musical_genius_data"])
+    album_matches = dict(
+        zip(albums["ShowName"], zip(albums["GeniusID"], albums["AlbumTitle"]))
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        lyrics, "LYRICS_DIRECTORY", corpus_files["lyrics_directory"]
+    )
+    monkeypatch.setattr(
+        lyrics,
+        "find_album",
+        lambda name: album_matches.get(name, ("-1", "Not Found")),
+    )
+    shutil.copy(corpus_files["processed_file"], broadway.PROCESSED_FILE_PATH)
+    del album_matches[albums["ShowName"][0]]
+
+    results = cd.run_pipeline(
+        profile=False, output_directory="exported", export_formats=["csv"]
+    )
+
+    broadway.sum_data()
+    cd.find_corresponding_album()
+    cd.download_lyrics()
+    cd.find_all_uniqueness_scores(cache_file=None)
+    cd.avg_scores_data(aggregate_cache_file=None)
+    weekly_analysis.analyze_weekly_attendance()
+
+    assert len(results["musical_scores"]) == 3
+    assert sorted(os.listdir("exported")) == [
+        "musical_scores.csv",
+        "run_curves.csv",
+        "score_dataframe.csv",
+    ]
+    for filename in os.listdir("exported"):
+        with open(filename, "rb") as stage_file:
+            with open(os.path.join("exported", filename), "rb") as file:
+                assert file.read() == stage_file.read()
+
+    cd.export_results(results, "all", ["csv"], intermediates=True)
+    assert len(os.listdir("all")) == len(cd.RESULT_FILES)
+    with pytest.raises(ValueError):
+        cd.export_results(results, "all", ["xlsx"])
+
+
+def test_parquet_export_round_trip(tmp_path, test_musical_scores_file):
+    """
+    Tests that a result exported as Parquet reads back the same as the result
+    exported as CSV.
+    """
+    pytest.importorskip("pyarrow")
+    musical_scores = pd.read_csv(test_musical_scores_file)
+
+    written_files = cd.export_results(
+        {"musical_scores": musical_scores}, str(tmp_path), ["csv", "parquet"]
+    )
+
+    assert written_files == [
+        str(tmp_path / "musical_scores.csv"),
+        str(tmp_path / "musical_scores.parquet"),
+    ]
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(written_files[1]), pd.read_csv(written_files[0])
+    )
+
+
+def test_export_warns_without_columnar_format(tmp_path, monkeypatch):
+    """
+    Tests that exporting with the default formats warns when the columnar
+    format can not be written.
+    """
+    monkeypatch.setitem(cd.EXPORT_FORMATS, "parquet", "not_a_real_package")
+
+    with pytest.warns(UserWarning, match="parquet"):
+        written_files = cd.export_results(
+            {"musical_scores": pd.DataFrame({"A": [1]})}, str(tmp_path)
+        )
+
+    assert written_files == [str(tmp_path / "musical_scores.csv")]
+
+
+def test_cached_scores_reused(tmp_path, monkeypatch):
+    """
+    Tests that a second scoring run reuses the cached scores of albums whose
+    lyrics have not changed instead of rescoring them, and that the output is
+    identical to the first run.
+    """
+    cache_file = str(tmp_path / "score_cache.json")
+    first_output = str(tmp_path / "first_scores.csv")
+    second_output = str(tmp_path / "second_scores.csv")
+
+    cd.find_all_uniqueness_scores(
+        "testing/uniqueness_test_data.csv", first_output, cache_file
+    )
+
+    # Any attempt to rescore an album now fails the test.
+    def fail_rescoring(_):
+        raise AssertionError("album was rescored")
+
+    monkeypatch.setattr(
+        lyric_metrics, "calculate_album_metrics", fail_rescoring
+    )
+    cd.find_all_uniqueness_scores(
+        "testing/uniqueness_test_data.csv", second_output, cache_file
+    )
+
+    with open(first_output, "r", encoding="utf-8") as file:
+        first_data = file.read()
+    with open(second_output, "r", encoding="utf-8") as file:
+        second_data = file.read()
+
+    assert first_data == second_data
+
+
+def test_cached_scores_not_reused_after_metric_changes(tmp_path, monkeypatch):
+    """
+    Tests that albums are scored again, rather than served from the score
+    cache, once the code of one of the metrics changes.
+    """
+    cache_file = str(tmp_path / "score_cache.json")
+    musical_data = pd.read_csv("testing/uniqueness_test_data.csv")
+    first_scores = cd.score_albums(musical_data, cache_file=cache_file)
+
+    def changed_mtld(*_):
+        return 999.0
+
+    monkeypatch.setitem(
+        lyric_metrics.METRICS, "MTLD", (changed_mtld, max, False)
+    )
+    second_scores = cd.score_albums(musical_data, cache_file=cache_file)
+
+    assert (first_scores["MTLD"] != 999.0).all()
+    assert (second_scores["MTLD"] == 999.0).all()
+
+
+#
+# Tests for score_cache.py
+#
+# This includes ensuring lyric files are fingerprinted correctly and running
+# sums give the same averages as calculating them from scratch.
+#
+
+
+def test_fingerprint_same_content(tmp_path):
+    """
+    Tests that rewriting a file with the same content (as happens when an album
+    is re-downloaded) keeps the same hash, while changing the content changes
+    it.
+    """
+    lyrics_file = tmp_path / "1.csv"
+    lyrics_file.write_text("one,two,two\n", encoding="utf-8")
+    first_fingerprint = score_cache.fingerprint_file(str(lyrics_file))
+
+    os.utime(lyrics_file, ns=(0, 0))
+    same_fingerprint = score_cache.fingerprint_file(
+        str(lyrics_file), first_fingerprint
+    )
+
+    lyrics_file.write_text("one,two,three\n", encoding="utf-8")
+    changed_fingerprint = score_cache.fingerprint_file(
+        str(lyrics_file), same_fingerprint
+    )
+
+    assert same_fingerprint["sha256"] == first_fingerprint["sha256"]
+    assert changed_fingerprint["sha256"] != first_fingerprint["sha256"]
+
+
+def test_running_sums_match_full_average():
+    """
+    Tests that after a show changes its uniqueness score and another show is
+    removed, the running sums give the same averages as summing the remaining
+    shows from scratch.
+    """
+    state = {}
+    score_cache.update_aggregates(
+        state,
+        {
+            "Show 1": [100, 1000, 10, 100],
+            "Show 2": [87, 2000, 20, 200],
+            "Show 3": [100, 3000, 30, 300],
+        },
+    )
+    num_changed = score_cache.update_aggregates(
+        state,
+        {
+            "Show 1": [87, 1000, 10, 100],
+            "Show 2": [87, 2000, 20, 200],
+        },
+    )
+
+    assert num_changed == 2
+    assert score_cache.get_averages(state, 87) == (1500.0, 15.0, 150.0)
+    assert "100" not in state["sums"]
+
+
+#
+# Tests for lyric_metrics.py
+#
+# This includes ensuring each metric is calculated correctly and newly
+# registered metrics are calculated alongside the existing ones.
+#
+
+
+def test_album_metrics_match_existing_scores():
+    """
+    Tests that the uniqueness score and total lyric count calculated by the
+    metric engine match the original genius_lyrics functions.
+    """
+    album_lyrics = [
+        ["one", "two", "two", "two"],
+        ["one", "two", "three", "three"],
+    ]
+
+    metrics = lyric_metrics.calculate_album_metrics(album_lyrics)
+
+    assert metrics["UniquenessScore"] == lyrics.calculate_album_uniqueness(
+        album_lyrics
+    )
+    assert metrics["TotalLyricCount"] == lyrics.calculate_total_lyrics(
+        album_lyrics
+    )
+
+
+def test_repetition_and_hapax_metrics():
+    """
+    Tests the chorus-style repetition metric and hapax count on a song where a
+    four word phrase is repeated and two words are only sung once.
+    """
+    song = ["la", "la", "la", "la", "hey", "la", "la", "la", "la", "you"]
+
+    metrics = lyric_metrics.calculate_album_metrics(
+        [song], ["RepetitionDensity", "HapaxCount", "MeanWordLength"]
+    )
+
+    assert metrics == {
+        "RepetitionDensity": 0.8,
+        "HapaxCount": 2,
+        "MeanWordLength": 2.2,
+    }
+
+
+def test_hapax_count_across_songs():
+    """
+    Tests that a word used once in each of several songs is not a hapax of
+    the album, since it is used more than once on the album.
+    """
+    album_lyrics = [["shared", "one"], ["shared", "two"], ["shared", "two"]]
+
+    metrics = lyric_metrics.calculate_album_metrics(
+        album_lyrics, ["HapaxCount"]
+    )
+
+    assert metrics == {"HapaxCount": 1}
+
+
+def test_windowed_uniqueness_sliding_counts():
+    """
+    Tests that the windowed uniqueness score matches counting the unique words
+    in every window separately, and that a song shorter than the window gets
+    its whole-song uniqueness.
+
+    With a window of 3, the windows of "a b a c c" have 2, 3 and 2 unique
+    words, so 7 out of 9 words are unique, or 77.78%.
+    """
+    song = ["a", "b", "a", "c", "c"]
+
+    windowed = lyric_metrics.calculate_album_metrics(
+        [song], ["WindowedUniquenessScore"], window_size=3
+    )
+    short_song = lyric_metrics.calculate_album_metrics(
+        [song], ["WindowedUniquenessScore"], window_size=10
+    )
+
+    assert windowed["WindowedUniquenessScore"] == 77.7778
+    assert short_song["WindowedUniquenessScore"] == 60.0
+
+
+@pytest.mark.parametrize("window_size", [0, -3])
+def test_window_size_must_be_positive(window_size):
+    """
+    Tests that a window size of no words is refused, both when scoring an
+    album and before scoring a dataframe of musicals.
+    """
+    musical_data = pd.DataFrame({"GeniusID": [101]})
+
+    with pytest.raises(ValueError, match="window_size"):
+        lyric_metrics.calculate_album_metrics(
+            [["a", "b"]], window_size=window_size
+        )
+    with pytest.raises(ValueError, match="window_size"):
+        cd.score_albums(musical_data, cache_file=None, window_size=window_size)
+
+
+def test_registered_metric_added(monkeypatch):
+    """
+    Tests that registering a new metric makes it part of the metrics that are
+    calculated for every album.
+    """
+    monkeypatch.setattr(lyric_metrics, "METRICS", dict(lyric_metrics.METRICS))
+
+    @lyric_metrics.register_metric("LongestWord", aggregate=max)
+    def song_longest_word(song, _):
+        return max((len(word) for word in song), default=0)
+
+    metrics = lyric_metrics.calculate_album_metrics([["a", "abc"], ["ab"]])
+
+    assert song_longest_word(["abcd"], None) == 4
+    assert metrics["LongestWord"] == 3
+
+
+#
+# Tests for song_memo.py
+#
+# This includes ensuring memoized songs are scored and tokenized the same as
+# unmemoized songs, that identical songs on different albums are only scored
+# once, and that the least recently used songs are evicted.
+#
+
+MEMO_ALBUMS = {
+    "original": [["one", "day", "more"], ["a", "b", "a", "c"]],
+    "revival": [["one", "day", "more"], ["x", "y", "z"] * 30],
+}
+
+
+def test_memo_scores_identical_songs_once(profiling, tmp_path):
+    """
+    Tests that memoized album scores match unmemoized scores, that a song
+    repeated on another album is a memo hit, and that the memo is kept
+    between runs.
+    """
+    # pylint: disable=unused-argument
+    memo_file = str(tmp_path / "memo.sqlite")
+    with song_memo.SongMemo(memo_file) as memo:
+        memo_scores = [
+            lyric_metrics.calculate_album_metrics(songs, memo=memo)
+            for songs in MEMO_ALBUMS.values()
+        ]
+    counters = instrumentation.get_report()["counters"]
+
+    assert memo_scores == [
+        lyric_metrics.calculate_album_metrics(songs)
+        for songs in MEMO_ALBUMS.values()
+    ]
+    assert counters["memo.hits"] == 1
+    assert counters["memo.misses"] == 3
+    assert counters["memo.hit_rate"] == 0.25
+
+    with song_memo.SongMemo(memo_file) as memo:
+        assert len(memo) == 3
+        assert (
+            lyric_metrics.calculate_album_metrics(
+                MEMO_ALBUMS["revival"], memo=memo
+            )
+            == memo_scores[1]
+        )
+    assert instrumentation.get_report()["counters"]["memo.hits"] == 3
+
+
+def test_memo_not_reused_after_metric_changes(tmp_path, monkeypatch):
+    """
+    Tests that memoized song values are not reused once the code of one of
+    the metrics changes.
+    """
+    memo_file = str(tmp_path / "memo.sqlite")
+    song = MEMO_ALBUMS["original"][1]
+    with song_memo.SongMemo(memo_file) as memo:
+        original_values = memo.song_metrics(song, ["MTLD"], 50)
+
+    def changed_mtld(*_):
+        return 999.0
+
+    monkeypatch.setitem(
+        lyric_metrics.METRICS, "MTLD", (changed_mtld, max, False)
+    )
+    with song_memo.SongMemo(memo_file) as memo:
+        changed_values = memo.song_metrics(song, ["MTLD"], 50)
+
+    assert original_values["MTLD"] != 999.0
+    assert changed_values == {"MTLD": 999.0}
+
+
+def test_memo_kept_when_scoring_fails(tmp_path, monkeypatch):
+    """
+    Tests that songs memoized before an album fails to be scored are still
+    written to the memo.
+    """
+    memo_file = str(tmp_path / "memo.sqlite")
+    monkeypatch.setattr(lyrics, "LYRICS_DIRECTORY", str(tmp_path))
+    with open(lyrics.get_lyrics_file(1), "w", encoding="utf-8") as file:
+        csv.writer(file).writerows(MEMO_ALBUMS["original"])
+    musical_data = pd.DataFrame(
+        {"ShowName": ["Show", "Bad"], "GeniusID": [1, 2]}
+    )
+
+    def fail_download(album_id, memo=None):
+        raise ConnectionError(f"Album {album_id} could not be downloaded.")
+
+    monkeypatch.setattr(lyrics, "write_lyrics_to_file", fail_download)
+    with pytest.raises(ConnectionError):
+        cd.score_albums(musical_data, cache_file=None, memo_file=memo_file)
+
+    with song_memo.SongMemo(memo_file) as memo:
+        assert len(memo) == 2
+
+
+def test_memo_evicts_least_recently_used(tmp_path):
+    """
+    Tests that once the memo is full, the least recently used entries are
+    evicted, and entries that were looked up recently are kept.
+    """
+    memo_file = str(tmp_path / "memo.sqlite")
+    with song_memo.SongMemo(memo_file, max_entries=4) as memo:
+        for key in ["a", "b", "c", "d"]:
+            memo.store(key, [key])
+        assert memo.lookup("a") == ["a"]
+        memo.store("e", ["e"])
+
+    with song_memo.SongMemo(memo_file, max_entries=4) as memo:
+        assert len(memo) == 3
+        assert memo.lookup("b") is None
+        assert memo.lookup("c") is None
+        assert [memo.lookup(key) for key in ["a", "d", "e"]] == [
+            ["a"],
+            ["d"],
+            ["e"],
+        ]
+
+
+def test_memo_tokenizes_identical_lyrics_once(monkeypatch):
+    """
+    Tests that identical lyrics text is only split into words once, giving the
+    same words as splitting it without a memo.
+    """
+    song_lyrics = "Intro [Chorus] Seasons of love, seasons of LOVE! outro"
+    expected = lyrics.split_and_format_song_lyrics(song_lyrics)
+    calls = []
+
+    def split_lyrics(text):
+        calls.append(text)
+        return expected
+
+    monkeypatch.setattr(lyrics, "split_and_format_song_lyrics", split_lyrics)
+    with song_memo.SongMemo(":memory:") as memo:
+        assert memo.tokenize(song_lyrics) == expected
+        assert memo.tokenize(song_lyrics) == expected
+        assert memo.tokenize(None) == []
+
+    assert len(calls) == 1
+
+
+#
+# Tests for lyric_storage.py
+#
+# This includes ensuring compressed albums read back exactly as their CSV
+# lyrics, one album or one song at a time, with either codec.
+#
+
+STORAGE_ALBUMS = {
+    7: [["one", "two", "two"], [], ["three", "one", "one", "two"]],
+    8: [["two", "four"] * 100],
+}
+
+
+@pytest.fixture(name="storage_directory", params=["zlib", "zstd"])
+def fixture_storage_directory(request, tmp_path, monkeypatch):
+    """
+    Compress STORAGE_ALBUMS into an empty lyrics directory with each codec,
+    removing the CSV files.
+    """
+    if request.param == "zstd":
+        pytest.importorskip("zstandard")
+    monkeypatch.setattr(lyrics, "LYRICS_DIRECTORY", str(tmp_path))
+    for (album_id, album_lyrics) in STORAGE_ALBUMS.items():
+        lyrics_file = lyrics.get_lyrics_file(album_id)
+        with open(lyrics_file, "w", encoding="utf-8") as file:
+            csv.writer(file).writerows(album_lyrics)
+
+    sizes = lyric_storage.compress_corpus(codec=request.param, remove_csv=True)
+    assert sizes["compressed_bytes"] < sizes["csv_bytes"]
+    return tmp_path
+
+
+def test_compressed_albums_read_back(storage_directory):
+    """
+    Tests that compressed albums are read back exactly, including empty songs,
+    by both lyric_storage and genius_lyrics.
+    """
+    for (album_id, album_lyrics) in STORAGE_ALBUMS.items():
+        expected = [tuple(song) for song in album_lyrics]
+        assert not os.path.exists(lyrics.get_lyrics_file(album_id))
+        assert lyric_storage.read_album(album_id) == expected
+        assert list(lyrics.iter_album_songs(album_id)) == expected
+        assert lyrics.get_all_lyrics(album_id) == [
+            list(song) for song in album_lyrics
+        ]
+    assert os.path.exists(storage_directory / lyric_storage.DICTIONARY_FILE)
+
+
+def test_compressed_song_random_access(storage_directory):
+    """
+    Tests that single songs can be read, including a song with a word that is
+    not in the shared vocabulary.
+    """
+    dictionary = lyric_storage.load_dictionary()
+    lyric_storage.write_album(9, [["one"], ["new", "words", "one"]], dictionary)
+
+    assert lyric_storage.read_song(7, 2) == ("three", "one", "one", "two")
+    assert lyric_storage.read_song(7, 1) == ()
+    assert lyric_storage.read_song(9, 1) == ("new", "words", "one")
+    assert (storage_directory / "9.lyz").exists()
+    with pytest.raises(IndexError):
+        lyric_storage.read_song(7, 3)
+
+
+def test_compressing_again_keeps_albums(storage_directory):
+    """
+    Tests that compressing the corpus again after a new album is downloaded
+    keeps every earlier album readable.
+    """
+    new_album = [["one", "brand", "new"], ["song"]]
+    with open(lyrics.get_lyrics_file(9), "w", encoding="utf-8") as file:
+        csv.writer(file).writerows(new_album)
+
+    lyric_storage.compress_corpus(remove_csv=True)
+
+    for (album_id, album_lyrics) in {**STORAGE_ALBUMS, 9: new_album}.items():
+        assert lyric_storage.read_album(album_id) == [
+            tuple(song) for song in album_lyrics
+        ]
+    assert sorted(os.listdir(storage_directory)) == [
+        "7.lyz",
+        "8.lyz",
+        "9.lyz",
+        lyric_storage.DICTIONARY_FILE,
+    ]
+
+
+def test_compressing_stopped_partway_keeps_albums(
+    storage_directory, monkeypatch
+):
+    """
+    Tests that every album can still be read if compressing the corpus again
+    stops after only some albums are replaced, and that running it again
+    finishes the job.
+    """
+    with open(lyrics.get_lyrics_file(9), "w", encoding="utf-8") as file:
+        csv.writer(file).writerows([["one", "brand", "new"]])
+    original_write_album = lyric_storage.write_album
+
+    def write_one_album(album_id, *args):
+        if album_id != "7":
+            raise KeyboardInterrupt
+        return original_write_album(album_id, *args)
+
+    monkeypatch.setattr(lyric_storage, "write_album", write_one_album)
+    with pytest.raises(KeyboardInterrupt):
+        lyric_storage.compress_corpus()
+    monkeypatch.setattr(lyric_storage, "write_album", original_write_album)
+
+    # album 7 now uses the new dictionary and album 8 still uses the old one
+    checksum_files = [
+        name
+        for name in os.listdir(storage_directory)
+        if name.endswith(".dict") and name != lyric_storage.DICTIONARY_FILE
+    ]
+    assert len(checksum_files) == 2
+
+    for (album_id, album_lyrics) in STORAGE_ALBUMS.items():
+        assert lyric_storage.read_album(album_id) == [
+            tuple(song) for song in album_lyrics
+        ]
+    assert not any(
+        name.endswith(".tmp") for name in os.listdir(storage_directory)
+    )
+
+    lyric_storage.compress_corpus(remove_csv=True)
+
+    assert lyric_storage.read_album(9) == [("one", "brand", "new")]
+    assert sorted(os.listdir(storage_directory)) == [
+        "7.lyz",
+        "8.lyz",
+        "9.lyz",
+        lyric_storage.DICTIONARY_FILE,
+    ]
+
+
+def test_scoring_compressed_albums(storage_directory, tmp_path):
+    """
+    Tests that albums are scored the same from compressed lyrics as from CSV
+    lyrics.
+    """
+    genius_data_file = storage_directory / "genius_data.csv"
+    genius_data_file.write_text("ShowName,GeniusID\nShow 7,7\nShow 8,8\n")
+    scores_file = str(tmp_path / "scores.csv")
+
+    cd.find_all_uniqueness_scores(str(genius_data_file), scores_file, None)
+    musical_scores = pd.read_csv(scores_file)
+
+    assert musical_scores["UniquenessScore"].tolist() == [
+        lyrics.calculate_album_uniqueness(STORAGE_ALBUMS[7]),
+        lyrics.calculate_album_uniqueness(STORAGE_ALBUMS[8]),
+    ]
+    assert musical_scores["TotalLyricCount"].tolist() == [7, 200]
+
+
+#
+# Tests for near_duplicates.py
+#
+# This includes ensuring near-duplicate songs are found within and across
+# albums and can be left out of uniqueness scores.
+#
+
+SONG = [f"word{index}" for index in range(200)]
+REPRISE = SONG[:195] + ["reprise"] * 5
+# a reprise of the first quarter of SONG, as found on cast recordings
+PARTIAL_REPRISE = SONG[:50] + ["reprise", "ending"]
+OTHER_SONG = [f"other{index}" for index in range(200)]
+
+
+def test_near_duplicates_across_albums():
+    """
+    Tests that a reprise sharing almost every phrase with a song on another
+    album is found, while an unrelated song is not.
+    """
+    corpus = [(1, SONG), (1, OTHER_SONG), (2, []), (2, REPRISE)]
+
+    all_pairs = near_duplicates.find_near_duplicates(corpus)
+
+    assert [(first, second) for (first, second, _) in all_pairs] == [
+        ((1, 0), (2, 1))
+    ]
+    assert all_pairs[0][2] >= near_duplicates.SIMILARITY_THRESHOLD
+
+
+def test_partial_reprise_excluded():
+    """
+    Tests that a reprise of part of an earlier song on the album is left out,
+    even though it shares too few of the whole song's phrases to be found by
+    similarity, while an unrelated song is kept.
+    """
+    similarity = near_duplicates.estimate_similarity(
+        near_duplicates.minhash_signature(SONG),
+        near_duplicates.minhash_signature(PARTIAL_REPRISE),
+    )
+
+    unique_songs = list(
+        near_duplicates.iter_unique_songs([SONG, OTHER_SONG, PARTIAL_REPRISE])
+    )
+
+    assert similarity < near_duplicates.SIMILARITY_THRESHOLD
+    assert unique_songs == [SONG, OTHER_SONG]
+
+
+def test_uniqueness_excluding_duplicates():
+    """
+    Tests that leaving out near-duplicates scores an album as if the reprise
+    was never on it, and that nothing changes unless asked for.
+    """
+    album_lyrics = [SONG, OTHER_SONG[:20] * 2, PARTIAL_REPRISE]
+
+    excluding = lyrics.calculate_album_uniqueness(
+        album_lyrics, exclude_duplicates=True
+    )
+    without_reprise = lyrics.calculate_album_uniqueness(album_lyrics[:2])
+
+    assert excluding == without_reprise == 75
+    assert lyrics.calculate_album_uniqueness(album_lyrics) == 83
+
+
+#
+# Tests for plotting.py
+#
+# This includes ensuring every predefined plot is rendered headlessly to the
+# requested image formats.
+#
+
+
+def test_render_all_plots_headless(
+    tmp_path, test_score_dataframe_file, test_musical_scores_file
+):
+    """
+    Tests that every predefined plot is rendered to both a PNG and an SVG file
+    from the testing data, without a display.
+    """
+    image_paths = plotting.render_all_plots(
+        output_directory=str(tmp_path),
+        formats=("png", "svg"),
+        score_dataframe_file=test_score_dataframe_file,
+        musical_scores_file=test_musical_scores_file,
+        max_workers=2,
+    )
+
+    expected_paths = [
+        str(tmp_path / f"{name}.{image_format}")
+        for name in plotting.PLOTS
+        for image_format in ("png", "svg")
+    ]
+
+    assert image_paths == expected_paths
+    for image_path in expected_paths:
+        assert os.path.getsize(image_path) > 0
+
+
+#
+# Tests for instrumentation.py
+#
+# This includes ensuring stages, network calls and counters are recorded only
+# while instrumentation is switched on.
+#
+
+
+@pytest.fixture(name="profiling")
+def fixture_profiling():
+    """
+    Switch instrumentation on with no previous measurements for a test, and
+    switch it back off afterwards.
+    """
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.enable(False)
+    instrumentation.reset()
+
+
+def test_profiled_scoring_run(profiling, tmp_path):
+    """
+    Tests that a profiled scoring run records its stage time, the bytes of
+    lyrics read and the number of words scored, and that the report is written
+    as both JSON and text.
+    """
+    # pylint: disable=unused-argument
+    cd.find_all_uniqueness_scores(
+        "testing/uniqueness_test_data.csv",
+        str(tmp_path / "musical_scores.csv"),
+        cache_file=None,
+    )
+    report = instrumentation.write_report(str(tmp_path / "report.json"))
+
+    assert report["stages"]["find_all_uniqueness_scores"]["calls"] == 1
+    assert report["counters"]["tokens.processed"] == 14
+    assert report["counters"]["albums.scored"] == 3
+    assert report["counters"]["io.bytes_read"] > 0
+    assert os.path.exists(tmp_path / "report.txt")
+
+
+def test_network_latency_histogram(profiling):
+    """
+    Tests that each network call is added to the latency histogram bucket of
+    its endpoint.
+    """
+    # pylint: disable=unused-argument
+    for _ in range(3):
+        with instrumentation.network_call("search_albums"):
+            pass
+
+    histogram = instrumentation.get_report()["network"]["search_albums"][
+        "histogram"
+    ]
+
+    assert histogram["<=0.05s"] == 3
+    assert sum(histogram.values()) == 3
+
+
+def test_instrumentation_off_records_nothing():
+    """
+    Tests that nothing is recorded while instrumentation is switched off.
+    """
+    instrumentation.reset()
+    lyrics.calculate_album_uniqueness([["one", "two", "two", "two"]])
+    with instrumentation.network_call("lyrics"):
+        pass
+
+    assert instrumentation.get_report() == {
+        "stages": {},
+        "network": {},
+        "counters": {},
+    }
+
+
+def test_instrumentation_counts_from_many_threads(profiling):
+    """
+    Tests that no counts or calls are lost when many threads record them at
+    the same time.
+    """
+    # threads are switched as often as possible, so any update that is not
+    # made under the lock would be interrupted partway through
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    num_threads = 8
+    num_updates = 5000
+
+    def record():
+        for _ in range(num_updates):
+            instrumentation.count("words")
+            with instrumentation.network_call("lyrics"):
+                pass
+
+    try:
+        with ThreadPoolExecutor(num_threads) as executor:
+            for future in [
+                executor.submit(record) for _ in range(num_threads)
+            ]:
+                future.result()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    report = instrumentation.get_report()
+
+    assert report["counters"]["words"] == num_threads * num_updates
+    assert report["network"]["lyrics"]["calls"] == num_threads * num_updates
+
+
+#
+# Tests for sharding.py
+#
+# This includes ensuring albums are assigned to shards consistently and that
+# merging shards processed in separate processes matches a serial run.
+#
+
+
+def test_shard_assignment_stable():
+    """
+    Tests that an album's shard only depends on its Genius ID and the number of
+    shards, so every machine assigns albums to the same shards. The expected
+    shards are fixed, so a change to the assignment between runs or versions
+    is caught.
+    """
+    album_ids = [147328, 148251, 324436, 148384]
+
+    assert [sharding.shard_for(album_id, 2) for album_id in album_ids] == [
+        1,
+        0,
+        1,
+        0,
+    ]
+    assert [sharding.shard_for(album_id, 4) for album_id in album_ids] == [
+        3,
+        0,
+        3,
+        2,
+    ]
+    assert [sharding.shard_for(album_id, 7) for album_id in album_ids] == [
+        3,
+        3,
+        2,
+        3,
+    ]
+    assert sharding.shard_for("147328", 4) == 3
+
+
+@pytest.mark.parametrize("num_shards", [1, 2, 5])
+def test_merged_shards_match_serial_run(
+    num_shards, tmp_path, test_musical_scores_file
+):
+    """
+    Tests that scoring each shard in its own process, standing in for separate
+    machines, and merging the partial outputs gives exactly the same musical
+    scores file as scoring every album in a single run. With 5 shards, some
+    shards have no albums at all.
+    """
+    merged_file = str(tmp_path / "merged_scores.csv")
+
+    with ProcessPoolExecutor(max_workers=num_shards) as executor:
+        futures = [
+            executor.submit(
+                sharding.process_shard,
+                shard_index,
+                num_shards,
+                "testing/uniqueness_test_data.csv",
+                str(tmp_path / "shards"),
+            )
+            for shard_index in range(num_shards)
+        ]
+        partial_files = [future.result() for future in futures]
+    sharding.merge_shards(partial_files, merged_file)
+
+    with open(test_musical_scores_file, "r", encoding="utf-8") as file:
+        serial_data = file.read()
+    with open(merged_file, "r", encoding="utf-8") as file:
+        merged_data = file.read()
+
+    assert merged_data == serial_data
+
+
+def test_merging_incomplete_shards_fails(tmp_path):
+    """
+    Tests that merging refuses to write an output when a shard's partial
+    output is left out or its shard did not finish.
+    """
+    partial_files = [
+        sharding.process_shard(
+            shard_index,
+            3,
+            "testing/uniqueness_test_data.csv",
+            str(tmp_path / "shards"),
+        )
+        for shard_index in range(3)
+    ]
+    merged_file = str(tmp_path / "merged_scores.csv")
+
+    with pytest.raises(ValueError):
+        sharding.merge_shards(partial_files[1:], merged_file)
+    os.remove(sharding.get_manifest_file(partial_files[0]))
+    with pytest.raises(ValueError):
+        sharding.merge_shards(partial_files, merged_file)
+    assert not os.path.exists(merged_file)
+
+
+@pytest.mark.parametrize(
+    "arguments", [[], ["--shard", "0"], ["--shard", "2", "--num-shards", "2"]]
+)
+def test_shard_command_needs_shard(arguments):
+    """
+    Tests that running a shard from the command line without a valid shard
+    and number of shards stops with a usage error instead of a traceback.
+    """
+    result = subprocess.run(
+        [sys.executable, "sharding.py", *arguments],
+        capture_output=True,
+        check=False,
+        encoding="utf-8",
+    )
+
+    assert result.returncode == 2
+    assert "error: --shard" in result.stderr
+    assert "Traceback" not in result.stderr
+
+
+def test_merging_mismatched_shards_fails(tmp_path):
+    """
+    Tests that merging refuses shards scored from different input files with
+    the same number of rows, or with different metrics.
+    """
+    input_file = tmp_path / "musical_genius_data.csv"
+    other_input_file = tmp_path / "other_musical_genius_data.csv"
+    musical_data = pd.read_csv("testing/uniqueness_test_data.csv")
+    musical_data.to_csv(input_file, index=False)
+    musical_data.iloc[::-1].to_csv(other_input_file, index=False)
+    merged_file = str(tmp_path / "merged_scores.csv")
+
+    first_shard = sharding.process_shard(
+        0, 2, str(input_file), str(tmp_path / "first")
+    )
+    other_input_shard = sharding.process_shard(
+        1, 2, str(other_input_file), str(tmp_path / "first")
+    )
+    with pytest.raises(ValueError, match="input files"):
+        sharding.merge_shards([first_shard, other_input_shard], merged_file)
+
+    manifest_file = sharding.get_manifest_file(other_input_shard)
+    with open(manifest_file, "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    manifest["input_hash"] = sharding.fingerprint_input(str(input_file))
+    manifest["score_signature"] = manifest["score_signature"][1:]
+    with open(manifest_file, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+    with pytest.raises(ValueError, match="metrics"):
+        sharding.merge_shards([first_shard, other_input_shard], merged_file)
+    assert not os.path.exists(merged_file)
+
+
+#
+# Tests for weekly_analysis.py
+#
+# This includes ensuring each show's weekly series is sorted and that its run
+# curve features are correct and joined to its scores.
+#
+
+WEEKLY_TEST_DATA = [
+    "Date.Full,Show.Name,Show.Type,"
+    "Statistics.Attendance,Statistics.Performances",
+    "1/15/2000,Show B,Musical,500,8",
+    "1/1/2000,Show A,Musical,1000,8",
+    "1/8/2000,Show B,Musical,800,8",
+    "1/15/2000,Show A,Musical,800,8",
+    "1/8/2000,Show A,Musical,2000,8",
+    "1/22/2000,Show A,Musical,1000,8",
+    "1/29/2000,Show A,Musical,500,4",
+]
+
+
+@pytest.fixture(name="weekly_data_file")
+def fixture_weekly_data_file(tmp_path):
+    """
+    Write a small processed Broadway data file with its rows out of order.
+    """
+    weekly_data_file = tmp_path / "processed.csv"
+    weekly_data_file.write_text("\n".join(WEEKLY_TEST_DATA) + "\n")
+    return str(weekly_data_file)
+
+
+def test_weekly_series_sorted(weekly_data_file):
+    """
+    Tests that each show's weeks are grouped together in date order and
+    numbered from the start of its run.
+    """
+    weekly_series = weekly_analysis.build_weekly_series(weekly_data_file)
+
+    assert weekly_series["ShowName"].tolist() == ["Show A"] * 5 + [
+        "Show B"
+    ] * 2
+    assert weekly_series["WeekNumber"].tolist() == [1, 2, 3, 4, 5, 1, 2]
+    assert weekly_series["Attendance"].tolist() == [
+        1000,
+        2000,
+        800,
+        1000,
+        500,
+        800,
+        500,
+    ]
+
+
+def test_run_curve_features(weekly_data_file):
+    """
+    Tests the peak week, decay rate and weeks to half-peak of each show,
+    including a show that never falls to half of its peak.
+    """
+    run_curves = weekly_analysis.calculate_run_curves(
+        weekly_analysis.build_weekly_series(weekly_data_file)
+    )
+    show_a = run_curves.iloc[0]
+    show_b = run_curves.iloc[1]
+
+    # the least squares slope of log attendance over weeks 2 to 5 of Show A
+    expected_decay = -np.polyfit(
+        [2, 3, 4, 5], np.log([2000, 800, 1000, 500]), 1
+    )[0]
+
+    assert run_curves["ShowName"].tolist() == ["Show A", "Show B"]
+    assert (show_a["PeakWeek"], show_a["PeakAttendance"]) == (2, 2000)
+    assert show_a["DecayRate"] == pytest.approx(expected_decay, abs=1e-6)
+    assert show_a["WeeksToHalfPeak"] == 1
+    assert show_b["PeakWeek"] == 1
+    assert pd.isna(show_b["WeeksToHalfPeak"])
+
+
+def test_run_curves_joined_to_scores(weekly_data_file, tmp_path):
+    """
+    Tests that the run curve features are added to each show's scores, and
+    that a show with no weekly data is kept with empty features.
+    """
+    musical_scores_file = tmp_path / "scores.csv"
+    musical_scores_file.write_text(
+        "ShowName,UniquenessScore\nShow B,50\nShow A,70\nShow C,60\n"
+    )
+    run_curves_file = str(tmp_path / "run_curves.csv")
+
+    joined_data = weekly_analysis.analyze_weekly_attendance(
+        weekly_data_file, str(musical_scores_file), run_curves_file
+    )
+
+    assert joined_data["ShowName"].tolist() == ["Show B", "Show A", "Show C"]
+    assert joined_data["PeakWeek"].tolist()[:2] == [1, 2]
+    assert pd.isna(joined_data["PeakWeek"].iloc[2])
+    assert os.path.exists(run_curves_file)
+
+
+def test_week_numbers_skip_dark_weeks(tmp_path):
+    """
+    Tests that weeks a show was not performed still count towards the week
+    numbers of the weeks after them.
+    """
+    weekly_data_file = tmp_path / "processed.csv"
+    weekly_data_file.write_text(
+        "\n".join(
+            [
+                WEEKLY_TEST_DATA[0],
+                "1/1/2000,Show A,Musical,1000,8",
+                "1/8/2000,Show A,Musical,2000,8",
+                "1/29/2000,Show A,Musical,500,8",
+            ]
+        )
+        + "\n"
+    )
+
+    weekly_series = weekly_analysis.build_weekly_series(str(weekly_data_file))
+
+    assert weekly_series["WeekNumber"].tolist() == [1, 2, 5]
+
+
+#
+# Tests for async_pipeline.py
+#
+# This includes ensuring the streaming pipeline scores the same as the phased
+# pipeline, overlaps its network calls and downloads each album only once.
+#
+
+# Each fake album's songs, keyed by its Genius ID.
+ASYNC_ALBUMS = {
+    101: [["a", "b", "a"], ["c", "d"]],
+    102: [["e", "e", "e", "f"]],
+    103: [["g", "h", "i", "g"], ["j"], ["k", "k"]],
+}
+
+
+class FakeLyricsSource:
+    """
+    Stand in for the Genius API, taking FAKE_LATENCY seconds for every call
+    and recording how many calls are made at the same time. Matching a show
+    named in match_delays takes that many extra seconds.
+    """
+
+    FAKE_LATENCY = 0.05
+
+    def __init__(self, match_delays=None):
+        self.match_delays = match_delays or {}
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.track_requests = []
+
+    def _call(self, result):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.FAKE_LATENCY)
+        with self.lock:
+            self.in_flight -= 1
+        return result
+
+    def find_album(self, show_name):
+        """
+        Match "Show N" to album 100 + N, with shows 2 and 4 sharing an album
+        and show 5 having no album.
+        """
+        number = int(show_name.split()[-1])
+        album_id = {4: 102, 5: "-1"}.get(number, 100 + number)
+        time.sleep(self.match_delays.get(show_name, 0))
+        return self._call((album_id, f"Album {album_id}"))
+
+    def get_album_tracks(self, album_id):
+        """
+        List one track for each fake song, plus an instrumental track.
+        """
+        with self.lock:
+            self.track_requests.append(album_id)
+        all_tracks = [
+            {
+                "song": {
+                    "id": (album_id, position),
+                    "instrumental": False,
+                    "lyrics_state": "complete",
+                }
+            }
+            for position in range(len(ASYNC_ALBUMS[album_id]))
+        ]
+        all_tracks.append(
+            {
+                "song": {
+                    "id": None,
+                    "instrumental": True,
+                    "lyrics_state": "complete",
+                }
+            }
+        )
+        return self._call(all_tracks)
+
+    def download_song_lyrics(self, song_id):
+        """
+        Return the words of a fake song.
+        """
+        (album_id, position) = song_id
+        return self._call(list(ASYNC_ALBUMS[album_id][position]))
+
+
+def test_async_pipeline_matches_phased_scores(tmp_path, monkeypatch):
+    """
+    Tests that every matched show is scored the same as by
+    find_all_uniqueness_scores and written in the same order even when the
+    first show finishes last, that an album shared by two shows is only
+    downloaded once, and that network calls overlap.
+    """
+    monkeypatch.setattr(lyrics, "LYRICS_DIRECTORY", str(tmp_path / "lyrics"))
+    summed_file = tmp_path / "summed.csv"
+    summed_file.write_text(
+        "ShowName,Attendance,NumPerformances,WeeksPerformed\n"
+        + "".join(
+            f"Show {number},{number}0,{number},1\n" for number in range(1, 6)
+        )
+    )
+    scores_file = str(tmp_path / "scores.csv")
+    source = FakeLyricsSource(match_delays={"Show 1": 0.3})
+
+    num_written = async_pipeline.run_async_pipeline(
+        str(summed_file),
+        scores_file,
+        source.find_album,
+        source.get_album_tracks,
+        source.download_song_lyrics,
+    )
+
+    streamed_scores = pd.read_csv(scores_file)
+    genius_data_file = str(tmp_path / "genius_data.csv")
+    streamed_scores.iloc[:, :6].to_csv(genius_data_file, index=False)
+    phased_file = str(tmp_path / "phased.csv")
+    cd.find_all_uniqueness_scores(genius_data_file, phased_file, None)
+
+    assert num_written == 4
+    assert streamed_scores["GeniusID"].tolist() == [101, 102, 103, 102]
+    assert streamed_scores.equals(pd.read_csv(phased_file))
+    assert sorted(source.track_requests) == [101, 102, 103]
+    assert source.max_in_flight > 1
+    assert sorted(os.listdir(lyrics.LYRICS_DIRECTORY)) == [
+        "101.csv",
+        "102.csv",
+        "103.csv",
+    ]
+
+
+def test_async_pipeline_writes_header_without_matches(tmp_path, monkeypatch):
+    """
+    Tests that the scores file still has every column when no show has a
+    matching album.
+    """
+    monkeypatch.setattr(lyrics, "LYRICS_DIRECTORY", str(tmp_path / "lyrics"))
+    summed_file = tmp_path / "summed.csv"
+    summed_file.write_text(
+        "ShowName,Attendance,NumPerformances,WeeksPerformed\nShow 5,50,5,1\n"
+    )
+    scores_file = tmp_path / "scores.csv"
+    source = FakeLyricsSource()
+
+    num_written = async_pipeline.run_async_pipeline(
+        str(summed_file),
+        str(scores_file),
+        source.find_album,
+        source.get_album_tracks,
+        source.download_song_lyrics,
+    )
+    streamed_scores = pd.read_csv(scores_file)
+
+    assert num_written == 0
+    assert streamed_scores.empty
+    assert streamed_scores.columns.tolist() == [
+        "ShowName",
+        "Attendance",
+        "NumPerformances",
+        "WeeksPerformed",
+        "GeniusID",
+        "AlbumTitle",
+        *lyric_metrics.METRICS,
+    ]
+
+
+def test_async_pipeline_reuses_saved_lyrics(tmp_path, monkeypatch):
+    """
+    Tests that albums whose lyrics are already saved are scored from the saved
+    file without listing their tracks again.
+    """
+    monkeypatch.setattr(lyrics, "LYRICS_DIRECTORY", str(tmp_path))
+    with open(lyrics.get_lyrics_file(101), "w", encoding="utf-8") as file:
+        csv.writer(file).writerows([["saved", "saved", "words"]])
+    summed_file = tmp_path / "summed.csv"
+    summed_file.write_text(
+        "ShowName,Attendance,NumPerformances,WeeksPerformed\nShow 1,10,1,1\n"
+    )
+    source = FakeLyricsSource()
+
+    async_pipeline.run_async_pipeline(
+        str(summed_file),
+        str(tmp_path / "scores.csv"),
+        source.find_album,
+        source.get_album_tracks,
+        source.download_song_lyrics,
+    )
+    streamed_scores = pd.read_csv(tmp_path / "scores.csv")
+
+    assert source.track_requests == []
+    assert streamed_scores["TotalLyricCount"].tolist() == [3]
+    assert streamed_scores["UniquenessScore"].tolist() == [66]
+
+
+#
+# Tests for lyric_statistics.py
+#
+# This includes ensuring the vectorized correlations, confidence intervals and
+# permutation tests are correct and reproducible.
+#
+
+
+def test_row_correlations_match_pandas():
+    """
+    Tests that the correlation of each row matches pandas, and that a row with
+    no variation has a correlation of NaN.
+    """
+    x_values = np.array([[1.0, 2.0, 3.0, 4.0], [1.0, 1.0, 1.0, 1.0]])
+    y_values = np.array([[2.0, 1.0, 4.0, 3.0], [1.0, 2.0, 3.0, 4.0]])
+
+    correlations = lyric_statistics.row_correlations(x_values, y_values)
+
+    expected = pd.Series(x_values[0]).corr(pd.Series(y_values[0]))
+    assert correlations[0] == pytest.approx(expected)
+    assert np.isnan(correlations[1])
+
+
+def test_perfect_relationship_significant():
+    """
+    Tests that a perfectly linear relationship has a confidence interval of
+    exactly 1 and the smallest possible p-value.
+    """
+    x_values = np.arange(20, dtype=float)
+    random_generator = np.random.default_rng(0)
+
+    (low, high) = lyric_statistics.bootstrap_correlation(
+        x_values, 2 * x_values + 1, random_generator, num_resamples=500
+    )
+    p_value = lyric_statistics.permutation_test(
+        x_values, 2 * x_values + 1, random_generator, num_resamples=500
+    )
+
+    assert low == pytest.approx(1.0)
+    assert high == pytest.approx(1.0)
+    assert p_value == 1 / 501
+
+
+def test_constant_column_not_significant():
+    """
+    Tests that a sample with no variation has no confidence interval or
+    p-value, rather than appearing significant.
+    """
+    x_values = np.arange(20, dtype=float)
+    random_generator = np.random.default_rng(0)
+
+    (low, high) = lyric_statistics.bootstrap_correlation(
+        x_values, np.full(20, 5.0), random_generator, num_resamples=100
+    )
+    p_value = lyric_statistics.permutation_test(
+        x_values, np.full(20, 5.0), random_generator, num_resamples=999
+    )
+
+    assert np.isnan(low) and np.isnan(high)
+    assert np.isnan(p_value)
+
+
+def test_analyze_relationships_tidy_and_seeded():
+    """
+    Tests that every pair of measures gets one row, and that the same seed
+    always gives the same results.
+    """
+    results = lyric_statistics.analyze_relationships(
+        "testing/test_musical_scores.csv", num_resamples=200, seed=3
+    )
+    repeated = lyric_statistics.analyze_relationships(
+        "testing/test_musical_scores.csv", num_resamples=200, seed=3
+    )
+
+    assert list(results.columns) == [
+        "LyricMetric",
+        "PerformanceMetric",
+        "NumShows",
+        "Correlation",
+        "CILow",
+        "CIHigh",
+        "PValue",
+    ]
+    assert len(results) == len(lyric_statistics.LYRIC_COLUMNS) * len(
+        lyric_statistics.PERFORMANCE_COLUMNS
+    )
+    assert results.equals(repeated)
+    assert ((results["PValue"] > 0) & (results["PValue"] <= 1)).all()
+
+
+#
+# Tests for query_service.py
+#
+# This includes ensuring the service answers lookups and ranked queries as
+# JSON, including from several readers at once.
+#
+
+
+@pytest.fixture(name="query_url")
+def fixture_query_url():
+    """
+    Start the query service over the testing data on a free port, and stop it
+    once the test is done.
+    """
+    server = query_service.create_server(
+        port=0,
+        index=query_service.load_index(
+            "testing/test_musical_scores.csv",
+            "testing/test_score_dataframe.csv",
+        ),
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def get_json(url):
+    """
+    Request a URL and return its HTTP status and decoded JSON answer.
+    """
+    try:
+        with urllib.request.urlopen(url) as response:
+            return (response.status, json.load(response))
+    except urllib.error.HTTPError as error:
+        return (error.code, json.load(error))
+
+
+def test_query_lookups(query_url):
+    """
+    Tests that shows can be looked up by name (ignoring case) and Genius ID,
+    and that unknown shows are reported as not found.
+    """
+    (status, answer) = get_json(f"{query_url}/shows/fwop's%20COOL%20show%202")
+    assert status == 200
+    assert answer["shows"][0]["UniquenessScore"] == 87
+    assert answer["shows"][0]["Attendance"] == 2000
+
+    (status, answer) = get_json(f"{query_url}/albums/1/songs")
+    assert status == 200
+    assert len(answer["songs"]) == 5
+
+    assert get_json(f"{query_url}/shows/Missing")[0] == 404
+    assert get_json(f"{query_url}/albums/abc")[0] == 400
+
+
+def test_query_top_shows_concurrent(query_url):
+    """
+    Tests that many readers at once all get the same ranked shows, and that
+    shows can not be ranked by a column that is not numerical.
+    """
+    url = f"{query_url}/top?metric=TotalLyricCount&n=2&order=asc"
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        all_answers = list(executor.map(get_json, [url] * 16))
+
+    for (status, answer) in all_answers:
+        assert status == 200
+        assert [show["TotalLyricCount"] for show in answer["shows"]] == [3, 5]
+
+    assert get_json(f"{query_url}/top?metric=ShowName")[0] == 400
+
+
+#
+# Tests for synthetic_data.py
+#
+# This includes ensuring the synthetic corpus is deterministic and can be read
+# by every stage of the pipeline.
+#
+
+
+def read_directory(directory):
+    """
+    Read every file in a directory tree, keyed by its path within the tree.
+    """
+    all_files = {}
+    for (root, _, filenames) in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            with open(path, "rb") as file:
+                all_files[os.path.relpath(path, directory)] = file.read()
+    return all_files
+
+
+def test_synthetic_corpus_deterministic(tmp_path):
+    """
+    Tests that the same seed always generates the same files, that a larger
+    corpus starts with the same albums as a smaller one, and that a different
+    seed generates a different corpus.
+    """
+    synthetic_data.generate_corpus(3, str(tmp_path / "first"), seed=4)
+    synthetic_data.generate_corpus(3, str(tmp_path / "second"), seed=4)
+    synthetic_data.generate_corpus(4, str(tmp_path / "larger"), seed=4)
+    synthetic_data.generate_corpus(3, str(tmp_path / "other"), seed=5)
+
+    first_files = read_directory(tmp_path / "first")
+    larger_files = read_directory(tmp_path / "larger")
+    album_file = os.path.join("lyrics", "900000002.csv")
+
+    assert len(first_files) == 5
+    assert first_files == read_directory(tmp_path / "second")
+    assert first_files[album_file] == larger_files[album_file]
+    assert first_files[album_file] != read_directory(tmp_path / "other")[
+        album_file
+    ]
+
+
+def test_synthetic_corpus_runs_through_pipeline(tmp_path, monkeypatch):
+    """
+    Tests that the synthetic weekly data sums to the synthetic musical data,
+    and that the synthetic lyrics can be scored.
+    """
+    corpus_files = synthetic_data.generate_corpus(5, str(tmp_path))
+    monkeypatch.setattr(
+        lyrics, "LYRICS_DIRECTORY", corpus_files["lyrics_directory"]
+    )
+    summed_file = str(tmp_path / "summed.csv")
+    scores_file = str(tmp_path / "scores.csv")
+
+    broadway.sum_data(corpus_files["processed_file"], summed_file)
+    cd.find_all_uniqueness_scores(
+        corpus_files["musical_genius_data"],
+        scores_file,
+        cache_file=str(tmp_path / "cache.json"),
+    )
+
+    summed_data = pd.read_csv(summed_file).sort_values("ShowName")
+    musical_scores = pd.read_csv(scores_file).sort_values("ShowName")
+    columns = ["ShowName", "Attendance", "NumPerformances", "WeeksPerformed"]
+
+    assert (
+        summed_data[columns].values.tolist()
+        == musical_scores[columns].values.tolist()
+    )
+    assert (musical_scores["TotalLyricCount"] > 0).all()
+    assert musical_scores["UniquenessScore"].between(1, 100).all()
+
+
+#
+# Tests for the offline guard in conftest.py
+#
+# This includes ensuring tests that are not marked as needing the network fail
+# straight away if they try to reach it, while local connections still work.
+#
+
+
+def test_network_access_fails_fast(tmp_path):
+    """
+    Tests that downloading the Broadway data or opening a socket to another
+    machine fails immediately, rather than waiting for a timeout.
+    """
+    start_time = time.perf_counter()
+    with pytest.raises(RuntimeError, match="pytest.mark.network"):
+        broadway.get_broadway_data(filepath=str(tmp_path / "broadway.csv"))
+    with pytest.raises(RuntimeError, match="pytest.mark.network"):
+        socket.create_connection(("api.genius.com", 443), timeout=30)
+
+    assert time.perf_counter() - start_time < 1
+    assert not os.path.exists(tmp_path / "broadway.csv")
+
+
+#
+# Tests for import time
+#
+# This includes ensuring the project's modules import quickly, without loading
+# heavy dependencies or needing a Genius access token.
+#
+
+# The maximum time, in seconds, that importing all of the project's modules may
+# take.
+IMPORT_TIME_BUDGET = 0.25
+
+# Code run in a fresh interpreter to time the imports. api_keys is blocked to
+# make sure lyrics can still be scored offline without it.
+IMPORT_CHECK_CODE = """
+import sys
+import time
+
+sys.modules["api_keys"] = None
+start = time.perf_counter()
+import broadway_data, compile_data, genius_lyrics
+elapsed = time.perf_counter() - start
+
+heavy_modules = ["pandas", "matplotlib", "lyricsgenius", "requests"]
+loaded = [name for name in heavy_modules if name in sys.modules]
+album_lyrics = genius_lyrics.get_all_lyrics(1)
+total = compile_data.lyric_metrics.calculate_album_metrics(album_lyrics)
+print(elapsed, ",".join(loaded), total["TotalLyricCount"])
+"""
+
+
+def test_import_time_budget():
+    """
+    Tests that importing the project's modules stays within the import time
+    budget, does not load pandas, Matplotlib, lyricsgenius or requests, and
+    that saved lyrics can be scored without an api_keys.py file.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_CHECK_CODE],
+        capture_output=True,
+        check=True,
+        encoding="utf-8",
+    )
+    (elapsed, loaded, total) = result.stdout.split(" ")
+
+    assert float(elapsed) < IMPORT_TIME_BUDGET
+    assert loaded == ""
+    assert int(total) == 5
@@ -0,0 +1,210 @@
+"""
+Functions to analyze how each musical's attendance changed over its run, and
+to join the results to the lyric scores in musical_scores.csv.
+
+broadway_data.sum_data collapses each show's weekly rows into totals. Here the
+weekly rows are kept instead: they are sorted by show and date so that each
+show's weeks sit next to each other, and features of every show's run curve
+(its peak week, how quickly attendance decayed after the peak and how long it
+took to fall to half the peak) are calculated for all shows at once with numpy
+rather than one show at a time.
+"""
+
+import broadway_data as broadway
+import instrumentation
+
+
+MUSICAL_SCORES_FILE = "musical_scores.csv"
+RUN_CURVES_FILE = "run_curves.csv"
+
+
+def build_weekly_series(processed_filepath=broadway.PROCESSED_FILE_PATH):
+    """
+    Load the weekly attendance and performances of every show, sorted by show
+    and then by date.
+
+    Args:
+        processed_filepath: optional string representing the path to the
+            processed Broadway data. Defaults to processed_broadway_data.csv.
+    Returns:
+        A pandas dataframe with the columns ShowName, Date, WeekNumber,
+            Attendance and Performances, with one row for each week a show was
+            performed. WeekNumber counts the weeks since the start of each
+            show's run from 1, so weeks a show was dark are skipped rather
+            than renumbering the weeks after them.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+
+    processed_dataframe = broadway.load_processed_data(
+        processed_filepath,
+        columns=[
+            "Show.Name",
+            "Date.Full",
+            "Statistics.Attendance",
+            "Statistics.Performances",
+        ],
+    )
+
+    # the category codes of the show names are sorted on rather than the
+    # names themselves, which is much faster
+    order = np.lexsort(
+        (
+            processed_dataframe["Date.Full"].to_numpy(),
+            processed_dataframe["Show.Name"].cat.codes.to_numpy(),
+        )
+    )
+    weekly_series = processed_dataframe.iloc[order].reset_index(drop=True)
+    weekly_series.columns = ["ShowName", "Date", "Attendance", "Performances"]
+
+    first_dates = weekly_series.groupby("ShowName", observed=True)[
+        "Date"
+    ].transform("min")
+    week_numbers = (weekly_series["Date"] - first_dates).dt.days // 7 + 1
+    weekly_series.insert(2, "WeekNumber", week_numbers.to_numpy())
+
+    return weekly_series
+
+
+def calculate_run_curves(weekly_series):
+    """
+    Calculate the run curve features of every show in a single pass.
+
+    Because the weekly series is sorted by show, each show's weeks are one
+    contiguous slice of each column, and numpy's reduceat finds a value for
+    every slice at once.
+
+    The decay rate is found by least squares: a straight line is fitted to the
+    logarithm of the attendance of every week from the peak onwards, and the
+    decay rate is the negative of its slope. A decay rate of 0.01 means that
+    attendance fell by about 1% each week after the peak.
+
+    Args:
+        weekly_series: pandas dataframe as returned by build_weekly_series.
+    Returns:
+        A pandas dataframe with one row per show and the columns ShowName,
+            PeakWeek, PeakAttendance, DecayRate and WeeksToHalfPeak. DecayRate
+            is empty for a show with fewer than two weeks from its peak
+            onwards, and WeeksToHalfPeak is empty for a show whose attendance
+            never fell to half of its peak.
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+    import pandas as pd
+
+    show_codes = weekly_series["ShowName"].cat.codes.to_numpy()
+    weeks = weekly_series["WeekNumber"].to_numpy(dtype=float)
+    attendance = weekly_series["Attendance"].to_numpy(dtype=float)
+
+    if len(show_codes) == 0:
+        return pd.DataFrame(
+            columns=[
+                "ShowName",
+                "PeakWeek",
+                "PeakAttendance",
+                "DecayRate",
+                "WeeksToHalfPeak",
+            ]
+        )
+
+    # the first row of each show, and the index of each row's show
+    starts = np.flatnonzero(np.diff(show_codes, prepend=-1))
+    show_of_row = np.cumsum(np.diff(show_codes, prepend=-1) != 0) - 1
+    no_week = np.inf
+
+    peak_attendance = np.maximum.reduceat(attendance, starts)
+    at_peak = attendance == peak_attendance[show_of_row]
+    peak_week = np.minimum.reduceat(np.where(at_peak, weeks, no_week), starts)
+
+    # least squares fit of log attendance against the week number, from the
+    # peak onwards, using the sums of each show's slice
+    after_peak = (weeks >= peak_week[show_of_row]) & (attendance > 0)
+    x_values = np.where(after_peak, weeks, 0.0)
+    y_values = np.where(
+        after_peak, np.log(np.where(after_peak, attendance, 1.0)), 0.0
+    )
+    count = np.add.reduceat(after_peak.astype(float), starts)
+    sum_x = np.add.reduceat(x_values, starts)
+    sum_y = np.add.reduceat(y_values, starts)
+    sum_xy = np.add.reduceat(x_values * y_values, starts)
+    sum_xx = np.add.reduceat(x_values * x_values, starts)
+    denominator = count * sum_xx - sum_x**2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (count * sum_xy - sum_x * sum_y) / denominator
+    decay_rate = np.where(denominator > 0, -slope, np.nan)
+
+    # the first week after the peak with at most half of the peak attendance
+    below_half = (weeks > peak_week[show_of_row]) & (
+        attendance <= peak_attendance[show_of_row] / 2
+    )
+    half_week = np.minimum.reduceat(
+        np.where(below_half, weeks, no_week), starts
+    )
+    weeks_to_half = np.where(
+        np.isfinite(half_week), half_week - peak_week, np.nan
+    )
+
+    return pd.DataFrame(
+        {
+            "ShowName": weekly_series["ShowName"].to_numpy()[starts].tolist(),
+            "PeakWeek": peak_week.astype(int),
+            "PeakAttendance": peak_attendance.astype(int),
+            "DecayRate": np.round(decay_rate, 6),
+            "WeeksToHalfPeak": pd.array(weeks_to_half, dtype="Int64"),
+        }
+    )
+
+
+@instrumentation.timed_stage
+def join_run_curves(
+    musical_scores, processed_filepath=broadway.PROCESSED_FILE_PATH
+):
+    """
+    Calculate the run curve features of every show and join them to each
+    show's lyric scores.
+
+    Args:
+        musical_scores: pandas dataframe of musical scores, as returned by
+            compile_data.score_albums.
+        processed_filepath: optional string representing the path to the
+            processed Broadway data. Defaults to processed_broadway_data.csv.
+    Returns:
+        A new pandas dataframe of the musical scores with the run curve
+            features of each show added as columns.
+    """
+    run_curves = calculate_run_curves(build_weekly_series(processed_filepath))
+    return musical_scores.merge(run_curves, on="ShowName", how="left")
+
+
+@instrumentation.timed_stage
+def analyze_weekly_attendance(
+    processed_filepath=broadway.PROCESSED_FILE_PATH,
+    musical_scores_file=MUSICAL_SCORES_FILE,
+    run_curves_file=RUN_CURVES_FILE,
+):
+    """
+    Calculate the run curve features of every show and join them to each
+    show's lyric scores in musical_scores.csv, as join_run_curves does.
+
+    Args:
+        processed_filepath: optional string representing the path to the
+            processed Broadway data. Defaults to processed_broadway_data.csv.
+        musical_scores_file: optional string specifying the file path of the
+            musical scores, as written by
+            compile_data.find_all_uniqueness_scores.
+        run_curves_file: optional string specifying output file path.
+    Returns:
+        A pandas dataframe of musical_scores.csv with the run curve features
+            of each show added as columns. The same data is written to
+            run_curves_file.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    with open(musical_scores_file, "r", encoding="utf-8") as file:
+        musical_scores = pd.read_csv(file)
+
+    joined_data = join_run_curves(musical_scores, processed_filepath)
+    joined_data.to_csv(run_curves_file, encoding="utf-8", index=False)
+
+    return joined_data